@@ -0,0 +1,125 @@
+"""
+Admission control for the face recognition path.
+
+At most `max_concurrency` recognitions run at once per worker; the rest wait
+in line. A new request is admitted only if its estimated completion time
+(queue wait + one service time, from an EWMA of recent recognitions) fits in
+the latency SLO. Only requests that mark their slot completed (a face was
+embedded and matched) feed the EWMA: early returns such as frames without a
+face take a fraction of a recognition and would pull the estimate down. Otherwise it is rejected at once with a Retry-After hint,
+so kiosks back off instead of piling up requests that would all time out.
+A request that was admitted but is still waiting when its budget runs out is
+shed as well.
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RECOGNITION_SLO_SECONDS = 3.0
+RECOGNITION_MAX_CONCURRENCY = 2
+SERVICE_TIME_PRIOR_SECONDS = 0.5  # Until the first recognition is measured
+EWMA_ALPHA = 0.2
+WAIT_SAMPLES = 500
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after, estimated_wait):
+        super().__init__(f"Estimated wait {estimated_wait:.2f}s exceeds the recognition SLO")
+        self.retry_after = retry_after  # Whole seconds, for the Retry-After header
+        self.estimated_wait = estimated_wait
+
+
+class RecognitionSlot:
+    """Handed to the admitted request; set completed once a full recognition ran"""
+
+    def __init__(self):
+        self.completed = False
+
+
+class RecognitionAdmission:
+    """Bounded concurrency with SLO-based shedding and queue statistics"""
+
+    def __init__(self, slo_seconds=RECOGNITION_SLO_SECONDS, max_concurrency=RECOGNITION_MAX_CONCURRENCY):
+        self.slo_seconds = slo_seconds
+        self.max_concurrency = max_concurrency
+        self.service_seconds = SERVICE_TIME_PRIOR_SECONDS
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.completed = 0
+        self.shed_on_arrival = 0
+        self.shed_in_queue = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+    def estimated_wait(self):
+        """Seconds a request arriving now would wait for a free slot"""
+        with self._lock:
+            return self._estimated_wait()
+
+    def _estimated_wait(self):
+        if self.in_flight + self.waiting < self.max_concurrency:
+            return 0.0
+        # Requests ahead drain max_concurrency at a time, one service time per round
+        rounds = math.ceil((self.waiting + 1) / self.max_concurrency)
+        return rounds * self.service_seconds
+
+    def _retry_after(self, wait):
+        return max(1, math.ceil(wait))
+
+    @contextmanager
+    def admit(self):
+        """Run the body inside a recognition slot (yielded), or raise AdmissionRejected"""
+        with self._lock:
+            wait = self._estimated_wait()
+            if wait + self.service_seconds > self.slo_seconds:
+                self.shed_on_arrival += 1
+                raise AdmissionRejected(self._retry_after(wait), wait)
+            self.waiting += 1
+            budget = self.slo_seconds - self.service_seconds
+
+        arrived = time.perf_counter()
+        acquired = self._slots.acquire(timeout=max(budget, 0.0))
+        queued = time.perf_counter() - arrived
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.shed_in_queue += 1
+                raise AdmissionRejected(self._retry_after(self._estimated_wait()), queued)
+            self.in_flight += 1
+            self.admitted += 1
+            self.waits.append(queued)
+
+        slot = RecognitionSlot()
+        started = time.perf_counter()
+        try:
+            yield slot
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.in_flight -= 1
+                if slot.completed:
+                    self.completed += 1
+                    self.service_seconds += EWMA_ALPHA * (elapsed - self.service_seconds)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self.waits)
+            return {
+                "slo_ms": round(self.slo_seconds * 1000),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "service_ms_ewma": round(self.service_seconds * 1000, 1),
+                "estimated_wait_ms": round(self._estimated_wait() * 1000, 1),
+                "admitted": self.admitted,
+                "completed": self.completed,
+                "shed_on_arrival": self.shed_on_arrival,
+                "shed_in_queue": self.shed_in_queue,
+                "queue_wait_ms_mean": round(sum(waits) * 1000 / len(waits), 1) if waits else None,
+                "queue_wait_ms_p95": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else None
+            }
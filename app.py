@@ -1,25 +1,46 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, get_jwt
-from pymongo import MongoClient
+from pymongo import MongoClient, InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from bson import ObjectId
+import atexit
 import datetime
+import functools
+import json
+import re
 import os
 import numpy as np
 import base64
 import cv2
 from deepface import DeepFace
 import pandas as pd
-from openpyxl import Workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from io import BytesIO
+from PIL import Image
 import hashlib
 import random
 import secrets
+import shutil
 import string
+import tempfile
+import threading
+from collections import OrderedDict
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from face_gallery import FaceGallery, calibrate_threshold, claimed_distance, select_diverse_templates
+from offline_attendance import run_photo_attendance, embed_face_chips, FACENET_INPUT_SIZE
+from embedding_cache import EmbeddingCache
+from face_preprocessing import preprocess_image
+from gallery_shards import ShardedGallery, parse_topology
+from gallery_cache import GalleryCache
+from admission import RecognitionAdmission, AdmissionRejected
+from attendance_buffer import AttendanceWriteBuffer
+from leave_index import ApprovedLeaveIndex
+from db_indexes import ensure_indexes
+from importlib import metadata
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5173", "http://localhost:5174", "http://localhost:3000", "http://127.0.0.1:5173", "http://127.0.0.1:5174", "http://localhost:5001", "http://127.0.0.1:5001"])
@@ -59,15 +80,307 @@ subjects_col = db['subjects']  # Collection for subjects by department and semes
 mentor_assignments_col = db['mentor_assignments']  # Collection for batch+group mentor assignments
 medical_leaves_col = db['medical_leaves']  # Collection for medical leave requests
 
+# Create any missing index for the hot queries (no-op when they exist); `python db_indexes.py migrate` does the same
+ENSURE_INDEXES_ON_STARTUP = os.environ.get('ENSURE_INDEXES_ON_STARTUP', '1') == '1'
+if ENSURE_INDEXES_ON_STARTUP:
+    try:
+        index_report = ensure_indexes(db)
+        if index_report["created"]:
+            print(f"🗂️  Created indexes: {', '.join(index_report['created'])}")
+        for index_name, reason in index_report["failed"].items():
+            print(f"⚠️  Index {index_name} not created: {reason}")
+    except Exception as e:
+        print(f"⚠️  Could not verify indexes: {e}")
+
 # Create uploads directory for ML proofs
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads', 'ml_proofs')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB max file size
+PHOTO_ATTENDANCE_MAX_BYTES = 40 * 1024 * 1024  # Classroom photos are uploaded at full resolution
+FACE_CHIP_MAX_BYTES = 128 * 1024  # A 160x160 chip is a few KB as JPEG; base64 JSON adds a third
+FACE_CHIP_FORMATS = ("JPEG", "PNG")
+BULK_IMPORT_BATCH_SIZE = 5000  # Sheet rows per roster/attendance prefetch and bulk_write
+BULK_IMPORT_MAX_BYTES = 50 * 1024 * 1024  # Semester-sized sheets; read in chunks, never held whole
+ML_BATCH_MAX_DECISIONS = 200  # Leave requests one approve_ml_batch call may decide (one transaction)
 
 # Current lecture state
 current_lecture = None
 
+# Face gallery used for attendance matching (built lazily from students_col)
+# 'euclidean' compares raw Facenet vectors; 'cosine' L2-normalizes them in the gallery
+FACE_MATCH_METRIC = os.environ.get('FACE_MATCH_METRIC', 'euclidean').strip().lower()
+# Cosine values are the L2 ones translated through DeepFace's Facenet reference points
+# (L2 10 ~ cosine 0.40); refine them with GET /api/admin/calibrate-thresholds
+MATCH_THRESHOLDS = {
+    "euclidean": {"attendance": 15, "enrollment": 8.0, "enrichment": 6.0, "enrichment_margin": 5.0},
+    "cosine": {"attendance": 0.60, "enrollment": 0.32, "enrichment": 0.20, "enrichment_margin": 0.20}
+}
+if FACE_MATCH_METRIC not in MATCH_THRESHOLDS:
+    raise ValueError(f"FACE_MATCH_METRIC must be one of {', '.join(MATCH_THRESHOLDS)}, got '{FACE_MATCH_METRIC}'")
+ATTENDANCE_MATCH_THRESHOLD = float(os.environ.get('ATTENDANCE_MATCH_THRESHOLD', MATCH_THRESHOLDS[FACE_MATCH_METRIC]["attendance"]))
+ENROLLMENT_DUPLICATE_THRESHOLD = float(os.environ.get('ENROLLMENT_DUPLICATE_THRESHOLD', MATCH_THRESHOLDS[FACE_MATCH_METRIC]["enrollment"]))
+FACE_GALLERY_QUANTIZE = os.environ.get('FACE_GALLERY_QUANTIZE', 'false').lower() == 'true'
+FACE_GALLERY_MMAP_PATH = os.environ.get('FACE_GALLERY_MMAP_PATH')  # Optional .npy for full-precision vectors (reclaimable, per worker)
+# Centroid pruning for single-frame searches, never changes a decision; off by default when quantizing (they exclude each other)
+FACE_GALLERY_PRUNE = os.environ.get('FACE_GALLERY_PRUNE', 'false' if FACE_GALLERY_QUANTIZE else 'true').lower() == 'true'
+if FACE_GALLERY_QUANTIZE and FACE_GALLERY_PRUNE:
+    raise ValueError("FACE_GALLERY_QUANTIZE and FACE_GALLERY_PRUNE cannot both be true; pick one first pass")
+FACE_GALLERY_TTL_SECONDS = 300  # Rebuild periodically so other workers pick up enrollments
+# Optional "DEPT=http://node:port,...,*=http://node:port": search recognition nodes instead of a local gallery
+FACE_GALLERY_SHARDS = os.environ.get('FACE_GALLERY_SHARDS', '')
+ROSTER_GALLERY_CACHE_MB = int(os.environ.get('ROSTER_GALLERY_CACHE_MB', 256))  # Budget for per-roster galleries
+MAX_FACE_TEMPLATES_PER_STUDENT = int(os.environ.get('MAX_FACE_TEMPLATES_PER_STUDENT', 10))
+
+# Opt-in: very confident matches become extra templates, kept within MAX_FACE_TEMPLATES_PER_STUDENT
+FACE_TEMPLATE_ENRICHMENT = os.environ.get('FACE_TEMPLATE_ENRICHMENT', 'false').lower() == 'true'
+ENRICHMENT_MAX_DISTANCE = float(os.environ.get('ENRICHMENT_MAX_DISTANCE', MATCH_THRESHOLDS[FACE_MATCH_METRIC]["enrichment"]))
+ENRICHMENT_MIN_MARGIN = float(os.environ.get('ENRICHMENT_MIN_MARGIN', MATCH_THRESHOLDS[FACE_MATCH_METRIC]["enrichment_margin"]))
+ENRICHMENT_COOLDOWN_SECONDS = int(os.environ.get('ENRICHMENT_COOLDOWN_SECONDS', 3600))  # Per student
+last_enriched_at = {}  # rollNo -> timestamp
+face_gallery = None
+
+# Embedding cache: identical decoded images reuse the stored Facenet result
+EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'embeddings.sqlite3'))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 20000))
+try:
+    DEEPFACE_VERSION = metadata.version('deepface')
+except metadata.PackageNotFoundError:
+    DEEPFACE_VERSION = 'unknown'
+# Bump the pipeline tag whenever get_embedding_from_base64 changes how it detects or embeds
+EMBEDDING_PIPELINE_VERSION = f"Facenet|deepface-{DEEPFACE_VERSION}|opencv>mtcnn>default-v1"
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES) if EMBEDDING_CACHE_ENABLED else None
+
+# Recognition admission control: shed kiosk frames that could not be answered within the SLO
+RECOGNITION_SLO_SECONDS = float(os.environ.get('RECOGNITION_SLO_SECONDS', 3.0))
+RECOGNITION_MAX_CONCURRENCY = int(os.environ.get('RECOGNITION_MAX_CONCURRENCY', 2))
+recognition_admission = RecognitionAdmission(RECOGNITION_SLO_SECONDS, RECOGNITION_MAX_CONCURRENCY)
+# Classroom photo jobs run outside kiosk admission, on their own bounded slots
+PHOTO_ATTENDANCE_MAX_CONCURRENCY = int(os.environ.get('PHOTO_ATTENDANCE_MAX_CONCURRENCY', 1))
+PHOTO_ATTENDANCE_RETRY_AFTER = 10  # Seconds; a tiled photo job takes several to finish
+photo_attendance_slots = threading.BoundedSemaphore(PHOTO_ATTENDANCE_MAX_CONCURRENCY)
+
+# Capture pacing hint (next_capture_ms) returned to kiosks with every recognition response
+CAPTURE_DELAY_MS = 3000  # Normal pace, the kiosk's former fixed interval
+CAPTURE_DELAY_MIN_MS = 1500  # A student was just marked, the line is moving
+CAPTURE_DELAY_DUPLICATE_MS = 5000  # The same, already marked student is still in front of the camera
+CAPTURE_DELAY_MAX_MS = 15000  # Ceiling for idle kiosks backing off on empty frames
+KIOSK_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')  # Anything else in X-Kiosk-Id is ignored
+KIOSK_IDLE_MAX_ENTRIES = 1024  # Kiosks tracked for back-off; the least recently seen is forgotten
+kiosk_idle_frames = OrderedDict()  # kiosk -> consecutive frames without a face, least recently seen first
+kiosk_idle_lock = threading.Lock()
+
+# Opt-in write-behind for face marks: journaled locally, flushed as bulk_writes every DELAY_MS or MAX_RECORDS
+ATTENDANCE_WRITE_BEHIND = os.environ.get('ATTENDANCE_WRITE_BEHIND', 'false').lower() == 'true'
+ATTENDANCE_WRITE_BEHIND_MAX_RECORDS = int(os.environ.get('ATTENDANCE_WRITE_BEHIND_MAX_RECORDS', 200))
+ATTENDANCE_WRITE_BEHIND_DELAY_MS = int(os.environ.get('ATTENDANCE_WRITE_BEHIND_DELAY_MS', 300))
+ATTENDANCE_JOURNAL_DIR = os.environ.get('ATTENDANCE_JOURNAL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'attendance_journal'))
+
+# Approved medical leave index: reloaded this often so approvals made on other workers are seen
+LEAVE_INDEX_TTL_SECONDS = int(os.environ.get('LEAVE_INDEX_TTL_SECONDS', 300))
+
+# Roster galleries (photo attendance, offline jobs): LRU within the budget, active lecture pinned
+roster_galleries = GalleryCache(
+    lambda roster: students_col.find(dict(roster), {"_id": 0, "rollNo": 1, "name": 1, "embeddings": 1}),
+    budget_bytes=ROSTER_GALLERY_CACHE_MB * 2**20,
+    snapshot_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'rosters'),
+    ttl_seconds=FACE_GALLERY_TTL_SECONDS,
+    gallery_options={"quantize": FACE_GALLERY_QUANTIZE, "prune": FACE_GALLERY_PRUNE, "metric": FACE_MATCH_METRIC}
+)
+
+def get_face_gallery():
+    """Return the cached face gallery, rebuilding it when missing or stale"""
+    global face_gallery
+    if FACE_GALLERY_SHARDS:
+        # Nodes keep their own galleries fresh; the client only holds the topology
+        if face_gallery is None:
+            face_gallery = ShardedGallery(parse_topology(FACE_GALLERY_SHARDS))
+        return face_gallery
+    if face_gallery is None or datetime.datetime.now().timestamp() - face_gallery.built_at > FACE_GALLERY_TTL_SECONDS:
+        students = students_col.find({}, {"_id": 0, "rollNo": 1, "name": 1, "embeddings": 1})
+        face_gallery = FaceGallery.from_students(
+            students,
+            quantize=FACE_GALLERY_QUANTIZE,
+            mmap_path=FACE_GALLERY_MMAP_PATH,
+            prune=FACE_GALLERY_PRUNE,
+            metric=FACE_MATCH_METRIC
+        )
+    return face_gallery
+
+def invalidate_face_gallery():
+    """Drop the cached gallery after students or their embeddings change"""
+    global face_gallery
+    roster_galleries.clear()
+    if FACE_GALLERY_SHARDS:
+        try:
+            get_face_gallery().invalidate()
+        except Exception as e:
+            print(f"Failed to invalidate shard galleries: {e}")
+        return
+    face_gallery = None
+
+def search_enrolled_faces(embeddings, k=1):
+    """
+    gallery.search_batch() for enrollment duplicate checks. The cached gallery
+    can be up to FACE_GALLERY_TTL_SECONDS old, so students inserted on any
+    worker since then (by their ObjectId time, with a minute of clock slack)
+    are read from the database and searched as well.
+    """
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=FACE_GALLERY_TTL_SECONDS + 60)
+    recent = FaceGallery.from_students(
+        students_col.find({"_id": {"$gte": ObjectId.from_datetime(since)}},
+                          {"_id": 0, "rollNo": 1, "name": 1, "embeddings": 1}),
+        metric=FACE_MATCH_METRIC
+    )
+    merged = []
+    for cached, fresh in zip(get_face_gallery().search_batch(embeddings, k=k), recent.search_batch(embeddings, k=k)):
+        closest = {}
+        for student, dist in cached + fresh:
+            if dist < closest.get(student['rollNo'], (None, float('inf')))[1]:
+                closest[student['rollNo']] = (student, dist)
+        merged.append(sorted(closest.values(), key=lambda hit: hit[1])[:k])
+    return merged
+
+def update_face_gallery_student(student, embeddings):
+    """Apply one student's new templates to the cached galleries in place (no rebuild)"""
+    if face_gallery is not None:
+        face_gallery.set_student_embeddings(student, embeddings)
+    roster_galleries.update_student(student, embeddings)
+
+def maybe_enrich_face_templates(student, embedding, dist, runner_up_dist):
+    """
+    Add a recognised face to the student's templates when the match is very close
+    and clearly ahead of the next student. The per-student budget is kept by
+    dropping the most redundant template. Returns True if the templates changed.
+    """
+    if dist >= ENRICHMENT_MAX_DISTANCE or runner_up_dist - dist < ENRICHMENT_MIN_MARGIN:
+        return False
+    roll_no = student['rollNo']
+    now = datetime.datetime.now().timestamp()
+    if now - last_enriched_at.get(roll_no, 0) < ENRICHMENT_COOLDOWN_SECONDS:
+        return False
+    last_enriched_at[roll_no] = now
+    
+    doc = students_col.find_one({"rollNo": roll_no}, {"_id": 0, "department": 1, "embeddings": 1})
+    templates = list((doc or {}).get("embeddings") or [])
+    if not templates:
+        return False
+    templates.append([float(x) for x in embedding])
+    keep = select_diverse_templates(templates, MAX_FACE_TEMPLATES_PER_STUDENT, metric=FACE_MATCH_METRIC)
+    if len(templates) - 1 not in keep:
+        # The new face adds nothing the existing templates don't already cover
+        return False
+    templates = [templates[i] for i in keep]
+    
+    students_col.update_one({"rollNo": roll_no}, {"$set": {"embeddings": templates}})
+    update_face_gallery_student(dict(student, department=doc.get("department")), templates)
+    print(f"DEBUG: Enriched templates for {roll_no}: distance {dist:.4f}, margin {runner_up_dist - dist:.4f}, {len(templates)} templates")
+    return True
+
+def lecture_roster(lecture):
+    """Roster filter (department/batch/group) a lecture was started with, if any"""
+    return (lecture or {}).get("roster") or {}
+
+def lecture_subject(lecture_number, date, subject=None):
+    """
+    Subject attendance for (lecture_number, date) is filed under, the last field
+    of the unique attendance slot. Face marks take it from the active lecture
+    ("Unknown" when it has none), so manual, bulk and imported records must
+    resolve it the same way to land in the same slot. An explicit subject wins;
+    otherwise the active lecture, otherwise the only stored lecture that day.
+    """
+    if subject:
+        return subject
+    lecture = current_lecture
+    if not (lecture and str(lecture.get("lectureNumber")) == str(lecture_number) and lecture.get("date") == date):
+        lectures = list(lectures_col.find(
+            {"lectureNumber": {"$in": [lecture_number, str(lecture_number)]}, "date": date}, {"_id": 0, "subject": 1}
+        ).limit(2))
+        # Two subjects with the same lecture number that day: the caller has to name one
+        lecture = lectures[0] if len(lectures) == 1 else {}
+    return lecture.get("subject") or "Unknown"
+
+def get_roster_gallery(roster):
+    """Face gallery limited to one roster; the full gallery when no roster is set"""
+    if not roster:
+        return get_face_gallery()
+    return roster_galleries.get(roster)
+
+def admission_controlled(view):
+    """Run a recognition endpoint inside recognition_admission; 503 + Retry-After when shed"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            with recognition_admission.admit() as slot:
+                g.recognition_slot = slot
+                return view(*args, **kwargs)
+        except AdmissionRejected as e:
+            print(f"DEBUG: Recognition shed ({e}), retry after {e.retry_after}s")
+            response = jsonify({
+                "message": "Recognition server is busy, please try again shortly",
+                "retry_after": e.retry_after,
+                "estimated_wait_ms": round(e.estimated_wait * 1000),
+                "next_capture_ms": e.retry_after * 1000
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+    return wrapper
+
+def recognition_completed():
+    """Count this request's time in the recognition service-time estimate (a face was embedded and matched)"""
+    slot = g.get('recognition_slot')
+    if slot is not None:
+        slot.completed = True
+
+def recommended_capture_delay(face_present, action=None):
+    """
+    Milliseconds the calling kiosk should wait before sending its next frame.
+    Empty frames back off exponentially per kiosk, a student who is already
+    marked gets a longer pause, and the delay never undercuts the time the
+    recognition queue currently needs to answer a frame.
+    """
+    kiosk_id = request.headers.get('X-Kiosk-Id', '')
+    # Scoped to the client address, so a client cycling ids only churns the LRU
+    kiosk = f"{request.remote_addr}/{kiosk_id}" if KIOSK_ID_PATTERN.match(kiosk_id) else request.remote_addr
+    if face_present:
+        with kiosk_idle_lock:
+            kiosk_idle_frames.pop(kiosk, None)
+        if action in ("already_present", "manual_absent_kept"):
+            delay = CAPTURE_DELAY_DUPLICATE_MS
+        elif action in ("created", "updated"):
+            delay = CAPTURE_DELAY_MIN_MS
+        else:
+            delay = CAPTURE_DELAY_MS
+    else:
+        with kiosk_idle_lock:
+            idle = kiosk_idle_frames.pop(kiosk, 0) + 1
+            kiosk_idle_frames[kiosk] = idle
+            while len(kiosk_idle_frames) > KIOSK_IDLE_MAX_ENTRIES:
+                kiosk_idle_frames.popitem(last=False)
+        delay = min(CAPTURE_DELAY_MS * 2 ** min(idle - 1, 8), CAPTURE_DELAY_MAX_MS)
+    load_floor = (recognition_admission.estimated_wait() + recognition_admission.service_seconds) * 1000
+    return int(max(delay, load_floor))
+
+# Approved medical leaves by student, so attendance writes can record ML instead of Absent
+approved_leaves = ApprovedLeaveIndex(
+    lambda: medical_leaves_col.find({"status": "APPROVED"}, {"student_rollNo": 1, "start_date": 1, "end_date": 1}),
+    ttl_seconds=LEAVE_INDEX_TTL_SECONDS
+)
+
+def leave_adjusted_status(roll_no, date, status):
+    """Absent becomes ML on a date covered by the student's approved medical leave"""
+    if str(status).lower() == 'absent' and approved_leaves.covers(roll_no, date):
+        return 'ML'
+    return status
+
+def pin_lecture_gallery(lecture):
+    """Keep the active lecture's roster gallery resident (one lecture is active at a time)"""
+    for owner in list(roster_galleries.pins):
+        roster_galleries.unpin(owner)
+    if lecture and lecture_roster(lecture):
+        roster_galleries.pin(lecture["_id"], lecture_roster(lecture))
+
 # Username generation function for teachers
 def generate_unique_username(name):
     """
@@ -540,7 +853,7 @@ def admin_add_student():
         if images:
             for idx, img_b64 in enumerate(images):
                 try:
-                    emb = get_embedding_from_base64(img_b64)
+                    emb = get_embedding_from_base64(img_b64, use_cache=True)
                     embeddings.append(emb)
                 except Exception as e:
                     print(f"Failed to process image {idx+1}: {e}")
@@ -561,6 +874,7 @@ def admin_add_student():
         }
         
         result = students_col.insert_one(student_data)
+        invalidate_face_gallery()
         
         return jsonify({
             "message": "Student added successfully",
@@ -1009,6 +1323,13 @@ def set_lecture():
     if not subject or subject.strip() == "":
         return jsonify({"message": f"Subject is required for lecture. Received: '{subject}' from data: {data}"}), 400
     
+    # Optional roster (department/batch/group) used to narrow face matching to this class
+    roster = {key: data.get(key) for key in ("department", "batch", "group") if data.get(key)}
+    # The roster becomes a students_col filter, so only plain values (never operator dicts)
+    invalid = [key for key, value in roster.items() if not isinstance(value, str)]
+    if invalid:
+        return jsonify({"message": f"{', '.join(invalid)} must be text"}), 400
+    
     # Check if lecture already exists for this date and subject
     existing_lecture = lectures_col.find_one({
         "lectureNumber": lecture_number,
@@ -1024,14 +1345,16 @@ def set_lecture():
             "date": lecture_date,
             "subject": subject,
             "startTime": existing_lecture.get("startTime", datetime.datetime.now().isoformat()),
+            "roster": roster or existing_lecture.get("roster", {}),
             "isActive": True
         }
         
         # Update the lecture to be active
         lectures_col.update_one(
             {"_id": existing_lecture["_id"]},
-            {"$set": {"isActive": True}}
+            {"$set": {"isActive": True, "roster": current_lecture["roster"]}}
         )
+        pin_lecture_gallery(current_lecture)
         
         return jsonify({
             "message": f"Lecture {lecture_number} for {subject} is ready for attendance on {lecture_date}",
@@ -1044,6 +1367,7 @@ def set_lecture():
         "startTime": datetime.datetime.now().isoformat(),
         "date": lecture_date,
         "subject": subject,
+        "roster": roster,
         "isActive": True,
         "attendees": []
     }
@@ -1055,8 +1379,10 @@ def set_lecture():
         "date": lecture_date,
         "subject": subject,
         "startTime": lecture["startTime"],
+        "roster": roster,
         "isActive": True
     }
+    pin_lecture_gallery(current_lecture)
     
     return jsonify({
         "message": f"Lecture {lecture_number} for {subject} is ready for attendance on {lecture_date}",
@@ -1099,6 +1425,13 @@ def end_lecture():
     if not current_lecture:
         return jsonify({"message": "No active lecture to end"}), 400
     
+    if attendance_buffer is not None:
+        # Buffered face marks reach the database before the lecture is closed
+        try:
+            attendance_buffer.flush()
+        except Exception as e:
+            return jsonify({"message": f"Could not save buffered attendance, lecture not ended: {e}"}), 503
+    
     # Update lecture in database
     lectures_col.update_one(
         {"_id": ObjectId(current_lecture["_id"])},
@@ -1112,6 +1445,7 @@ def end_lecture():
     
     lecture_number = current_lecture["lectureNumber"]
     current_lecture = None
+    pin_lecture_gallery(None)
     
     print(f"Ended lecture {lecture_number}")
     return jsonify({"message": f"Lecture {lecture_number} ended successfully"}), 200
@@ -1139,6 +1473,7 @@ def delete_student_api(student_id):
         student_result = students_col.delete_one({"rollNo": student_id})
         if student_result.deleted_count == 0:
             return jsonify({"success": False, "error": "Failed to delete student"}), 500
+        invalidate_face_gallery()
         
         # Delete all attendance records for this student
         attendance_result = attendance_col.delete_many({"rollNo": student_id})
@@ -1173,6 +1508,7 @@ def mark_attendance_safe():
         
         if not all([roll_no, name, status, lecture_number, date, time]):
             return jsonify({"success": False, "error": "Missing required fields"}), 400
+        status = leave_adjusted_status(roll_no, date, status)
         
         # Use atomic upsert operation to prevent race conditions
         filter_query = {
@@ -1180,6 +1516,8 @@ def mark_attendance_safe():
             "lectureNumber": lecture_number,
             "date": date
         }
+        # Exact slot of the unique (rollNo, lectureNumber, date, subject) index
+        filter_query["subject"] = lecture_subject(lecture_number, date, data.get('subject'))
         
         update_data = {
             "$set": {
@@ -1191,20 +1529,25 @@ def mark_attendance_safe():
             "$setOnInsert": {
                 "rollNo": roll_no,
                 "lectureNumber": lecture_number,
-                "date": date
+                "date": date,
+                "subject": filter_query["subject"]
             }
         }
         
-        # Check if record exists first to provide appropriate message
-        existing = attendance_col.find_one(filter_query)
-        
-        result = attendance_col.update_one(
-            filter_query,
-            update_data,
-            upsert=True
-        )
+        # One find-and-modify: the previous document says whether this created or updated
+        try:
+            existing = attendance_col.find_one_and_update(
+                filter_query, update_data, projection={"_id": 0, "status": 1, "method": 1},
+                upsert=True, return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert inserted the record first; this one now matches it
+            existing = attendance_col.find_one_and_update(
+                filter_query, update_data, projection={"_id": 0, "status": 1, "method": 1},
+                return_document=ReturnDocument.BEFORE
+            )
         
-        if existing:
+        if existing is not None:
             return jsonify({
                 "success": True,
                 "message": f"Updated attendance for {name} to {status}",
@@ -1235,9 +1578,10 @@ def mark_attendance_manual():
         
         if not all([roll_no, name, status, lecture_number, date, time]):
             return jsonify({"success": False, "error": "Missing required fields"}), 400
+        status = leave_adjusted_status(roll_no, date, status)
         
         # Check if attendance already exists for this student, lecture, date and subject
-        subject = current_lecture.get("subject", "Unknown") if current_lecture else "Unknown"
+        subject = lecture_subject(int(lecture_number), date, data.get('subject'))
         existing = attendance_col.find_one({
             "rollNo": roll_no,
             "lectureNumber": int(lecture_number),  # Ensure integer comparison
@@ -1315,87 +1659,103 @@ def mark_attendance_manual():
 def get_lectures():
     lectures = list(lectures_col.find({}, {"_id": 0}).sort("lectureNumber", -1))
     return jsonify(lectures), 200
-def preprocess_image(img):
-    """Preprocess image to improve face detection"""
-    # Resize if image is too large
-    height, width = img.shape[:2]
-    if height > 800 or width > 800:
-        scale = 800 / max(height, width)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
-        print(f"Resized image to: {new_width}x{new_height}")
-    
-    # Improve contrast and brightness
-    lab = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
-    l_channel, a, b = cv2.split(lab)
+def compute_face_embedding(img):
+    """Run the detector fallback chain on a decoded BGR image, returning (embedding, facial_area)"""
+    # Convert BGR to RGB for DeepFace
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     
-    # Apply CLAHE to L channel
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-    cl = clahe.apply(l_channel)
+    # Try a simpler approach first - just use OpenCV backend without enforcement
+    try:
+        print("Trying OpenCV backend without strict enforcement...")
+        result = DeepFace.represent(
+            img_rgb, 
+            model_name='Facenet',
+            detector_backend='opencv',
+            enforce_detection=False
+        )[0]
+        print("SUCCESS: Face embedding extracted with OpenCV")
+        return result['embedding'], result.get('facial_area')
+    except Exception as e:
+        print(f"OpenCV approach failed: {e}")
     
-    # Merge channels and convert back to RGB
-    enhanced = cv2.merge((cl, a, b))
-    enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2RGB)
+    # Try with MTCNN backend
+    try:
+        print("Trying MTCNN backend...")
+        result = DeepFace.represent(
+            img_rgb, 
+            model_name='Facenet',
+            detector_backend='mtcnn',
+            enforce_detection=False
+        )[0]
+        print("SUCCESS: Face embedding extracted with MTCNN")
+        return result['embedding'], result.get('facial_area')
+    except Exception as e:
+        print(f"MTCNN approach failed: {e}")
     
-    return enhanced
+    # Last resort: try with basic settings
+    try:
+        print("Trying basic DeepFace settings...")
+        result = DeepFace.represent(img_rgb, model_name='Facenet')[0]
+        print("SUCCESS: Face embedding extracted with basic settings")
+        return result['embedding'], result.get('facial_area')
+    except Exception as e:
+        print(f"Basic approach also failed: {e}")
+        raise Exception(f"All face detection methods failed. Last error: {e}")
 
-def get_embedding_from_base64(base64_img):
+def get_face_from_base64(base64_img, use_cache=False):
+    """
+    Embedding, detected facial area and (height, width) of a data-URL image.
+    use_cache is for enrollment photos, which are often submitted again; live
+    kiosk frames never repeat, so caching them would only add SQLite writes.
+    """
     try:
         # Decode the base64 image
         img_data = base64.b64decode(base64_img.split(',')[1])
         np_arr = np.frombuffer(img_data, np.uint8)
         img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        print(f"Original image shape: {img.shape}, dtype: {img.dtype}")
         
         if img is None:
             raise Exception("Failed to decode image")
+        print(f"Original image shape: {img.shape}, dtype: {img.dtype}")
         
-        # Convert BGR to RGB for DeepFace
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Try a simpler approach first - just use OpenCV backend without enforcement
-        try:
-            print("Trying OpenCV backend without strict enforcement...")
-            embedding = DeepFace.represent(
-                img_rgb, 
-                model_name='Facenet',
-                detector_backend='opencv',
-                enforce_detection=False
-            )[0]['embedding']
-            print("SUCCESS: Face embedding extracted with OpenCV")
-            return embedding
-        except Exception as e:
-            print(f"OpenCV approach failed: {e}")
-        
-        # Try with MTCNN backend
-        try:
-            print("Trying MTCNN backend...")
-            embedding = DeepFace.represent(
-                img_rgb, 
-                model_name='Facenet',
-                detector_backend='mtcnn',
-                enforce_detection=False
-            )[0]['embedding']
-            print("SUCCESS: Face embedding extracted with MTCNN")
-            return embedding
-        except Exception as e:
-            print(f"MTCNN approach failed: {e}")
-        
-        # Last resort: try with basic settings
-        try:
-            print("Trying basic DeepFace settings...")
-            embedding = DeepFace.represent(img_rgb, model_name='Facenet')[0]['embedding']
-            print("SUCCESS: Face embedding extracted with basic settings")
-            return embedding
-        except Exception as e:
-            print(f"Basic approach also failed: {e}")
-            raise Exception(f"All face detection methods failed. Last error: {e}")
+        # Same pixels through the same pipeline give the same result, so reuse it
+        cache_key = None
+        if use_cache and embedding_cache is not None:
+            cache_key = EmbeddingCache.make_key(img, EMBEDDING_PIPELINE_VERSION)
+            # The cache only saves inference: a locked or corrupt SQLite file is a miss, never a failed enrollment
+            try:
+                cached = embedding_cache.get(cache_key)
+            except Exception as e:
+                print(f"ERROR: Embedding cache read failed, computing instead: {e}")
+                cached = None
+            if cached is not None:
+                print("SUCCESS: Face embedding served from cache")
+                return cached[0], cached[1], img.shape[:2]
+        
+        embedding, facial_area = compute_face_embedding(img)
+        embedding = [float(x) for x in embedding]
+        if cache_key is not None:
+            try:
+                embedding_cache.put(cache_key, embedding, facial_area)
+            except Exception as e:
+                print(f"ERROR: Embedding cache write failed, result not cached: {e}")
+        return embedding, facial_area, img.shape[:2]
         
     except Exception as e:
-        print(f"Error in get_embedding_from_base64: {e}")
+        print(f"Error in get_face_from_base64: {e}")
         raise
 
+def get_embedding_from_base64(base64_img, use_cache=False):
+    return get_face_from_base64(base64_img, use_cache)[0]
+
+def face_area_found(facial_area, image_shape):
+    """False when the detector fell back to the whole frame (no face found)"""
+    if not facial_area:
+        return False
+    height, width = image_shape
+    return not (facial_area.get('x', 0) == 0 and facial_area.get('y', 0) == 0
+                and facial_area.get('w') == width and facial_area.get('h') == height)
+
 @app.route('/api/enroll', methods=['POST'])
 @jwt_required()
 def enroll_student():
@@ -1428,7 +1788,7 @@ def enroll_student():
     for idx, img_b64 in enumerate(images):
         try:
             print(f"DEBUG: Processing image {idx+1}/{len(images)} for {name}")
-            emb = get_embedding_from_base64(img_b64)
+            emb = get_embedding_from_base64(img_b64, use_cache=True)
             new_embeddings.append(emb)
             print(f"DEBUG: Image {idx+1}: Embedding extracted successfully. Shape: {len(emb)}")
         except Exception as e:
@@ -1442,35 +1802,28 @@ def enroll_student():
     print(f"DEBUG: Successfully extracted {len(new_embeddings)} embeddings for {name}")
     
     # Check for face similarity with existing students
-    all_students = list(students_col.find({}))
-    print(f"DEBUG: Checking face similarity against {len(all_students)} existing students")
-    
     # Use stricter threshold for enrollment to prevent false duplicates
     # Lower threshold = stricter matching (only very similar faces are considered duplicates)
-    enrollment_threshold = 8.0  # Much stricter than attendance matching (15)
+    print("DEBUG: Checking face similarity against the enrolled face gallery")
     
-    duplicate_found = False
+    # All new images are scored against the whole gallery in one batched search
     min_distance = float('inf')
     closest_student = None
-    
-    for student in all_students:
-        student_name = student.get('name', 'Unknown')
-        existing_embeddings = student.get('embeddings', [])
+    for results in search_enrolled_faces(new_embeddings, k=1):
+        if not results:
+            continue
+        student, dist = results[0]
         
-        for i, existing_emb in enumerate(existing_embeddings):
-            for j, new_emb in enumerate(new_embeddings):
-                dist = np.linalg.norm(np.array(new_emb) - np.array(existing_emb))
-                
-                # Track minimum distance for debugging
-                if dist < min_distance:
-                    min_distance = dist
-                    closest_student = student_name
-                
-                if dist < enrollment_threshold:
-                    print(f"ERROR: Duplicate face detected! {name} vs {student_name}: distance {dist:.2f} < {enrollment_threshold}")
-                    return jsonify({
-                        "message": f"Face already exists! Very similar to student {student_name} (Roll: {student['rollNo']}) - Distance: {dist:.2f}"
-                    }), 400
+        # Track minimum distance for debugging
+        if dist < min_distance:
+            min_distance = dist
+            closest_student = student['name']
+        
+        if dist < ENROLLMENT_DUPLICATE_THRESHOLD:
+            print(f"ERROR: Duplicate face detected! {name} vs {student['name']}: distance {dist:.2f} < {ENROLLMENT_DUPLICATE_THRESHOLD}")
+            return jsonify({
+                "message": f"Face already exists! Very similar to student {student['name']} (Roll: {student['rollNo']}) - Distance: {dist:.2f}"
+            }), 400
     
     print(f"DEBUG: Face similarity check passed. Closest match: {closest_student} (distance: {min_distance:.2f})")
     
@@ -1486,6 +1839,7 @@ def enroll_student():
     }
     try:
         result = students_col.insert_one(student)
+        invalidate_face_gallery()
         print(f"Student inserted with _id: {result.inserted_id}")
     except Exception as e:
         print(f"Failed to insert student: {e}")
@@ -1493,7 +1847,214 @@ def enroll_student():
     return jsonify({"message": "Student enrolled successfully", "embeddings_saved": len(new_embeddings)}), 201
 
 
+# Face recognition may set Present unless the record is already Present or a teacher's manual Absent
+FACE_MARK_ALLOWED = {"$and": [
+    {"$ne": ["$status", "Present"]},
+    {"$not": [{"$and": [{"$eq": ["$status", "Absent"]}, {"$eq": [{"$ifNull": ["$method", "manual"]}, "manual"]}]}]}
+]}
+
+def face_mark_update(name, now):
+    """Pipeline update that applies a face mark only where FACE_MARK_ALLOWED (upsert inserts it)"""
+    return [{"$set": {
+        "name": {"$ifNull": ["$name", name]},
+        "status": {"$cond": [FACE_MARK_ALLOWED, "Present", "$status"]},
+        "time": {"$cond": [FACE_MARK_ALLOWED, now, "$time"]},
+        "method": {"$cond": [FACE_MARK_ALLOWED, "face_recognition", "$method"]}
+    }}]
+
+def flush_face_marks(marks):
+    """
+    Write-behind flush: one unordered bulk_write of slot upserts, then the
+    new attendees of each lecture. Attendee membership was decided when the
+    mark was queued ("created") and $addToSet repeats safely, so a retried
+    or replayed batch still reaches lectures.attendees.
+    """
+    operations = [
+        UpdateOne(
+            {"rollNo": m["rollNo"], "lectureNumber": m["lectureNumber"], "date": m["date"], "subject": m["subject"]},
+            face_mark_update(m["name"], m["time"]),
+            upsert=True
+        )
+        for m in marks
+    ]
+    try:
+        attendance_col.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Inserts that lost the unique slot index to a concurrent write are already recorded
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+    
+    new_attendees = {}
+    for m in marks:
+        if m.get("created"):
+            new_attendees.setdefault(m["lectureId"], []).append(m["rollNo"])
+    if new_attendees:
+        lectures_col.bulk_write([
+            UpdateOne({"_id": ObjectId(lecture_id)}, {"$addToSet": {"attendees": {"$each": roll_nos}}})
+            for lecture_id, roll_nos in new_attendees.items()
+        ], ordered=False)
+    print(f"📝 Flushed {len(marks)} buffered attendance marks")
+
+attendance_buffer = AttendanceWriteBuffer(
+    flush_face_marks, ATTENDANCE_JOURNAL_DIR,
+    max_records=ATTENDANCE_WRITE_BEHIND_MAX_RECORDS,
+    max_delay_seconds=ATTENDANCE_WRITE_BEHIND_DELAY_MS / 1000
+) if ATTENDANCE_WRITE_BEHIND else None
+if attendance_buffer is not None:
+    atexit.register(attendance_buffer.close)
+
+def record_face_attendance(matched_student):
+    """
+    Apply the face-recognition attendance write rules for the active lecture.
+    Returns (response_body, status_code) for the calling endpoint.
+    
+    One find-and-modify on the unique slot index: a pipeline update sets
+    Present only where the rules allow it (inserting when there is no record)
+    and the previous document tells which rule applied. With the write-behind
+    buffer the slot is only read and the mark is queued; the flush applies the
+    same pipeline, so a manual mark made in between still wins.
+    """
+    roll_no = matched_student['rollNo']
+    subject = current_lecture.get("subject", "Unknown")
+    now = datetime.datetime.now().strftime("%H:%M:%S")
+    slot = {
+        "rollNo": roll_no,
+        "lectureNumber": current_lecture["lectureNumber"],
+        "date": current_lecture["date"],
+        "subject": subject
+    }
+    
+    try:
+        if attendance_buffer is None:
+            existing_attendance = attendance_col.find_one_and_update(
+                slot,
+                face_mark_update(matched_student['name'], now),
+                projection={"_id": 0, "status": 1, "method": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        else:
+            buffer_key = (slot["lectureNumber"], slot["date"], subject, roll_no)
+            existing_attendance = attendance_buffer.get(buffer_key) or \
+                attendance_col.find_one(slot, {"_id": 0, "status": 1, "method": 1})
+    except DuplicateKeyError:
+        # A concurrent request for the same student won the unique slot index
+        return {
+            "message": f"{matched_student['name']} is already marked for Lecture {current_lecture['lectureNumber']}",
+            "action": "already_present"
+        }, 200
+    
+    if existing_attendance is not None:
+        existing_status = existing_attendance.get("status")
+        existing_method = existing_attendance.get("method", "manual")
+        
+        if existing_status == "Present":
+            return {
+                "message": f"{matched_student['name']} is already marked present for Lecture {current_lecture['lectureNumber']} via {existing_method}",
+                "action": "already_present"
+            }, 200
+        elif existing_status == "Absent" and existing_method == "manual":
+            # Don't override manual absent marking with face recognition
+            return {
+                "message": f"{matched_student['name']} is manually marked absent for Lecture {current_lecture['lectureNumber']}. Cannot override with face recognition.",
+                "action": "manual_absent_kept"
+            }, 400
+    
+    if attendance_buffer is not None:
+        attendance_buffer.add(buffer_key, dict(
+            slot, name=matched_student['name'], time=now, status="Present",
+            method="face_recognition", lectureId=current_lecture["_id"],
+            created=existing_attendance is None
+        ))
+    
+    if existing_attendance is not None:
+        # Existing record was updated from Absent to Present (not manually set to absent)
+        return {
+            "message": f"Attendance updated to Present for {matched_student['name']} (Roll: {roll_no}) - Lecture {current_lecture['lectureNumber']}",
+            "action": "updated"
+        }, 200
+    
+    if attendance_buffer is None:
+        # Add to lecture attendees (the write-behind flush does this for buffered marks)
+        lectures_col.update_one(
+            {"_id": ObjectId(current_lecture["_id"])},
+            {"$addToSet": {"attendees": roll_no}}
+        )
+    
+    return {
+        "message": f"Attendance marked for {matched_student['name']} (Roll: {roll_no}) - Lecture {current_lecture['lectureNumber']}",
+        "action": "created"
+    }, 200
+
+def bulk_mark_face_attendance(matched_students, lecture):
+    """
+    Apply the record_face_attendance() rules to many students at once:
+    one $in read of existing records and one unordered bulk_write.
+    Returns one {"rollNo", "name", "action"} entry per student.
+    """
+    if not matched_students:
+        return []
+    
+    subject = lecture.get("subject", "Unknown")
+    now = datetime.datetime.now().strftime("%H:%M:%S")
+    existing = {
+        record["rollNo"]: record
+        for record in attendance_col.find({
+            "rollNo": {"$in": [s["rollNo"] for s in matched_students]},
+            "lectureNumber": lecture["lectureNumber"],
+            "date": lecture["date"],
+            "subject": subject
+        })
+    }
+    
+    operations = []
+    new_attendees = []
+    outcomes = []
+    for student in matched_students:
+        roll_no = student["rollNo"]
+        record = existing.get(roll_no)
+        if record and record.get("status") == "Present":
+            action = "already_present"
+        elif record and record.get("status") == "Absent" and record.get("method", "manual") == "manual":
+            # Don't override manual absent marking with face recognition
+            action = "manual_absent_kept"
+        elif record:
+            operations.append(UpdateOne(
+                {"_id": record["_id"]},
+                {"$set": {"status": "Present", "time": now, "subject": subject, "method": "face_recognition"}}
+            ))
+            action = "updated"
+        else:
+            operations.append(InsertOne({
+                "rollNo": roll_no,
+                "name": student["name"],
+                "lectureNumber": lecture["lectureNumber"],
+                "date": lecture["date"],
+                "subject": subject,
+                "time": now,
+                "status": "Present",
+                "method": "face_recognition"
+            }))
+            new_attendees.append(roll_no)
+            action = "created"
+        outcomes.append({"rollNo": roll_no, "name": student["name"], "action": action})
+    
+    if operations:
+        try:
+            attendance_col.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Inserts that lost the unique slot index to a concurrent write are already recorded
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    if new_attendees:
+        lectures_col.update_one(
+            {"_id": ObjectId(lecture["_id"])},
+            {"$addToSet": {"attendees": {"$each": new_attendees}}}
+        )
+    return outcomes
+
 @app.route('/api/mark-attendance', methods=['POST'])
+@admission_controlled
 def mark_attendance():
     global current_lecture
     
@@ -1505,86 +2066,299 @@ def mark_attendance():
     if not image_b64:
         return jsonify({"message": "No image provided"}), 400
 
+    try:
+        captured_embedding, facial_area, image_shape = get_face_from_base64(image_b64)
+    except Exception as e:
+        print(f"Face detection error: {e}")
+        return jsonify({
+            "message": f"Face not detected: {e}",
+            "next_capture_ms": recommended_capture_delay(False)
+        }), 400
+
+    body, status_code = match_face_attendance(captured_embedding)
+    face_present = status_code != 404 or face_area_found(facial_area, image_shape)
+    body["next_capture_ms"] = recommended_capture_delay(face_present, body.get("action"))
+    return jsonify(body), status_code
+
+def match_face_attendance(captured_embedding):
+    """Identify a captured face in the gallery and mark it for the active lecture"""
+    recognition_completed()
+    # Compare against every enrolled embedding in one gallery search
+    # (top 2 when enrichment is on, so the margin over the runner-up is known)
+    results = get_face_gallery().search(
+        captured_embedding,
+        k=2 if FACE_TEMPLATE_ENRICHMENT else 1,
+        max_distance=ATTENDANCE_MATCH_THRESHOLD
+    )
+
+    if results:
+        matched_student, min_dist = results[0]
+        body, status_code = record_face_attendance(matched_student)
+        if FACE_TEMPLATE_ENRICHMENT:
+            # Nobody else within the threshold means the margin is at least threshold - distance
+            runner_up_dist = results[1][1] if len(results) > 1 else ATTENDANCE_MATCH_THRESHOLD
+            try:
+                maybe_enrich_face_templates(matched_student, captured_embedding, min_dist, runner_up_dist)
+            except Exception as e:
+                print(f"Template enrichment failed for {matched_student['rollNo']}: {e}")
+        return body, status_code
+    else:
+        return {"message": "No matching student found"}, 404
+
+def decode_face_chip(chip_bytes):
+    """
+    Validate a client-cropped face chip and decode it to RGB.
+    Format and size are read from the header before any pixel is decoded.
+    Returns (image, None) or (None, error message).
+    """
+    try:
+        header = Image.open(BytesIO(chip_bytes))
+    except Exception:
+        return None, f"Face chip must be one of {', '.join(FACE_CHIP_FORMATS)}"
+    if header.format not in FACE_CHIP_FORMATS:
+        return None, f"Face chip must be one of {', '.join(FACE_CHIP_FORMATS)}, got {header.format}"
+    if header.size != (FACENET_INPUT_SIZE, FACENET_INPUT_SIZE):
+        return None, f"Face chip must be {FACENET_INPUT_SIZE}x{FACENET_INPUT_SIZE}, got {header.size[0]}x{header.size[1]}"
+    
+    img = cv2.imdecode(np.frombuffer(chip_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None, "Failed to decode face chip"
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), None
+
+def get_chip_embedding(chip_rgb):
+    """Facenet embedding of an aligned chip, no detection (live frames, so not cached)"""
+    return [float(x) for x in embed_face_chips([chip_rgb])[0]]
+
+@app.route('/api/mark-attendance-chip', methods=['POST'])
+@admission_controlled
+def mark_attendance_chip():
+    """Attendance from a 160x160 face chip cropped and aligned on the kiosk"""
+    if not current_lecture:
+        return jsonify({"message": "No active lecture. Please ask teacher to start a lecture first."}), 400
+    
+    # Larger bodies are refused with 413 before they are read
+    request.max_content_length = FACE_CHIP_MAX_BYTES
+    # Raw multipart upload, or the same base64 data URL shape as /api/mark-attendance
+    if 'chip' in request.files:
+        chip_bytes = request.files['chip'].read()
+    else:
+        chip_b64 = (request.get_json(silent=True) or {}).get("chip")
+        if not chip_b64:
+            return jsonify({"message": "No face chip provided"}), 400
+        try:
+            chip_bytes = base64.b64decode(chip_b64.split(',')[-1])
+        except Exception as e:
+            return jsonify({"message": f"Invalid face chip encoding: {e}"}), 400
+    
+    chip_rgb, error = decode_face_chip(chip_bytes)
+    if error:
+        return jsonify({"message": error}), 400
+    
+    try:
+        captured_embedding = get_chip_embedding(chip_rgb)
+    except Exception as e:
+        print(f"Face chip embedding error: {e}")
+        return jsonify({"message": f"Failed to embed face chip: {e}"}), 400
+    
+    # The kiosk only sends a chip when its own detector found a face
+    body, status_code = match_face_attendance(captured_embedding)
+    body["next_capture_ms"] = recommended_capture_delay(True, body.get("action"))
+    return jsonify(body), status_code
+
+@app.route('/api/verify-attendance', methods=['POST'])
+@admission_controlled
+def verify_attendance():
+    """1:1 attendance for kiosks with a roll-number keypad or ID card reader"""
+    if not current_lecture:
+        return jsonify({"message": "No active lecture. Please ask teacher to start a lecture first."}), 400
+    
+    data = request.json
+    roll_no = data.get("rollNo")
+    image_b64 = data.get("image")
+    if not roll_no or not image_b64:
+        return jsonify({"message": "Roll number and image are required"}), 400
+    
+    # Only the claimed student's templates are needed, whatever the roster size
+    student = students_col.find_one(
+        {"rollNo": roll_no},
+        {"_id": 0, "rollNo": 1, "name": 1, "embeddings": 1}
+    )
+    if not student:
+        return jsonify({"message": f"Student with roll number {roll_no} not found"}), 404
+    if not student.get('embeddings'):
+        return jsonify({"message": f"No face enrolled for roll number {roll_no}"}), 400
+
     try:
         captured_embedding = get_embedding_from_base64(image_b64)
     except Exception as e:
         print(f"Face detection error: {e}")
         return jsonify({"message": f"Face not detected: {e}"}), 400
+    
+    dist = claimed_distance(student['embeddings'], captured_embedding, metric=FACE_MATCH_METRIC)
+    recognition_completed()
+    print(f"DEBUG: Verification for {roll_no}: distance {dist:.4f} (threshold {ATTENDANCE_MATCH_THRESHOLD})")
+    
+    if dist >= ATTENDANCE_MATCH_THRESHOLD:
+        # A completed check with a negative answer, not an auth failure (401 would log the kiosk out)
+        return jsonify({"message": f"Face does not match roll number {roll_no}", "verified": False}), 200
+    
+    body, status_code = record_face_attendance(student)
+    body["verified"] = True
+    return jsonify(body), status_code
 
-    # Find all students and compare embeddings
-    students = list(students_col.find({}))
-    min_dist = float('inf')
-    matched_student = None
-    for student in students:
-        for emb in student.get('embeddings', []):
-            dist = np.linalg.norm(np.array(captured_embedding) - np.array(emb))
-            if dist < min_dist:
-                min_dist = dist
-                matched_student = student
-
-    # Set a threshold for matching (tune as needed)
-    threshold = 15  # Increased threshold for more tolerant matching
-    if matched_student and min_dist < threshold:
-        roll_no = matched_student['rollNo']
-        
-        # Check if student is already present in this lecture (either method)
-        existing_attendance = attendance_col.find_one({
-            "rollNo": roll_no,
-            "lectureNumber": current_lecture["lectureNumber"],
-            "date": current_lecture["date"],
-            "subject": current_lecture.get("subject", "Unknown")
+@app.route('/api/photo-attendance', methods=['POST'])
+def photo_attendance():
+    """
+    Mark the active lecture from one or more high-resolution classroom photos.
+    Tiled detection takes one of the PHOTO_ATTENDANCE_MAX_CONCURRENCY photo
+    slots, never a kiosk recognition slot, so uploads cannot starve the
+    kiosks; when every photo slot is busy the upload is refused with 503.
+    Very large batches belong in offline_attendance.py.
+    """
+    if not current_lecture:
+        return jsonify({"message": "No active lecture. Please start a lecture first."}), 400
+    
+    if not photo_attendance_slots.acquire(blocking=False):
+        print(f"DEBUG: Photo attendance busy, retry after {PHOTO_ATTENDANCE_RETRY_AFTER}s")
+        response = jsonify({
+            "message": "Another photo attendance job is running, please try again shortly",
+            "retry_after": PHOTO_ATTENDANCE_RETRY_AFTER
         })
+        response.headers['Retry-After'] = str(PHOTO_ATTENDANCE_RETRY_AFTER)
+        return response, 503
+    
+    try:
+        # Full-resolution phone photos are well above the 5MB kiosk limit
+        request.max_content_length = PHOTO_ATTENDANCE_MAX_BYTES
+        files = request.files.getlist('photos')
+        if not files:
+            return jsonify({"message": "No photos uploaded"}), 400
+        
+        images = []
+        for file in files:
+            img = cv2.imdecode(np.frombuffer(file.read(), np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                return jsonify({"message": f"Could not decode image {file.filename}"}), 400
+            images.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        
+        roster = lecture_roster(current_lecture)
+        gallery = get_roster_gallery(roster)
+        matches, report = run_photo_attendance(images, gallery, ATTENDANCE_MATCH_THRESHOLD)
+        outcomes = bulk_mark_face_attendance(matches, current_lecture)
+        
+        response = {
+            "message": f"Recognised {len(matches)} student(s) from {len(images)} photo(s)",
+            "lecture": current_lecture,
+            "results": outcomes,
+            "report": report
+        }
+        # Without a roster the gallery is every enrolled student, most of whom were never expected here
+        if roster:
+            matched = {m['rollNo'] for m in matches}
+            # A sharded gallery fetches its student list from the nodes, so read it once
+            students = gallery.students
+            response["not_found"] = [s for s in students if s['rollNo'] not in matched]
+            response["message"] = f"Recognised {len(matches)} of {len(students)} roster students from {len(images)} photo(s)"
+        return jsonify(response), 200
         
-        if existing_attendance:
-            existing_status = existing_attendance.get("status")
-            existing_method = existing_attendance.get("method", "manual")
-            
-            if existing_status == "Present":
-                return jsonify({
-                    "message": f"{matched_student['name']} is already marked present for Lecture {current_lecture['lectureNumber']} via {existing_method}"
-                }), 200
-            elif existing_status == "Absent" and existing_method == "manual":
-                # Don't override manual absent marking with face recognition
-                return jsonify({
-                    "message": f"{matched_student['name']} is manually marked absent for Lecture {current_lecture['lectureNumber']}. Cannot override with face recognition."
-                }), 400
-            else:
-                # Update existing attendance from Absent to Present (only if not manually set to absent)
-                attendance_col.update_one(
-                    {"_id": existing_attendance["_id"]},
-                    {"$set": {
-                        "status": "Present",
-                        "time": datetime.datetime.now().strftime("%H:%M:%S"),
-                        "subject": current_lecture.get("subject", "Unknown"),
-                        "method": "face_recognition"
-                    }}
-                )
-                return jsonify({
-                    "message": f"Attendance updated to Present for {matched_student['name']} (Roll: {roll_no}) - Lecture {current_lecture['lectureNumber']}"
-                }), 200
+    except Exception as e:
+        print(f"Photo attendance error: {e}")
+        return jsonify({"message": f"Failed to process photos: {str(e)}"}), 500
+    finally:
+        photo_attendance_slots.release()
+
+@app.route('/api/admin/face-gallery-stats', methods=['GET'])
+@jwt_required()
+def get_face_gallery_stats():
+    """Report the size and representation of the in-memory face gallery"""
+    try:
+        # Verify admin access
+        if not verify_admin():
+            return jsonify({"message": "Admin access required"}), 403
         
-        # Mark attendance
-        attendance_record = {
-            "rollNo": roll_no,
-            "name": matched_student['name'],
-            "lectureNumber": current_lecture["lectureNumber"],
-            "date": current_lecture["date"],
-            "subject": current_lecture.get("subject", "Unknown"),
-            "time": datetime.datetime.now().strftime("%H:%M:%S"),
-            "status": "Present",
-            "method": "face_recognition"
-        }
-        attendance_col.insert_one(attendance_record)
+        gallery = get_face_gallery()
+        stats = gallery.memory_usage()
+        stats["built_at"] = datetime.datetime.fromtimestamp(gallery.built_at).isoformat()
+        stats["match_threshold"] = ATTENDANCE_MATCH_THRESHOLD
+        stats["roster_cache"] = roster_galleries.stats()
+        return jsonify(stats), 200
         
-        # Add to lecture attendees
-        lectures_col.update_one(
-            {"_id": ObjectId(current_lecture["_id"])},
-            {"$addToSet": {"attendees": roll_no}}
-        )
+    except Exception as e:
+        return jsonify({"message": f"Failed to get gallery stats: {str(e)}"}), 500
+
+@app.route('/api/admin/embedding-cache-stats', methods=['GET'])
+@jwt_required()
+def get_embedding_cache_stats():
+    """Report hit rate and size of the embedding cache"""
+    try:
+        # Verify admin access
+        if not verify_admin():
+            return jsonify({"message": "Admin access required"}), 403
         
-        return jsonify({"message": f"Attendance marked for {matched_student['name']} (Roll: {roll_no}) - Lecture {current_lecture['lectureNumber']}"}), 200
-    else:
-        return jsonify({"message": "No matching student found"}), 404
+        if embedding_cache is None:
+            return jsonify({"enabled": False}), 200
+        stats = embedding_cache.stats()
+        stats["enabled"] = True
+        stats["pipeline_version"] = EMBEDDING_PIPELINE_VERSION
+        return jsonify(stats), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Failed to get embedding cache stats: {str(e)}"}), 500
+
+@app.route('/api/admin/leave-index-stats', methods=['GET'])
+@jwt_required()
+def get_leave_index_stats():
+    """Report the size and age of this worker's approved leave index"""
+    try:
+        # Verify admin access
+        if not verify_admin():
+            return jsonify({"message": "Admin access required"}), 403
+        
+        return jsonify(approved_leaves.stats()), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Failed to get leave index stats: {str(e)}"}), 500
+
+@app.route('/api/admin/recognition-load', methods=['GET'])
+@jwt_required()
+def get_recognition_load():
+    """Queue wait, service time and shed counts of the recognition path (this worker)"""
+    try:
+        # Verify admin access
+        if not verify_admin():
+            return jsonify({"message": "Admin access required"}), 403
+        
+        load = recognition_admission.stats()
+        load["write_behind"] = attendance_buffer.stats() if attendance_buffer is not None else None
+        return jsonify(load), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Failed to get recognition load: {str(e)}"}), 500
+
+@app.route('/api/admin/calibrate-thresholds', methods=['GET'])
+@jwt_required()
+def calibrate_match_thresholds():
+    """Suggest cosine thresholds that accept as many impostors as the current L2 ones"""
+    try:
+        # Verify admin access
+        if not verify_admin():
+            return jsonify({"message": "Admin access required"}), 403
+        
+        students = list(students_col.find({}, {"_id": 0, "rollNo": 1, "embeddings": 1}))
+        attendance = calibrate_threshold(students, MATCH_THRESHOLDS["euclidean"]["attendance"], metric='cosine')
+        enrollment = calibrate_threshold(students, MATCH_THRESHOLDS["euclidean"]["enrollment"], metric='cosine')
+        
+        if attendance is None:
+            return jsonify({"message": "At least two students with face embeddings are needed to calibrate"}), 400
+        
+        return jsonify({
+            "current_metric": FACE_MATCH_METRIC,
+            "attendance": attendance,
+            "enrollment": enrollment
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Failed to calibrate thresholds: {str(e)}"}), 500
 
 @app.route('/api/attendance-records', methods=['GET'])
 def get_attendance_records():
@@ -1705,68 +2479,89 @@ def mark_manual_attendance():
         if not student_ids or not lecture_number or not date:
             return jsonify({"success": False, "error": "Missing required fields"}), 400
         
+        lecture_number = int(lecture_number)  # Ensure integer comparison
+        subject = lecture_subject(lecture_number, date, data.get('subject'))
+        now = datetime.datetime.now().strftime('%H:%M:%S')
+        
+        # Two round trips for the whole roster instead of one per student
+        students = {
+            s["rollNo"]: s
+            for s in students_col.find({"rollNo": {"$in": student_ids}}, {"_id": 0, "rollNo": 1, "name": 1})
+        }
+        existing = {}
+        for record in attendance_col.find({"rollNo": {"$in": list(students)}, "date": date, "lectureNumber": lecture_number, "subject": subject}):
+            existing.setdefault(record["rollNo"], record)
+        
         results = []
+        operations = []
+        operation_results = []  # results index of each operation, for reporting write errors
         
         for student_id in student_ids:
-            # Get student details
-            student = students_col.find_one({"rollNo": student_id})
+            student = students.get(student_id)
             if not student:
                 results.append({"studentId": student_id, "success": False, "error": "Student not found"})
                 continue
             
-            # Check if attendance already exists
-            existing_attendance = attendance_col.find_one({
-                "rollNo": student_id,
-                "date": date,
-                "lectureNumber": int(lecture_number)  # Ensure integer comparison
-            })
-            
+            # Absent on a day of approved medical leave is recorded as ML
+            student_status = leave_adjusted_status(student_id, date, status)
+            existing_attendance = existing.get(student_id)
             if existing_attendance:
                 existing_status = existing_attendance.get('status')
                 existing_method = existing_attendance.get('method', 'manual')
                 
                 # Allow manual override but provide informative feedback
-                if status == existing_status:
+                if student_status == existing_status:
                     results.append({
                         "studentId": student_id, 
                         "success": False, 
                         "action": "already_marked", 
-                        "message": f"Already marked {status} via {existing_method}",
+                        "message": f"Already marked {student_status} via {existing_method}",
                         "currentStatus": existing_status,
                         "currentMethod": existing_method
                     })
-                else:
-                    # Update existing attendance with manual override
-                    update_message = f"Updated from {existing_status} ({existing_method}) to {status} (manual)"
-                    attendance_col.update_one(
-                        {"_id": existing_attendance["_id"]},
-                        {"$set": {
-                            "status": status,
-                            "time": datetime.datetime.now().strftime('%H:%M:%S'),
-                            "method": "manual"
-                        }}
-                    )
-                    results.append({
-                        "studentId": student_id, 
-                        "success": True, 
-                        "action": "updated",
-                        "message": update_message,
-                        "previousStatus": existing_status,
-                        "previousMethod": existing_method
-                    })
+                    continue
+                # Update existing attendance with manual override
+                operations.append(UpdateOne(
+                    {"_id": existing_attendance["_id"]},
+                    {"$set": {"status": student_status, "time": now, "method": "manual"}}
+                ))
+                results.append({
+                    "studentId": student_id, 
+                    "success": True, 
+                    "action": "updated",
+                    "message": f"Updated from {existing_status} ({existing_method}) to {student_status} (manual)",
+                    "previousStatus": existing_status,
+                    "previousMethod": existing_method
+                })
             else:
                 # Create new attendance record
                 attendance_record = {
                     "name": student.get("name", "Unknown"),
                     "rollNo": student_id,
-                    "lectureNumber": int(lecture_number),  # Ensure integer type
+                    "lectureNumber": lecture_number,
                     "date": date,
-                    "time": datetime.datetime.now().strftime('%H:%M:%S'),
-                    "status": status,
+                    "subject": subject,
+                    "time": now,
+                    "status": student_status,
                     "method": "manual"
                 }
-                attendance_col.insert_one(attendance_record)
+                operations.append(InsertOne(attendance_record))
                 results.append({"studentId": student_id, "success": True, "action": "created"})
+                existing_attendance = attendance_record
+            operation_results.append(len(results) - 1)
+            # A repeated id later in the request sees this write, as it would have one at a time
+            existing[student_id] = dict(existing_attendance, status=student_status, method="manual")
+        
+        if operations:
+            try:
+                attendance_col.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: every other write was applied, report the failed ones per student
+                for error in e.details.get("writeErrors", []):
+                    result = results[operation_results[error["index"]]]
+                    results[operation_results[error["index"]]] = {
+                        "studentId": result["studentId"], "success": False, "error": error.get("errmsg", "Write failed")
+                    }
         
         return jsonify({
             "success": True,
@@ -1777,9 +2572,209 @@ def mark_manual_attendance():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def clean_attendance_sheet(df):
+    """
+    Validate and normalize an uploaded attendance sheet with column operations.
+    Returns (df, error message or None).
+    """
+    required_columns = ['Roll No.', 'Name', 'Attendance']
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        return df, f"Missing required columns: {', '.join(missing_columns)}. Required columns are: {', '.join(required_columns)}"
+    
+    df = df.dropna(subset=['Roll No.', 'Attendance'])  # Remove rows with missing roll no or attendance
+    df = df.assign(**{
+        'Roll No.': df['Roll No.'].astype(str).str.strip(),
+        'Name': df['Name'].where(df['Name'].notna(), 'Unknown').astype(str).str.strip(),
+        'Attendance': df['Attendance'].astype(str).str.strip().str.upper()
+    })
+    
+    # Validate attendance values
+    invalid_attendance = df[~df['Attendance'].isin(['P', 'A'])]
+    if not invalid_attendance.empty:
+        return df, f"Invalid attendance values found. Use 'P' for Present or 'A' for Absent. Invalid rows: {invalid_attendance.index.tolist()}"
+    return df, None
+
+def _worksheet_chunks(worksheet, chunk_size):
+    """DataFrames of at most chunk_size rows from an openpyxl read-only worksheet"""
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None) or ()
+    columns = [str(value) if value is not None else f"Unnamed: {i}" for i, value in enumerate(header)]
+    width = len(columns)
+    chunk = []
+    yielded = False
+    for position, row in enumerate(rows):
+        if all(value is None for value in row):
+            continue  # Blank and formatted-but-empty rows
+        chunk.append((position, list(row[:width]) + [None] * (width - len(row))))
+        if len(chunk) == chunk_size:
+            yield pd.DataFrame([r for _, r in chunk], columns=columns, index=[p for p, _ in chunk])
+            yielded = True
+            chunk = []
+    if chunk or not yielded:
+        yield pd.DataFrame([r for _, r in chunk], columns=columns, index=[p for p, _ in chunk])
+
+def iter_sheet_chunks(stream, filename, chunk_size, all_sheets=False):
+    """
+    (sheet name, DataFrame of at most chunk_size rows) from an uploaded sheet,
+    without loading the whole sheet: CSV through pandas' chunked reader, .xlsx
+    through openpyxl read-only mode. Legacy .xls has no streaming reader and
+    is read in one piece. Only the first (active) sheet unless all_sheets.
+    Index values are data row positions, as pd.read_excel gives.
+    """
+    name = filename.lower()
+    stream.seek(0)
+    if name.endswith('.csv'):
+        for chunk in pd.read_csv(stream, chunksize=chunk_size, dtype=str):
+            yield None, chunk
+        return
+    if name.endswith('.xls'):
+        sheets = pd.read_excel(stream, sheet_name=None if all_sheets else 0)
+        for sheet_name, df in (sheets.items() if all_sheets else [(None, sheets)]):
+            for start in range(0, max(len(df), 1), chunk_size):
+                yield sheet_name, df.iloc[start:start + chunk_size]
+        return
+    
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for worksheet in (workbook.worksheets if all_sheets else [workbook.active]):
+            for chunk in _worksheet_chunks(worksheet, chunk_size):
+                yield worksheet.title, chunk
+    finally:
+        workbook.close()
+
+def fetch_import_students(roll_nos):
+    """rollNo -> student (name only) for the roll numbers of an import, one $in read"""
+    return {
+        s["rollNo"]: s
+        for s in students_col.find({"rollNo": {"$in": list(roll_nos)}}, {"_id": 0, "rollNo": 1, "name": 1})
+    }
+
+def import_attendance_rows(rows, lecture_number, date, subject=None, students=None):
+    """
+    Write one batch of validated sheet rows for a lecture: one $in read of the
+    students (unless already fetched), one of their existing records and one
+    unordered bulk_write. Returns the per-row results in sheet order.
+    """
+    if students is None:
+        students = fetch_import_students(rows['Roll No.'].unique().tolist())
+    subject = lecture_subject(lecture_number, date, subject)
+    lecture_filter = {"lectureNumber": lecture_number, "date": date, "subject": subject}
+    existing = {}
+    roll_nos = [roll_no for roll_no in rows['Roll No.'].unique().tolist() if roll_no in students]
+    for record in attendance_col.find(dict(lecture_filter, rollNo={"$in": roll_nos})):
+        existing.setdefault(record["rollNo"], record)
+    
+    now = datetime.datetime.now().strftime('%H:%M:%S')
+    results = []
+    operations = []
+    operation_rows = []  # results indexes written by each operation
+    pending = {}  # rollNo -> (fields written for it, operation index); a later row for the student edits them
+    for roll_no, student_name, mark in zip(rows['Roll No.'], rows['Name'], rows['Attendance']):
+        student = students.get(roll_no)
+        if not student:
+            results.append({
+                "rollNo": roll_no,
+                "name": student_name,
+                "success": False,
+                "message": f"Student with Roll No. {roll_no} not found in database"
+            })
+            continue
+        # Absent on a day of approved medical leave is recorded as ML
+        attendance_status = leave_adjusted_status(roll_no, date, 'present' if mark == 'P' else 'absent')
+        
+        if roll_no in pending:
+            # Same outcome as writing the rows one by one: the last row for a student wins
+            fields, operation_index = pending[roll_no]
+            fields["status"] = attendance_status
+            message = f"Updated attendance to {attendance_status}"
+        elif roll_no in existing:
+            fields = {"status": attendance_status, "time": now, "method": "bulk_upload"}
+            operation_index = len(operations)
+            operations.append(UpdateOne({"_id": existing[roll_no]["_id"]}, {"$set": fields}))
+            operation_rows.append([])
+            message = f"Updated attendance to {attendance_status}"
+        else:
+            fields = {
+                "name": student.get("name", student_name),
+                "rollNo": roll_no,
+                "lectureNumber": lecture_number,
+                "date": date,
+                "subject": subject,
+                "time": now,
+                "status": attendance_status,
+                "method": "bulk_upload"
+            }
+            operation_index = len(operations)
+            operations.append(InsertOne(fields))
+            operation_rows.append([])
+            message = f"Marked {attendance_status}"
+        pending[roll_no] = (fields, operation_index)
+        operation_rows[operation_index].append(len(results))
+        results.append({"rollNo": roll_no, "name": student_name, "success": True, "message": message})
+    
+    if operations:
+        try:
+            attendance_col.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: every other write was applied, report the failed rows
+            for error in e.details.get("writeErrors", []):
+                for row in operation_rows[error["index"]]:
+                    results[row].update(success=False, message=f"Error processing row: {error.get('errmsg', 'write failed')}")
+    return results
+
+WORKBOOK_SHEET_NAME_FORMAT = "L<lecture number>_<YYYY-MM-DD>[_<subject>]"
+
+def clean_lecture_columns(df, sheet_name):
+    """
+    Add normalized lectureNumber/date/subject columns to validated sheet rows,
+    from 'Lecture No.', 'Date' and optional 'Subject' columns or else from the
+    sheet name (WORKBOOK_SHEET_NAME_FORMAT). Returns (df, error message or None).
+    """
+    where = f"Sheet '{sheet_name}'" if sheet_name else "The file"
+    if 'Lecture No.' in df.columns and 'Date' in df.columns:
+        lecture_numbers = pd.to_numeric(df['Lecture No.'], errors='coerce')
+        dates = pd.to_datetime(df['Date'], errors='coerce')
+        subjects = df['Subject'] if 'Subject' in df.columns else pd.Series('', index=df.index)
+    else:
+        match = re.match(r'^L?(\d+)_(\d{4}-\d{2}-\d{2})(?:_(.+))?$', str(sheet_name or '').strip())
+        if not match:
+            return df, f"{where} needs 'Lecture No.' and 'Date' columns or a name like {WORKBOOK_SHEET_NAME_FORMAT}"
+        lecture_numbers = pd.Series(int(match.group(1)), index=df.index)
+        dates = pd.Series(pd.to_datetime(match.group(2), errors='coerce'), index=df.index)
+        subjects = pd.Series(match.group(3) or '', index=df.index)
+    
+    invalid = df[lecture_numbers.isna() | (lecture_numbers % 1 != 0) | dates.isna()]
+    if not invalid.empty:
+        return df, f"{where} has missing or invalid lecture numbers or dates in rows: {invalid.index.tolist()}"
+    return df.assign(
+        lectureNumber=lecture_numbers.astype(int),
+        date=dates.dt.strftime('%Y-%m-%d'),
+        subject=subjects.where(subjects.notna(), '').astype(str).str.strip()
+    ), None
+
+def bulk_import_report(successful_count, result_count, total_rows):
+    """Totals of a sheet import (the per-row results are added by the caller)"""
+    return {
+        "success": True,
+        "message": f"Excel attendance processed. {successful_count} out of {result_count} records processed successfully.",
+        "processed": successful_count,
+        "successful": successful_count,
+        "total_rows": total_rows
+    }
+
 @app.route('/api/bulk-attendance', methods=['POST'])
 def bulk_attendance_upload():
+    """
+    Import an attendance sheet (.xlsx, .xls or .csv) for one lecture, reading
+    and writing it BULK_IMPORT_BATCH_SIZE rows at a time. With form field
+    stream=1 the response is NDJSON: one progress line per batch carrying that
+    batch's row results, then the totals with "event": "done".
+    """
     try:
+        # Large sheets are streamed from the spooled upload, not held in memory
+        request.max_content_length = BULK_IMPORT_MAX_BYTES
+        
         # Check if file is provided
         if 'file' not in request.files:
             return jsonify({"error": "No file uploaded"}), 400
@@ -1794,117 +2789,128 @@ def bulk_attendance_upload():
         
         if not lecture_number or not date:
             return jsonify({"error": "Missing lectureNumber or date"}), 400
+        try:
+            lecture_number = int(lecture_number)
+        except ValueError:
+            return jsonify({"error": "lectureNumber must be a number"}), 400
+        subject = lecture_subject(lecture_number, date, request.form.get('subject'))
         
-        # Read Excel file
+        # Validation pass, one chunk at a time: a malformed sheet writes nothing
         try:
-            # Read the Excel file into a pandas DataFrame
-            df = pd.read_excel(BytesIO(file.read()))
-            
-            # Validate required columns
-            required_columns = ['Roll No.', 'Name', 'Attendance']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({
-                    "error": f"Missing required columns: {', '.join(missing_columns)}. Required columns are: {', '.join(required_columns)}"
-                }), 400
-            
-            # Clean and validate data
-            df = df.dropna(subset=['Roll No.', 'Attendance'])  # Remove rows with missing roll no or attendance
-            df['Roll No.'] = df['Roll No.'].astype(str)  # Ensure roll numbers are strings
-            df['Attendance'] = df['Attendance'].str.upper()  # Convert to uppercase
-            
-            # Validate attendance values
-            valid_attendance_values = ['P', 'A']
-            invalid_attendance = df[~df['Attendance'].isin(valid_attendance_values)]
-            if not invalid_attendance.empty:
-                return jsonify({
-                    "error": f"Invalid attendance values found. Use 'P' for Present or 'A' for Absent. Invalid rows: {invalid_attendance.index.tolist()}"
-                }), 400
+            total_rows = 0
+            for _, chunk in iter_sheet_chunks(file.stream, file.filename, BULK_IMPORT_BATCH_SIZE):
+                chunk, error = clean_attendance_sheet(chunk)
+                if error:
+                    return jsonify({"error": error}), 400
+                total_rows += len(chunk)
+        except Exception as e:
+            return jsonify({"error": f"Error reading Excel file: {str(e)}"}), 400
+        
+        def run_import(stream):
+            for _, chunk in iter_sheet_chunks(stream, file.filename, BULK_IMPORT_BATCH_SIZE):
+                chunk, _ = clean_attendance_sheet(chunk)
+                if len(chunk):
+                    yield import_attendance_rows(chunk, lecture_number, date, subject)
+        
+        if request.form.get('stream') == '1':
+            # The upload is closed once this view returns; keep a disk copy for the generator
+            spool = tempfile.TemporaryFile()
+            file.stream.seek(0)
+            shutil.copyfileobj(file.stream, spool)
             
+            def generate():
+                rows_done = successful_count = 0
+                try:
+                    for batch in run_import(spool):
+                        rows_done += len(batch)
+                        successful_count += len([r for r in batch if r['success']])
+                        yield json.dumps({"event": "progress", "rows_done": rows_done, "total_rows": total_rows, "results": batch}) + "\n"
+                    yield json.dumps(dict(bulk_import_report(successful_count, rows_done, total_rows), event="done")) + "\n"
+                except Exception as e:
+                    print(f"Bulk attendance import failed after {rows_done} rows: {e}")
+                    yield json.dumps({"event": "error", "success": False, "error": str(e)}) + "\n"
+                finally:
+                    spool.close()
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        results = [result for batch in run_import(file.stream) for result in batch]
+        report = bulk_import_report(len([r for r in results if r['success']]), len(results), total_rows)
+        report["results"] = results
+        return jsonify(report)
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/bulk-attendance-workbook', methods=['POST'])
+def bulk_attendance_workbook_upload():
+    """
+    Import many lectures from one workbook (.xlsx, .xls or .csv). Every sheet
+    carries its lecture in 'Lecture No.' / 'Date' / optional 'Subject' columns
+    (a sheet may then hold several lectures) or in its name, e.g.
+    L3_2025-11-18_Maths. One student prefetch for the whole workbook, then one
+    attendance prefetch and bulk_write per lecture and batch of rows.
+    """
+    try:
+        request.max_content_length = BULK_IMPORT_MAX_BYTES
+        
+        if 'file' not in request.files:
+            return jsonify({"error": "No file uploaded"}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        
+        def workbook_chunks():
+            for sheet_name, chunk in iter_sheet_chunks(file.stream, file.filename, BULK_IMPORT_BATCH_SIZE, all_sheets=True):
+                chunk, error = clean_attendance_sheet(chunk)
+                if not error:
+                    chunk, error = clean_lecture_columns(chunk, sheet_name)
+                yield sheet_name, chunk, error
+        
+        # Validation pass: a malformed sheet writes nothing; collects the roll numbers to prefetch
+        try:
+            total_rows = 0
+            roll_nos = set()
+            for sheet_name, chunk, error in workbook_chunks():
+                if error and not chunk.empty:
+                    return jsonify({"error": error}), 400
+                if not error:
+                    total_rows += len(chunk)
+                    roll_nos.update(chunk['Roll No.'].tolist())
         except Exception as e:
             return jsonify({"error": f"Error reading Excel file: {str(e)}"}), 400
         
-        # Process attendance records
+        students = fetch_import_students(roll_nos)
         results = []
-        processed_count = 0
-        
-        for index, row in df.iterrows():
-            try:
-                roll_no = str(row['Roll No.']).strip()
-                student_name = str(row['Name']).strip() if pd.notna(row['Name']) else "Unknown"
-                attendance_status = 'present' if row['Attendance'] == 'P' else 'absent'
-                
-                # Verify student exists in database
-                student = students_col.find_one({"rollNo": roll_no})
-                if not student:
-                    results.append({
-                        "rollNo": roll_no,
-                        "name": student_name,
-                        "success": False,
-                        "message": f"Student with Roll No. {roll_no} not found in database"
-                    })
-                    continue
-                
-                # Check if attendance already exists
-                existing_attendance = attendance_col.find_one({
-                    "rollNo": roll_no,
-                    "lectureNumber": int(lecture_number),
-                    "date": date
-                })
-                
-                if existing_attendance:
-                    # Update existing attendance
-                    attendance_col.update_one(
-                        {"_id": existing_attendance["_id"]},
-                        {"$set": {
-                            "status": attendance_status,
-                            "time": datetime.datetime.now().strftime('%H:%M:%S'),
-                            "method": "bulk_upload"
-                        }}
-                    )
-                    results.append({
-                        "rollNo": roll_no,
-                        "name": student_name,
-                        "success": True,
-                        "message": f"Updated attendance to {attendance_status}"
-                    })
-                else:
-                    # Create new attendance record
-                    attendance_record = {
-                        "name": student.get("name", student_name),
-                        "rollNo": roll_no,
-                        "lectureNumber": int(lecture_number),
-                        "date": date,
-                        "time": datetime.datetime.now().strftime('%H:%M:%S'),
-                        "status": attendance_status,
-                        "method": "bulk_upload"
-                    }
-                    attendance_col.insert_one(attendance_record)
-                    results.append({
-                        "rollNo": roll_no,
-                        "name": student_name,
-                        "success": True,
-                        "message": f"Marked {attendance_status}"
-                    })
-                
-                processed_count += 1
-                
-            except Exception as e:
-                results.append({
-                    "rollNo": roll_no if 'roll_no' in locals() else f"Row {index + 1}",
-                    "name": student_name if 'student_name' in locals() else "Unknown",
-                    "success": False,
-                    "message": f"Error processing row: {str(e)}"
+        lectures = {}
+        for sheet_name, chunk, error in workbook_chunks():
+            if error:
+                continue  # Empty sheet (cover page, notes)
+            chunk_results = []
+            for (lecture_number, date, subject), rows in chunk.groupby(['lectureNumber', 'date', 'subject'], sort=False):
+                # A sheet without a subject is filed where face marks for that lecture go
+                subject = lecture_subject(int(lecture_number), date, subject)
+                batch = import_attendance_rows(rows, int(lecture_number), date, subject, students=students)
+                lecture = lectures.setdefault((int(lecture_number), date, subject), {
+                    "lectureNumber": int(lecture_number), "date": date, "subject": subject,
+                    "rows": 0, "successful": 0
                 })
+                lecture["rows"] += len(batch)
+                lecture["successful"] += len([r for r in batch if r['success']])
+                for position, result in zip(rows.index, batch):
+                    result.update(sheet=sheet_name, lectureNumber=int(lecture_number), date=date, subject=subject)
+                    chunk_results.append((position, result))
+            # Report rows in sheet order, not lecture order
+            results.extend(result for _, result in sorted(chunk_results, key=lambda item: item[0]))
         
         successful_count = len([r for r in results if r['success']])
-        
         return jsonify({
             "success": True,
-            "message": f"Excel attendance processed. {successful_count} out of {len(results)} records processed successfully.",
-            "processed": processed_count,
+            "message": f"Workbook processed. {successful_count} out of {len(results)} records across {len(lectures)} lectures processed successfully.",
+            "processed": successful_count,
             "successful": successful_count,
-            "total_rows": len(df),
+            "total_rows": total_rows,
+            "lectures": list(lectures.values()),
             "results": results
         })
         
@@ -2417,6 +3423,8 @@ def update_student(student_id):
             {"rollNo": student_id},
             {"$set": update_data}
         )
+        if 'name' in update_data:
+            invalidate_face_gallery()
         
         if result.modified_count == 0 and not credentials_generated:
             return jsonify({"message": "No changes made"}), 200
@@ -2476,6 +3484,7 @@ def delete_student(student_id):
         
         # Delete student record
         student_result = students_col.delete_one({"rollNo": student_id})
+        invalidate_face_gallery()
         
         # Cascade delete: Remove all attendance records for this student
         attendance_result = attendance_col.delete_many({"rollNo": student_id})
@@ -2490,6 +3499,78 @@ def delete_student(student_id):
     except Exception as e:
         return jsonify({"message": f"Failed to delete student: {str(e)}"}), 500
 
+@app.route('/api/admin/students/<student_id>/face-templates', methods=['PUT'])
+@jwt_required()
+def update_face_templates(student_id):
+    """Append or replace individual face templates of an enrolled student"""
+    try:
+        # Verify admin access
+        if not verify_admin():
+            return jsonify({"message": "Admin access required"}), 403
+        
+        data = request.json or {}
+        images = data.get("images", [])
+        mode = data.get("mode", "append")  # append | replace
+        indices = data.get("indices")  # replace only these templates (one per image)
+        
+        if not images:
+            return jsonify({"message": "At least one image is required"}), 400
+        if mode not in ("append", "replace"):
+            return jsonify({"message": "Mode must be 'append' or 'replace'"}), 400
+        
+        student = students_col.find_one({"rollNo": student_id}, {"_id": 0, "rollNo": 1, "name": 1, "department": 1, "embeddings": 1})
+        if not student:
+            return jsonify({"message": "Student not found"}), 404
+        templates = list(student.get("embeddings") or [])
+        
+        if indices is not None:
+            if mode != "replace" or len(indices) != len(images):
+                return jsonify({"message": "indices needs mode 'replace' and one index per image"}), 400
+            if any(not isinstance(i, int) or i < 0 or i >= len(templates) for i in indices) or len(set(indices)) != len(indices):
+                return jsonify({"message": f"indices must be distinct template positions 0-{len(templates) - 1}"}), 400
+        
+        new_embeddings = []
+        for idx, img_b64 in enumerate(images):
+            try:
+                new_embeddings.append(get_embedding_from_base64(img_b64, use_cache=True))
+            except Exception as e:
+                print(f"ERROR: Template image {idx+1}: Failed to extract embedding. Error: {e}")
+                return jsonify({"message": f"No valid face detected in image {idx+1}"}), 400
+        
+        # New templates must not look like somebody else (same rule as enrollment)
+        for results in search_enrolled_faces(new_embeddings, k=2):
+            for other, dist in results:
+                if other["rollNo"] != student_id and dist < ENROLLMENT_DUPLICATE_THRESHOLD:
+                    return jsonify({
+                        "message": f"Face is very similar to student {other['name']} (Roll: {other['rollNo']}) - Distance: {dist:.2f}"
+                    }), 400
+        
+        evicted = 0
+        if indices is not None:
+            for i, emb in zip(indices, new_embeddings):
+                templates[i] = emb
+        elif mode == "replace":
+            templates = new_embeddings
+        else:
+            templates.extend(new_embeddings)
+        if len(templates) > MAX_FACE_TEMPLATES_PER_STUDENT:
+            # Oldest templates go first
+            evicted = len(templates) - MAX_FACE_TEMPLATES_PER_STUDENT
+            templates = templates[evicted:]
+        
+        students_col.update_one({"rollNo": student_id}, {"$set": {"embeddings": templates}})
+        update_face_gallery_student(student, templates)
+        
+        return jsonify({
+            "message": f"Face templates updated for {student.get('name')}",
+            "templates": len(templates),
+            "evicted": evicted,
+            "max_templates": MAX_FACE_TEMPLATES_PER_STUDENT
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Failed to update face templates: {str(e)}"}), 500
+
 @app.route('/api/admin/teachers/<teacher_id>', methods=['PUT'])
 @jwt_required()
 def update_teacher(teacher_id):
@@ -2813,7 +3894,7 @@ def add_student_with_credentials():
         if images:
             for idx, img_b64 in enumerate(images):
                 try:
-                    emb = get_embedding_from_base64(img_b64)
+                    emb = get_embedding_from_base64(img_b64, use_cache=True)
                     embeddings.append(emb)
                 except Exception as e:
                     print(f"Failed to process image {idx+1}: {e}")
@@ -2837,6 +3918,7 @@ def add_student_with_credentials():
         }
         
         result = students_col.insert_one(student_data)
+        invalidate_face_gallery()
         
         # Send credentials email
         email_sent = send_student_credentials_email(name, username, password, email)
@@ -3653,6 +4735,93 @@ def get_mentor_ml_requests():
         print(f"Get mentor ML requests error: {e}")
         return jsonify({"message": f"Failed to fetch requests: {str(e)}"}), 500
 
+def run_transaction(callback):
+    """
+    Run callback(session) in a transaction (retried by the driver on transient
+    errors). A standalone mongod has no transactions; there it runs once
+    without one.
+    """
+    with client.start_session() as session:
+        try:
+            return session.with_transaction(callback)
+        except OperationFailure as e:
+            if e.code != 20:  # IllegalOperation: transactions need a replica set
+                raise
+    return callback(None)
+
+def apply_ml_decisions(decisions, processed_by):
+    """
+    Apply mentor decisions {request ObjectId: "APPROVED" | "REJECTED"} in one
+    transaction: the status changes as one bulk_write, and for approved leaves
+    every Absent lecture in the leave's date range becomes ML with one
+    update_many per leave, whose modified_count is that leave's reported count
+    (overlapping leaves never count a lecture twice). Requests no longer
+    PENDING are skipped. Returns {request ObjectId: outcome}.
+    """
+    decided = []  # Leaves whose status this call changed, for the in-memory leave index
+    
+    def apply(session):
+        decided.clear()
+        pending = list(medical_leaves_col.find(
+            {"_id": {"$in": list(decisions)}, "status": "PENDING"},
+            {"student_rollNo": 1, "start_date": 1, "end_date": 1},
+            session=session
+        ))
+        outcomes = {request_id: {"status": None, "processed": False} for request_id in decisions}
+        if not pending:
+            return outcomes
+        
+        now = datetime.datetime.utcnow()
+        medical_leaves_col.bulk_write([
+            UpdateOne(
+                {"_id": leave["_id"], "status": "PENDING"},
+                {"$set": {"status": decisions[leave["_id"]], "updated_at": now, "processed_by": processed_by}}
+            )
+            for leave in pending
+        ], session=session)
+        
+        decided.extend(pending)
+        approved = [leave for leave in pending if decisions[leave["_id"]] == "APPROVED"]
+        for leave in pending:
+            outcomes[leave["_id"]] = {"status": decisions[leave["_id"]], "processed": True}
+        if not approved:
+            return outcomes
+        
+        leave_ranges = [
+            {"rollNo": leave["student_rollNo"], "date": {"$gte": leave["start_date"], "$lte": leave["end_date"]}}
+            for leave in approved
+        ]
+        for leave in approved:
+            start = datetime.datetime.strptime(leave["start_date"], '%Y-%m-%d')
+            end = datetime.datetime.strptime(leave["end_date"], '%Y-%m-%d')
+            outcomes[leave["_id"]].update(total_lectures_checked=0, dates_covered=(end - start).days + 1)
+        # Lectures in each range, from one read; conversions do not change these
+        for record in attendance_col.find({"$or": leave_ranges}, {"rollNo": 1, "date": 1}, session=session):
+            for leave in approved:
+                if leave["student_rollNo"] == record["rollNo"] and leave["start_date"] <= record["date"] <= leave["end_date"]:
+                    outcomes[leave["_id"]]["total_lectures_checked"] += 1
+        
+        for leave, leave_range in zip(approved, leave_ranges):
+            # ML should NOT override Present attendance
+            result = attendance_col.update_many(
+                dict(leave_range, status="Absent"),
+                {"$set": {"status": "ML", "method": "ml_approved", "updated_at": now}},
+                session=session
+            )
+            outcomes[leave["_id"]].update(
+                ml_lectures_updated=result.modified_count, total_absent_found=result.modified_count
+            )
+        return outcomes
+    
+    outcomes = run_transaction(apply)
+    # After the commit, so the index never holds an approval that was rolled back
+    for leave in decided:
+        if decisions[leave["_id"]] == "APPROVED":
+            approved_leaves.add(leave["_id"], leave["student_rollNo"], leave["start_date"], leave["end_date"])
+        else:
+            approved_leaves.remove(leave["_id"], leave["student_rollNo"])
+    return outcomes
+
 @app.route('/api/teacher/approve_ml', methods=['POST'])
 @jwt_required()
 def approve_reject_ml():
@@ -3700,83 +4869,28 @@ def approve_reject_ml():
         if ml_request.get('status') != 'PENDING':
             return jsonify({"message": f"Request already {ml_request.get('status')}"}), 400
         
-        # Update ML request status
-        medical_leaves_col.update_one(
-            {"_id": ObjectId(request_id)},
-            {
-                "$set": {
-                    "status": decision,
-                    "updated_at": datetime.datetime.utcnow(),
-                    "processed_by": teacher.get('name')
-                }
-            }
-        )
+        # Status change and attendance conversion commit together
+        outcome = apply_ml_decisions({ml_request["_id"]: decision}, teacher.get('name'))[ml_request["_id"]]
+        if not outcome["processed"]:
+            return jsonify({"message": "Request already processed"}), 400
         
-        # If APPROVED, update attendance records
         if decision == "APPROVED":
-            start_date = datetime.datetime.strptime(ml_request['start_date'], '%Y-%m-%d')
-            end_date = datetime.datetime.strptime(ml_request['end_date'], '%Y-%m-%d')
-            student_rollNo = ml_request['student_rollNo']
-            
-            # Generate list of dates in the range
-            date_list = []
-            current = start_date
-            while current <= end_date:
-                date_list.append(current.strftime('%Y-%m-%d'))
-                current += datetime.timedelta(days=1)
-            
-            # CORRECT LOGIC: Update only ABSENT lecture entries to ML
-            # Count how many actual lecture entries were updated
-            ml_lectures_updated = 0
-            total_absent_found = 0
-            total_lectures_checked = 0
-            
-            for date_str in date_list:
-                # Find ALL attendance records for this date and student
-                # There may be MULTIPLE lectures per day
-                attendance_records = list(attendance_col.find({
-                    "rollNo": student_rollNo,
-                    "date": date_str
-                }))
-                
-                total_lectures_checked += len(attendance_records)
-                
-                # Update each ABSENT lecture to ML
-                for record in attendance_records:
-                    if record.get('status') == 'Absent':
-                        total_absent_found += 1
-                        # Update this specific lecture entry from Absent to ML
-                        result = attendance_col.update_one(
-                            {"_id": record['_id']},
-                            {
-                                "$set": {
-                                    "status": "ML",
-                                    "method": "ml_approved",
-                                    "updated_at": datetime.datetime.utcnow()
-                                }
-                            }
-                        )
-                        if result.modified_count > 0:
-                            ml_lectures_updated += 1
-                    # If status is "Present", leave it as Present (do nothing)
-                    # ML should NOT override Present attendance
-            
             # Log the results for debugging
-            print(f"ML Approval for {student_rollNo}:")
+            print(f"ML Approval for {ml_request['student_rollNo']}:")
             print(f"  - Date range: {ml_request['start_date']} to {ml_request['end_date']}")
-            print(f"  - Total dates: {len(date_list)}")
-            print(f"  - Total lecture entries checked: {total_lectures_checked}")
-            print(f"  - Absent lectures found: {total_absent_found}")
-            print(f"  - ML lectures updated: {ml_lectures_updated}")
+            print(f"  - Total dates: {outcome['dates_covered']}")
+            print(f"  - Total lecture entries checked: {outcome['total_lectures_checked']}")
+            print(f"  - Absent lectures found: {outcome['total_absent_found']}")
+            print(f"  - ML lectures updated: {outcome['ml_lectures_updated']}")
             
             return jsonify({
                 "message": f"Medical leave approved successfully",
                 "status": "APPROVED",
-                "ml_lectures_updated": ml_lectures_updated,
-                "total_absent_found": total_absent_found,
-                "dates_covered": len(date_list),
-                "total_lectures_checked": total_lectures_checked,
-                "details": f"Updated {ml_lectures_updated} absent lecture(s) to ML across {len(date_list)} day(s)"
+                "ml_lectures_updated": outcome['ml_lectures_updated'],
+                "total_absent_found": outcome['total_absent_found'],
+                "dates_covered": outcome['dates_covered'],
+                "total_lectures_checked": outcome['total_lectures_checked'],
+                "details": f"Updated {outcome['ml_lectures_updated']} absent lecture(s) to ML across {outcome['dates_covered']} day(s)"
             }), 200
         else:
             return jsonify({
@@ -3788,6 +4902,111 @@ def approve_reject_ml():
         print(f"Approve/Reject ML error: {e}")
         return jsonify({"message": f"Failed to process request: {str(e)}"}), 500
 
+@app.route('/api/teacher/approve_ml_batch', methods=['POST'])
+@jwt_required()
+def approve_reject_ml_batch():
+    """
+    Mentor decides many medical leave requests at once:
+    {"decisions": [{"request_id": ..., "decision": "APPROVED" | "REJECTED"}, ...]}.
+    Ownership is checked with one query and every accepted decision commits in
+    one transaction; the response has one outcome per request.
+    """
+    try:
+        # Get current user identity from JWT
+        current_user = get_jwt_identity()
+        claims = get_jwt()
+        
+        # Verify this is a teacher
+        if claims.get('role') != 'teacher':
+            return jsonify({"message": "Access denied. Teachers only."}), 403
+        
+        # Find teacher by username
+        teacher = teachers_col.find_one({"username": current_user}, {"_id": 1, "name": 1})
+        
+        if not teacher:
+            return jsonify({"message": "Teacher not found"}), 404
+        
+        data = request.get_json() or {}
+        items = data.get('decisions')
+        if not isinstance(items, list) or not items:
+            return jsonify({"message": "decisions must be a non-empty list of {request_id, decision}"}), 400
+        if len(items) > ML_BATCH_MAX_DECISIONS:
+            return jsonify({"message": f"At most {ML_BATCH_MAX_DECISIONS} decisions per batch, got {len(items)}"}), 400
+        
+        results = []
+        requested = {}  # ObjectId -> result entry
+        for item in items:
+            if not isinstance(item, dict):
+                results.append({"request_id": None, "decision": None, "success": False,
+                                "message": "Invalid decision entry"})
+                continue
+            request_id = str(item.get('request_id', ''))
+            decision = item.get('decision')
+            result = {"request_id": request_id, "decision": decision, "success": False}
+            results.append(result)
+            if decision not in ['APPROVED', 'REJECTED']:
+                result["message"] = "Decision must be APPROVED or REJECTED"
+                continue
+            try:
+                object_id = ObjectId(request_id)
+            except Exception:
+                result["message"] = "Invalid request ID"
+                continue
+            if object_id in requested:
+                result["message"] = "Duplicate request ID in this batch"
+                continue
+            requested[object_id] = result
+        
+        # One query checks existence, ownership and status of every request
+        leaves = {
+            leave["_id"]: leave
+            for leave in medical_leaves_col.find(
+                {"_id": {"$in": list(requested)}},
+                {"mentor_id": 1, "status": 1, "student_rollNo": 1}
+            )
+        }
+        decisions = {}
+        for object_id, result in requested.items():
+            leave = leaves.get(object_id)
+            if not leave:
+                result["message"] = "ML request not found"
+            elif leave.get('mentor_id') != str(teacher['_id']):
+                result["message"] = "You are not the mentor for this student"
+            elif leave.get('status') != 'PENDING':
+                result["message"] = f"Request already {leave.get('status')}"
+            else:
+                result["student_rollNo"] = leave.get('student_rollNo')
+                decisions[object_id] = result["decision"]
+        
+        if decisions:
+            outcomes = apply_ml_decisions(decisions, teacher.get('name'))
+            for object_id, outcome in outcomes.items():
+                result = requested[object_id]
+                if not outcome["processed"]:
+                    result["message"] = "Request already processed"
+                    continue
+                result["success"] = True
+                if outcome["status"] == "APPROVED":
+                    result["ml_lectures_updated"] = outcome["ml_lectures_updated"]
+                    result["dates_covered"] = outcome["dates_covered"]
+                    result["message"] = f"Approved; updated {outcome['ml_lectures_updated']} absent lecture(s) to ML across {outcome['dates_covered']} day(s)"
+                else:
+                    result["message"] = "Rejected"
+        
+        succeeded = [r for r in results if r["success"]]
+        print(f"ML batch by {teacher.get('name')}: {len(succeeded)}/{len(results)} decisions applied")
+        return jsonify({
+            "message": f"{len(succeeded)} of {len(results)} decisions applied",
+            "approved": len([r for r in succeeded if r["decision"] == "APPROVED"]),
+            "rejected": len([r for r in succeeded if r["decision"] == "REJECTED"]),
+            "failed": len(results) - len(succeeded),
+            "results": results
+        }), 200
+        
+    except Exception as e:
+        print(f"Batch approve/reject ML error: {e}")
+        return jsonify({"message": f"Failed to process requests: {str(e)}"}), 500
+
 @app.route('/uploads/ml_proofs/<filename>', methods=['GET'])
 @jwt_required()
 def download_ml_proof(filename):
@@ -0,0 +1,179 @@
+"""
+Write-behind buffer for face recognition attendance marks.
+
+Marks are appended (and fsynced) to a local journal, coalesced in memory by
+key and handed to `flush_fn` in one batch every `max_delay_seconds` or as soon
+as `max_records` are pending. The journal is rotated aside at each flush and
+deleted once flush_fn succeeds, so a crash loses nothing: on startup a worker
+claims the leftover journals of its own pid and of workers that are no longer
+running, and flushes those marks first. flush_fn must be idempotent (upserts on the
+attendance slot), because a replayed mark may already have been written.
+
+The journal directory is per machine; every worker writes its own
+attendance-<pid>.jsonl there.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+WRITE_BEHIND_MAX_RECORDS = 200
+WRITE_BEHIND_MAX_DELAY_SECONDS = 0.3
+
+
+def pid_alive(pid):
+    """True if a process with this pid is running on this machine"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+class AttendanceWriteBuffer:
+    """Journaled, coalescing buffer of pending marks flushed in batches by a background thread"""
+
+    def __init__(self, flush_fn, journal_dir, max_records=WRITE_BEHIND_MAX_RECORDS,
+                 max_delay_seconds=WRITE_BEHIND_MAX_DELAY_SECONDS):
+        self.flush_fn = flush_fn  # flush_fn([mark, ...]); raises to keep the marks for a retry
+        self.journal_dir = journal_dir
+        self.max_records = max_records
+        self.max_delay_seconds = max_delay_seconds
+        self.journal_path = os.path.join(journal_dir, f"attendance-{os.getpid()}.jsonl")
+        self.pending = OrderedDict()  # key -> mark, newest mark per key
+        self.flushed = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_flush_ms = None
+        self._segments = []  # Rotated journals holding marks not yet flushed
+        self._journal = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        os.makedirs(journal_dir, exist_ok=True)
+        self.recovered = self._recover()
+        self._thread = threading.Thread(target=self._run, name="attendance-write-behind", daemon=True)
+        self._thread.start()
+
+    def _recover(self):
+        """Claim leftover journals (ours from a crash, or left by workers that exited) into pending"""
+        recovered = 0
+        for name in sorted(os.listdir(self.journal_dir)):
+            if not (name.startswith('attendance-') and name.endswith('.jsonl')):
+                continue
+            owner = name[len('attendance-'):].split('.')[0]
+            if not owner.isdigit() or (int(owner) != os.getpid() and pid_alive(int(owner))):
+                continue  # A running worker's journal or segment; it still holds those marks
+            path = os.path.join(self.journal_dir, name)
+            try:
+                # Renaming first claims the file; a worker that loses the race gets FileNotFoundError
+                segment = os.path.join(self.journal_dir, f"attendance-{os.getpid()}.{time.time_ns()}.recovered.jsonl")
+                os.replace(path, segment)
+            except FileNotFoundError:
+                continue
+            with open(segment, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line of a crashed write
+                    self.pending[tuple(entry["key"])] = entry["mark"]
+                    recovered += 1
+            self._segments.append(segment)
+        if recovered:
+            print(f"📒 Recovered {recovered} journaled attendance marks")
+        return recovered
+
+    def add(self, key, mark):
+        """Journal and queue a mark; returns once it is durable on local disk"""
+        line = json.dumps({"key": list(key), "mark": mark}) + "\n"
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self.pending.pop(key, None)
+            self.pending[key] = mark
+            full = len(self.pending) >= self.max_records
+        if full:
+            self._wake.set()
+
+    def get(self, key):
+        """The pending (not yet flushed) mark for key, if any"""
+        with self._lock:
+            return self.pending.get(key)
+
+    def flush(self):
+        """Write every pending mark now; returns how many were flushed"""
+        with self._flush_lock:
+            with self._lock:
+                if not self.pending:
+                    return 0
+                batch = self.pending
+                self.pending = OrderedDict()
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                    segment = os.path.join(self.journal_dir, f"attendance-{os.getpid()}.{time.time_ns()}.flushing.jsonl")
+                    os.replace(self.journal_path, segment)
+                    self._segments.append(segment)
+                segments = self._segments
+                self._segments = []
+
+            start = time.perf_counter()
+            try:
+                self.flush_fn(list(batch.values()))
+            except Exception:
+                with self._lock:
+                    # Keep the marks and their journals; marks queued meanwhile are newer and win
+                    batch.update(self.pending)
+                    self.pending = batch
+                    self._segments = segments + self._segments
+                    self.failures += 1
+                raise
+
+            for segment in segments:
+                try:
+                    os.remove(segment)
+                except FileNotFoundError:
+                    pass  # The marks are written; a missing journal is nothing to undo
+            with self._lock:
+                self.flushed += len(batch)
+                self.flushes += 1
+                self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+            return len(batch)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.max_delay_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  Attendance write-behind flush failed, will retry: {e}")
+                time.sleep(min(self.max_delay_seconds * 10, 5))
+
+    def close(self):
+        """Stop the flusher and write what is pending (at exit)"""
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self.pending),
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "recovered": self.recovered,
+                "last_flush_ms": self.last_flush_ms,
+                "max_records": self.max_records,
+                "max_delay_ms": round(self.max_delay_seconds * 1000)
+            }
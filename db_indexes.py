@@ -0,0 +1,172 @@
+"""
+Declared MongoDB indexes for every hot query in app.py.
+
+ensure_indexes() creates them idempotently (create_index is a no-op when an
+identical index exists) and is called at app startup; the same declarations
+back the migration command:
+
+    python db_indexes.py migrate            # create missing indexes, report duplicates
+    python db_indexes.py migrate --dedupe   # also remove duplicate attendance records first
+    python db_indexes.py explain            # winning plan of every hot query
+
+The unique attendance index makes a second record for the same
+(rollNo, lectureNumber, date, subject) impossible. It cannot be built while
+duplicates exist; `migrate --dedupe` keeps one record per slot (a manual
+record if there is one, since a teacher's decision wins, otherwise a Present
+one, otherwise the oldest) and deletes the others.
+"""
+import argparse
+
+from pymongo import ASCENDING, DESCENDING, DeleteOne
+from pymongo.errors import OperationFailure
+
+ATTENDANCE_SLOT = ["rollNo", "lectureNumber", "date", "subject"]
+
+INDEXES = {
+    "attendance": [
+        ([(field, ASCENDING) for field in ATTENDANCE_SLOT], {"name": "attendance_slot_unique", "unique": True}),
+        ([("rollNo", ASCENDING), ("date", ASCENDING)], {"name": "attendance_roll_date"}),
+        ([("lectureNumber", ASCENDING), ("date", ASCENDING)], {"name": "attendance_lecture_date"}),
+    ],
+    "students": [
+        ([("rollNo", ASCENDING)], {"name": "students_roll_no"}),
+        ([("username", ASCENDING)], {"name": "students_username"}),
+        ([("email", ASCENDING)], {"name": "students_email"}),
+        ([("password_hash", ASCENDING)], {"name": "students_password_hash"}),
+        ([("department", ASCENDING), ("batch", ASCENDING), ("group", ASCENDING)], {"name": "students_roster"}),
+    ],
+    "teachers": [
+        ([("username", ASCENDING)], {"name": "teachers_username"}),
+        ([("password_hash", ASCENDING)], {"name": "teachers_password_hash"}),
+        ([("email", ASCENDING)], {"name": "teachers_email"}),
+    ],
+    "medical_leaves": [
+        ([("mentor_id", ASCENDING), ("applied_at", DESCENDING)], {"name": "medical_leaves_mentor"}),
+        ([("student_rollNo", ASCENDING), ("applied_at", DESCENDING)], {"name": "medical_leaves_student"}),
+    ],
+    "lectures": [
+        ([("lectureNumber", ASCENDING), ("date", ASCENDING), ("subject", ASCENDING)], {"name": "lectures_slot"}),
+    ],
+    "users": [
+        ([("email", ASCENDING)], {"name": "users_email"}),
+    ],
+    "mentor_assignments": [
+        ([("mentor_teacher_id", ASCENDING)], {"name": "mentor_assignments_mentor"}),
+        ([("batch", ASCENDING), ("group", ASCENDING)], {"name": "mentor_assignments_batch_group"}),
+    ],
+}
+
+# (collection, filter, sort) of the lookups the indexes above are for; explain() checks them
+HOT_QUERIES = {
+    "attendance_slot": ("attendance", {"rollNo": "R1", "lectureNumber": 1, "date": "2025-01-01", "subject": "S"}, None),
+    "attendance_student_day": ("attendance", {"rollNo": "R1", "date": "2025-01-01"}, None),
+    "attendance_lecture": ("attendance", {"lectureNumber": 1, "date": "2025-01-01"}, None),
+    "student_roll_no": ("students", {"rollNo": "R1"}, None),
+    "student_username": ("students", {"username": "K1"}, None),
+    "student_email": ("students", {"email": "a@b.c"}, None),
+    "student_password_hash": ("students", {"password_hash": "x"}, None),
+    "teacher_username": ("teachers", {"username": "K1"}, None),
+    "teacher_password_hash": ("teachers", {"password_hash": "x"}, None),
+    "mentor_leaves": ("medical_leaves", {"mentor_id": "m"}, [("applied_at", DESCENDING)]),
+    "student_leaves": ("medical_leaves", {"student_rollNo": "R1"}, [("applied_at", DESCENDING)]),
+}
+
+
+def find_duplicate_attendance(db, limit=None):
+    """Groups of attendance records sharing one (rollNo, lectureNumber, date, subject) slot"""
+    pipeline = [
+        # The unique index files a missing field under null; group the same way
+        {"$group": {"_id": {field: {"$ifNull": [f"${field}", None]} for field in ATTENDANCE_SLOT},
+                    "records": {"$push": {"_id": "$_id", "method": "$method", "status": "$status"}},
+                    "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return list(db["attendance"].aggregate(pipeline, allowDiskUse=True))
+
+
+def dedupe_attendance(db):
+    """Keep one record per slot (manual, else Present, else oldest); returns records deleted"""
+    deletes = []
+    for group in find_duplicate_attendance(db):
+        records = sorted(group["records"], key=lambda r: r["_id"])
+        keep = next((r for r in records if r.get("method") == "manual"), None) \
+            or next((r for r in records if r.get("status") == "Present"), None) \
+            or records[0]
+        deletes.extend(DeleteOne({"_id": r["_id"]}) for r in records if r["_id"] != keep["_id"])
+    if deletes:
+        db["attendance"].bulk_write(deletes, ordered=False)
+    return len(deletes)
+
+
+def ensure_indexes(db):
+    """
+    Create every declared index that is missing. Never raises: an index that
+    cannot be built (duplicates, conflicting options) is reported instead.
+    Returns {"created": [...], "existing": [...], "failed": {name: reason}}.
+    """
+    report = {"created": [], "existing": [], "failed": {}}
+    for collection, indexes in INDEXES.items():
+        try:
+            existing = set(db[collection].index_information())
+        except OperationFailure:
+            existing = set()
+        for keys, options in indexes:
+            name = options["name"]
+            if name in existing:
+                report["existing"].append(name)
+                continue
+            try:
+                db[collection].create_index(keys, **options)
+                report["created"].append(name)
+            except OperationFailure as e:
+                reason = getattr(e, 'details', None) or {}
+                report["failed"][name] = reason.get('errmsg', str(e))
+    return report
+
+
+def explain_hot_queries(db):
+    """{query name: winning plan stages}; a COLLSCAN anywhere means the index is missing"""
+    plans = {}
+    for name, (collection, query, sort) in HOT_QUERIES.items():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = []
+        while plan:
+            stages.append(plan.get("stage"))
+            plan = plan.get("inputStage") or plan.get("queryPlan")
+        plans[name] = stages
+    return plans
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create and verify MongoDB indexes")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help="Create missing indexes")
+    migrate_parser.add_argument('--dedupe', action='store_true',
+                                help="Delete duplicate attendance records so the unique index can be built")
+    subparsers.add_parser('explain', help="Show the winning plan of every hot query")
+    args = parser.parse_args()
+
+    from app import db
+
+    if args.command == 'migrate':
+        duplicates = find_duplicate_attendance(db, limit=20)
+        if duplicates and args.dedupe:
+            print(f"🧹 Removed {dedupe_attendance(db)} duplicate attendance records")
+        elif duplicates:
+            print("⚠️  Duplicate attendance records found (showing up to 20); rerun with --dedupe to remove them:")
+            for group in duplicates:
+                print(f"   {group['_id']} x{group['count']}")
+        report = ensure_indexes(db)
+        print(f"✅ Created: {', '.join(report['created']) or 'none'}")
+        print(f"   Already present: {len(report['existing'])}")
+        for name, reason in report["failed"].items():
+            print(f"❌ {name}: {reason}")
+    else:
+        for name, stages in explain_hot_queries(db).items():
+            mark = "❌" if "COLLSCAN" in stages else "✅"
+            print(f"{mark} {name:24s} {' <- '.join(stages)}")
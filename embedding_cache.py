@@ -0,0 +1,133 @@
+"""
+Persistent cache of face embeddings keyed by image content.
+
+The key is a SHA-256 of the decoded pixel array (shape, dtype and bytes) plus
+the embedding pipeline version, so the same photo submitted again through
+/api/enroll, the admin add-student endpoints or a retried request maps to the
+same entry whatever its base64/JPEG wrapping. The value is exactly what the
+pipeline returned (embedding floats and detected facial area, stored as JSON
+which round-trips Python floats exactly), so a hit is equivalent to
+recomputing.
+
+Entries live in a small SQLite file shared by all workers on the host, opened
+on first use. Once max_entries is exceeded the least recently used are
+evicted in one batch down to EVICT_TO_FRACTION of the limit, so a put is
+normally a single INSERT; the entry count is kept in memory and recounted
+from the file (other workers write to it too) only when evicting.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+EMBEDDING_CACHE_MAX_ENTRIES = 20000
+EVICT_TO_FRACTION = 0.9
+
+
+class EmbeddingCache:
+    """Size-bounded LRU map from image hash to (embedding, facial_area)"""
+
+    def __init__(self, path, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._entries = 0  # Approximate row count, recounted when evicting
+
+    def _connection(self):
+        """Open the SQLite file on first use (callers hold _lock)"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " embedding TEXT NOT NULL,"
+                " facial_area TEXT,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+            self._entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(img, model_version):
+        """Hash of the decoded pixels plus the pipeline that produced the embedding"""
+        digest = hashlib.sha256()
+        digest.update(model_version.encode())
+        digest.update(f"|{img.shape}|{img.dtype}|".encode())
+        digest.update(img.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Cached (embedding, facial_area) for key, or None"""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT embedding, facial_area FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+        return json.loads(row[0]), json.loads(row[1]) if row[1] else None
+
+    def put(self, key, embedding, facial_area=None):
+        """Store a freshly computed result; evict a batch of least recently used entries when full"""
+        now = time.time()
+        embedding_json = json.dumps([float(x) for x in embedding])
+        area_json = json.dumps(facial_area) if facial_area is not None else None
+        with self._lock:
+            conn = self._connection()
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO embeddings (key, embedding, facial_area, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, embedding_json, area_json, now, now)
+            ).rowcount
+            if inserted:
+                self._entries += 1
+            else:
+                conn.execute(
+                    "UPDATE embeddings SET embedding = ?, facial_area = ?, last_used = ? WHERE key = ?",
+                    (embedding_json, area_json, now, key)
+                )
+            if self._entries > self.max_entries:
+                count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                overflow = count - int(self.max_entries * EVICT_TO_FRACTION)
+                if overflow > 0 and count > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM embeddings WHERE key IN"
+                        " (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                        (overflow,)
+                    )
+                    self.evictions += overflow
+                    count -= overflow
+                self._entries = count
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
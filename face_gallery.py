@@ -0,0 +1,662 @@
+"""
+In-memory face gallery used for attendance matching.
+
+Every enrolled embedding is stacked into one float32 matrix so a captured face
+is scored against the whole gallery in a few vectorised numpy calls instead of
+one np.linalg.norm per (student, embedding) pair.
+
+With quantize=True the first pass runs on an int8 copy of the gallery
+(per-dimension scale), and only the top-K candidate rows are re-scored against
+the full-precision vectors. The distance handed back to mark_attendance() is
+always the exact L2 distance, so the threshold decision is made on exact
+numbers. The full-precision matrix can be kept on disk (np.memmap) so that
+only the int8 codes are pinned in each worker's memory: the full-precision
+pages are file-backed and the kernel can drop them under memory pressure
+instead of swapping. Each worker writes and maps its own file, so those pages
+are not shared between workers.
+
+With prune=True each student also keeps the centroid of its embeddings and the
+radius that encloses them. By the triangle inequality no embedding of a
+student can be closer to the query than ||query - centroid|| - radius, so
+students are visited in order of that lower bound and the walk stops as soon
+as the bound reaches the current k-th best distance (or the match threshold).
+Skipped students provably could not have changed the result.
+
+quantize and prune are alternative ways to avoid an exact pass over every row
+and cannot be combined. Which path a search takes (search_paths()):
+  - quantize: int8 first pass for the whole batch, exact rerank per query
+  - prune: the centroid walk for a single query; a batch of two or more
+    queries is cheaper as one exact GEMM than as one Python walk per query
+  - neither: exact GEMM
+
+With metric='cosine' embeddings are L2-normalised when they are stored in the
+gallery and distances are reported as cosine distance (1 - cosine similarity).
+search_batch() scores a whole batch of captured faces with one matrix product
+per gallery chunk, i.e. a single BLAS GEMM call for typical gallery sizes.
+Internally every mode works on L2 distance between stored vectors; for unit
+vectors ||a - b||^2 = 2 * cosine distance, so pruning and quantization apply
+unchanged and thresholds are translated at the boundary.
+
+set_student_embeddings() updates one student's templates in place: rows it
+already owns are overwritten, extra rows are appended into buffers that grow
+by doubling, and rows it no longer needs are tombstoned (their squared norm
+becomes inf, which keeps them out of every search mode) until the next full
+build. Updates hold the gallery's write lock and searches its read lock, so
+concurrent searches never see a half-written row or an owner array of the
+wrong length, while searches still run in parallel with each other.
+"""
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+EMBEDDING_DIM = 128  # Facenet embedding size
+QUANTIZED_RERANK_K = 64  # Candidate rows re-scored exactly after the int8 pass
+QUANTIZED_QUERY_BLOCK = 64  # Queries scored together in the int8 first pass (bounds its temporary matrix)
+SCAN_CHUNK_ROWS = 65536  # Rows scored per chunk to bound temporary memory
+PRUNE_SLACK = 1e-3  # Absorbs float32 rounding so the centroid bound stays a true lower bound
+METRICS = ('euclidean', 'cosine')
+
+
+class _ReadWriteLock:
+    """Many readers or one writer; a waiting writer holds off new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class FaceGallery:
+    """Flat embedding matrix plus the student that owns each row"""
+
+    def __init__(self, quantize=False, rerank_k=QUANTIZED_RERANK_K, mmap_path=None, prune=False,
+                 metric='euclidean'):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        if quantize and prune:
+            raise ValueError("quantize and prune are alternative first passes; enable at most one of them")
+        self.metric = metric
+        self.quantize = quantize
+        self.rerank_k = rerank_k
+        self.mmap_path = mmap_path
+        self.prune = prune
+        self.students = []  # [{"rollNo": ..., "name": ...}], indexed by owner id
+        self.student_rows = []  # owner id -> row indices of that student's embeddings
+        self.owner_by_roll = {}  # rollNo -> owner id
+        self.tombstoned_rows = 0
+        self.row_owner = np.zeros(0, dtype=np.int32)
+        self.centroids = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self.radii = np.zeros(0, dtype=np.float64)
+        self.last_search_stats = {}
+        self.vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self.row_sq_norms = np.zeros(0, dtype=np.float32)
+        self.codes = None
+        self.scales = None
+        self.code_sq_norms = None
+        self._vector_buffer = self.vectors  # self.vectors is a view of its first len(self) rows
+        self._code_buffer = None
+        self._lock = _ReadWriteLock()
+        self.built_at = time.time()
+
+    @classmethod
+    def from_students(cls, students, **kwargs):
+        """Build a gallery from student documents with rollNo, name and embeddings"""
+        gallery = cls(**kwargs)
+        gallery.load(students)
+        return gallery
+
+    def load(self, students):
+        rows = []
+        owners = []
+        self.students = []
+        self.student_rows = []
+        self.owner_by_roll = {}
+        self.tombstoned_rows = 0
+        for student in students:
+            embeddings = student.get('embeddings')
+            if embeddings is None or len(embeddings) == 0:
+                continue
+            owner = len(self.students)
+            self.students.append({
+                "rollNo": student.get('rollNo'),
+                "name": student.get('name', 'Unknown')
+            })
+            self.owner_by_roll[student.get('rollNo')] = owner
+            self.student_rows.append(np.arange(len(rows), len(rows) + len(embeddings)))
+            for emb in embeddings:
+                rows.append(emb)
+                owners.append(owner)
+
+        if rows:
+            vectors = self._prepare(rows)
+        else:
+            vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self.row_owner = np.asarray(owners, dtype=np.int32)
+        self.row_sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+
+        if self.quantize:
+            self._build_quantized(vectors)
+        if self.prune:
+            self._build_centroids(vectors)
+
+        self._vector_buffer = self._new_vector_buffer(len(vectors))
+        self._vector_buffer[:] = vectors
+        self.vectors = self._vector_buffer
+
+        self.built_at = time.time()
+        print(f"DEBUG: Face gallery built with {len(self.students)} students, "
+              f"{len(self.row_owner)} embeddings (metric={self.metric}, quantize={self.quantize}, prune={self.prune})")
+
+    def _new_vector_buffer(self, capacity):
+        """Storage for full-precision rows: RAM, or a memmapped .npy file when mmap_path is set"""
+        if not self.mmap_path or capacity == 0:
+            return np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        # Keep full precision in a file-backed (reclaimable) mapping. Every buffer
+        # is a fresh file swapped in with os.replace, so in-place template updates
+        # never write to a file another worker still has mapped; each worker maps
+        # its own file, nothing is shared between them.
+        tmp_path = f"{self.mmap_path}.{os.getpid()}.tmp"
+        buffer = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                           shape=(capacity, EMBEDDING_DIM))
+        os.replace(tmp_path, self.mmap_path)
+        return buffer
+
+    def _prepare(self, vectors):
+        """Map raw Facenet embeddings into the space the gallery stores them in"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.metric == 'cosine':
+            norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+        return vectors
+
+    def _to_internal(self, max_distance):
+        """Translate a threshold in the gallery metric into an L2 bound on stored vectors"""
+        if max_distance is None:
+            return np.inf
+        if self.metric == 'cosine':
+            # For unit vectors ||a - b||^2 = 2 - 2 cos(a, b) = 2 * cosine distance
+            return float(np.sqrt(2.0 * max(max_distance, 0.0)))
+        return max_distance
+
+    def _from_internal(self, dist):
+        """Report an L2 distance between stored vectors in the gallery metric"""
+        if self.metric == 'cosine':
+            return dist * dist / 2.0
+        return dist
+
+    def _build_quantized(self, vectors):
+        """Symmetric per-dimension int8 scalar quantization"""
+        if not len(vectors):
+            self.scales = np.ones(vectors.shape[1], dtype=np.float32)
+            self.codes = np.zeros((0, vectors.shape[1]), dtype=np.int8)
+            self.code_sq_norms = np.zeros(0, dtype=np.float32)
+            self._code_buffer = self.codes
+            return
+        max_abs = np.abs(vectors).max(axis=0)
+        self.scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        self.codes = np.clip(np.rint(vectors / self.scales), -127, 127).astype(np.int8)
+        dequantized = self.codes.astype(np.float32) * self.scales
+        self.code_sq_norms = np.einsum('ij,ij->i', dequantized, dequantized)
+        self.code_sq_norms[~np.isfinite(self.row_sq_norms)] = np.inf
+        self._code_buffer = self.codes
+
+    def _build_centroids(self, vectors):
+        """Per-student centroid and the radius enclosing all of its embeddings"""
+        self.centroids = np.zeros((len(self.students), vectors.shape[1]), dtype=np.float32)
+        self.radii = np.zeros(len(self.students), dtype=np.float64)
+        for owner in range(len(self.students)):
+            self._update_centroid(owner, vectors)
+
+    def _update_centroid(self, owner, vectors=None):
+        rows = self.student_rows[owner]
+        if not len(rows):
+            # Lower bound becomes inf, so pruned search never visits this student
+            self.radii[owner] = -np.inf
+            return
+        member = np.asarray((self.vectors if vectors is None else vectors)[rows], dtype=np.float64)
+        centroid = member.mean(axis=0)
+        self.centroids[owner] = centroid
+        self.radii[owner] = np.linalg.norm(member - centroid, axis=1).max()
+
+    def set_student_embeddings(self, student, embeddings):
+        """
+        Make `embeddings` the only templates of student (rollNo, name) without a
+        rebuild. Adds the student if it is new; an empty list takes it out of
+        search. Exact and pruned search then return what a rebuild would. With
+        quantize the int8 scale is only recomputed when a new template falls
+        outside it (over every row, tombstoned ones included), so the first
+        pass can nominate different candidates than a rebuild would; the
+        distances reported after the exact rerank are still exact.
+        """
+        vectors = self._prepare(embeddings).reshape(-1, EMBEDDING_DIM)
+        with self._lock.write():
+            self._set_student_rows(student, vectors)
+
+    def _set_student_rows(self, student, vectors):
+        roll_no = student.get('rollNo')
+        owner = self.owner_by_roll.get(roll_no)
+        if owner is None:
+            if not len(vectors):
+                return
+            owner = len(self.students)
+            self.students.append({"rollNo": roll_no, "name": student.get('name', 'Unknown')})
+            self.owner_by_roll[roll_no] = owner
+            self.student_rows.append(np.zeros(0, dtype=np.int64))
+            if self.prune:
+                self.centroids = np.vstack([self.centroids, np.zeros((1, EMBEDDING_DIM), dtype=np.float32)])
+                self.radii = np.append(self.radii, -np.inf)
+        elif student.get('name'):
+            self.students[owner]["name"] = student['name']
+
+        old_rows = self.student_rows[owner]
+        reused = old_rows[:len(vectors)]
+        dropped = old_rows[len(vectors):]
+        rows = np.concatenate([reused, self._append_rows(len(vectors) - len(reused), owner)]).astype(np.int64)
+        self._write_rows(rows, vectors)
+
+        self.row_sq_norms[dropped] = np.inf
+        if self.quantize:
+            self.code_sq_norms[dropped] = np.inf
+        self.tombstoned_rows += len(dropped)
+        self.student_rows[owner] = rows
+        if self.prune:
+            self._update_centroid(owner)
+
+    def _append_rows(self, count, owner):
+        """Reserve count new rows for owner, doubling the row buffers when they are full"""
+        start = len(self)
+        end = start + count
+        if count <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if end > len(self._vector_buffer):
+            buffer = self._new_vector_buffer(max(end, 2 * len(self._vector_buffer)))
+            buffer[:start] = self.vectors
+            self._vector_buffer = buffer
+        self.vectors = self._vector_buffer[:end]
+        if self.quantize:
+            if end > len(self._code_buffer):
+                buffer = np.zeros((max(end, 2 * len(self._code_buffer)), EMBEDDING_DIM), dtype=np.int8)
+                buffer[:start] = self.codes
+                self._code_buffer = buffer
+            self.codes = self._code_buffer[:end]
+            self.code_sq_norms = np.append(self.code_sq_norms, np.zeros(count, dtype=np.float32))
+        self.row_owner = np.append(self.row_owner, np.full(count, owner, dtype=np.int32))
+        self.row_sq_norms = np.append(self.row_sq_norms, np.zeros(count, dtype=np.float32))
+        return np.arange(start, end)
+
+    def _write_rows(self, rows, vectors):
+        """Store vectors at rows in every representation the gallery keeps"""
+        if not len(rows):
+            return
+        self.vectors[rows] = vectors
+        self.row_sq_norms[rows] = np.einsum('ij,ij->i', vectors, vectors)
+        if not self.quantize:
+            return
+        scaled = np.rint(vectors / self.scales)
+        if np.abs(scaled).max() > 127:
+            # Outside the trained int8 range: requantize rather than clip, so the
+            # first pass stays as accurate as after a full build
+            self._build_quantized(np.asarray(self.vectors))
+            return
+        self.codes[rows] = scaled.astype(np.int8)
+        dequantized = self.codes[rows].astype(np.float32) * self.scales
+        self.code_sq_norms[rows] = np.einsum('ij,ij->i', dequantized, dequantized)
+
+    def __len__(self):
+        return len(self.row_owner)
+
+    def _exact_distances(self, query, rows=None):
+        """Exact L2 distance from query to the given rows (all rows if None)"""
+        if rows is not None:
+            return np.linalg.norm(np.asarray(self.vectors[rows]) - query, axis=1)
+        dists = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCAN_CHUNK_ROWS):
+            chunk = np.asarray(self.vectors[start:start + SCAN_CHUNK_ROWS])
+            dists[start:start + len(chunk)] = np.linalg.norm(chunk - query, axis=1)
+        return dists
+
+    def _approx_sq_distances(self, queries):
+        """Squared L2 distance from each query to the int8 gallery, one matrix product per chunk"""
+        scaled_queries = queries * self.scales
+        query_sq = np.einsum('ij,ij->i', queries, queries)[:, None]
+        approx = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCAN_CHUNK_ROWS):
+            chunk = self.codes[start:start + SCAN_CHUNK_ROWS].astype(np.float32)
+            end = start + len(chunk)
+            approx[:, start:end] = self.code_sq_norms[start:end] - 2.0 * (scaled_queries @ chunk.T) + query_sq
+        return approx
+
+    def _gemm_student_distances(self, queries):
+        """L2 distance from every query to every student's closest row via one GEMM per chunk"""
+        best = np.full((len(queries), len(self.students)), np.inf, dtype=np.float32)
+        query_sq = np.einsum('ij,ij->i', queries, queries)[:, None]
+        for start in range(0, len(self), SCAN_CHUNK_ROWS):
+            chunk = np.asarray(self.vectors[start:start + SCAN_CHUNK_ROWS])
+            end = start + len(chunk)
+            sq = self.row_sq_norms[start:end] - 2.0 * (queries @ chunk.T) + query_sq
+            np.minimum.at(best.T, self.row_owner[start:end], np.sqrt(np.maximum(sq, 0.0)).T)
+        return best
+
+    def _quantized_student_distances(self, queries):
+        """int8 first pass over all rows for the batch, then exact distances for each query's top rerank_k rows"""
+        rows_checked = 0
+        students_checked = 0
+        for block in range(0, len(queries), QUANTIZED_QUERY_BLOCK):
+            block_queries = queries[block:block + QUANTIZED_QUERY_BLOCK]
+            for query, approx in zip(block_queries, self._approx_sq_distances(block_queries)):
+                rows = np.argpartition(approx, self.rerank_k - 1)[:self.rerank_k]
+                rows = rows[np.isfinite(approx[rows])]  # Tombstoned rows
+                best = np.full(len(self.students), np.inf, dtype=np.float32)
+                np.minimum.at(best, self.row_owner[rows], self._exact_distances(query, rows))
+                rows_checked += len(rows)
+                students_checked += int(np.isfinite(best).sum())
+                yield best
+        self.last_search_stats = {"path": "quantized", "queries": len(queries),
+                                  "students_checked": students_checked, "rows_checked": rows_checked}
+
+    def _top_students(self, best, k, bound):
+        """Turn per-student distances into the sorted top-k result list"""
+        best = np.where(best < bound, best, np.inf)
+        k = min(k, int(np.isfinite(best).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(best, k - 1)[:k]
+        top = top[np.argsort(best[top])]
+        return [(self.students[i], float(self._from_internal(best[i]))) for i in top]
+
+    def search_batch(self, queries, k=1, max_distance=None):
+        """
+        Search several captured faces at once; returns one result list per query.
+        Each result list holds up to k (student, distance) pairs, closest first,
+        with every student scored by its closest embedding. Students at or
+        beyond max_distance (in the gallery metric) are left out.
+        """
+        if len(queries) == 0:
+            return []
+        queries = self._prepare(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        with self._lock.read():
+            return self._search_batch(queries, k, max_distance)
+
+    def _search_batch(self, queries, k, max_distance):
+        if not len(self):
+            return [[] for _ in queries]
+        bound = self._to_internal(max_distance)
+
+        path = self._search_path(len(queries))
+        if path == "quantized":
+            return [self._top_students(best, k, bound) for best in self._quantized_student_distances(queries)]
+        if path == "pruned":
+            return [self._pruned_search(queries[0], k, bound)]
+
+        self.last_search_stats = {"path": "gemm", "queries": len(queries),
+                                  "students_checked": len(self.students), "rows_checked": len(self)}
+        return [self._top_students(best, k, bound) for best in self._gemm_student_distances(queries)]
+
+    def _search_path(self, num_queries):
+        if self.quantize and len(self) > self.rerank_k:
+            return "quantized"
+        if self.prune and num_queries == 1:
+            return "pruned"
+        return "gemm"
+
+    def search_paths(self):
+        """Search path taken for a single query and for a batch of queries"""
+        return {"single": self._search_path(1), "batch": self._search_path(2)}
+
+    def search(self, query, k=1, max_distance=None):
+        """Single-query form of search_batch()"""
+        return self.search_batch([query], k=k, max_distance=max_distance)[0]
+
+    def _pruned_search(self, query, k, bound):
+        """Visit students by centroid lower bound and stop once no one left can qualify"""
+        lower = np.linalg.norm(self.centroids - query, axis=1) - self.radii - PRUNE_SLACK
+        candidates = np.flatnonzero(lower < bound)
+        candidates = candidates[np.argsort(lower[candidates])]
+
+        results = []  # (distance, owner) sorted ascending, at most k long
+        students_checked = 0
+        rows_checked = 0
+        for owner in candidates:
+            kth = results[-1][0] if len(results) == k else np.inf
+            if lower[owner] >= min(bound, kth):
+                break
+            rows = self.student_rows[owner]
+            dist = float(self._exact_distances(query, rows).min())
+            students_checked += 1
+            rows_checked += len(rows)
+            if dist < bound and dist < kth:
+                results.append((dist, owner))
+                results.sort()
+                del results[k:]
+
+        self.last_search_stats = {"path": "pruned", "queries": 1,
+                                  "students_checked": students_checked, "rows_checked": rows_checked}
+        return [(self.students[owner], float(self._from_internal(dist))) for dist, owner in results]
+
+    def best_match(self, query, max_distance=None):
+        """Closest student and its distance, or (None, inf) if nobody qualifies"""
+        results = self.search(query, k=1, max_distance=max_distance)
+        if not results:
+            return None, float('inf')
+        return results[0]
+
+    def memory_usage(self):
+        """Bytes held by the gallery, split by representation"""
+        with self._lock.read():
+            return self._memory_usage()
+
+    def _memory_usage(self):
+        full_bytes = int(self.vectors.nbytes)
+        quantized_bytes = 0
+        if self.quantize and self.codes is not None:
+            quantized_bytes = int(self.codes.nbytes + self.scales.nbytes + self.code_sq_norms.nbytes)
+        centroid_bytes = int(self.centroids.nbytes + self.radii.nbytes) if self.prune else 0
+        full_resident = not isinstance(self.vectors, np.memmap)
+        return {
+            "students": len(self.students),
+            "embeddings": len(self) - self.tombstoned_rows,
+            "tombstoned_rows": self.tombstoned_rows,
+            "metric": self.metric,
+            "quantized": self.quantize,
+            "pruned": self.prune,
+            "search_paths": self.search_paths(),
+            "full_precision_bytes": full_bytes,
+            "full_precision_resident": full_resident,
+            "quantized_bytes": quantized_bytes,
+            "centroid_bytes": centroid_bytes,
+            "owner_index_bytes": int(self.row_owner.nbytes + self.row_sq_norms.nbytes),
+            "resident_bytes": ((full_bytes if full_resident else 0) + quantized_bytes + centroid_bytes
+                               + int(self.row_owner.nbytes + self.row_sq_norms.nbytes))
+        }
+
+
+def claimed_distance(embeddings, query, metric='euclidean'):
+    """Distance from query to the closest of one student's embeddings (1:1 verification)"""
+    gallery = FaceGallery(metric=metric)
+    vectors = gallery._prepare(embeddings)
+    dist = np.linalg.norm(vectors - gallery._prepare(query), axis=1).min()
+    return float(gallery._from_internal(dist))
+
+
+def select_diverse_templates(embeddings, budget, metric='euclidean'):
+    """
+    Indices (in original order) of at most `budget` templates that keep the set
+    spread out. The template closest to any other one is the most redundant and
+    is dropped first; within the closest pair the older one goes, so the set
+    follows gradual appearance changes.
+    """
+    keep = list(range(len(embeddings)))
+    if len(keep) <= budget:
+        return keep
+    vectors = FaceGallery(metric=metric)._prepare(embeddings).astype(np.float64)
+    dists = np.linalg.norm(vectors[:, None, :] - vectors[None, :, :], axis=2)
+    np.fill_diagonal(dists, np.inf)
+    while len(keep) > budget:
+        nearest = dists[np.ix_(keep, keep)].min(axis=1)
+        del keep[int(np.argmin(nearest))]
+    return keep
+
+
+def calibrate_threshold(students, reference_threshold, metric='cosine', max_pairs=200000, seed=0):
+    """
+    Translate a raw L2 threshold into `metric` on the enrolled gallery.
+    Picks the threshold that accepts the same share of impostor pairs
+    (embeddings of two different students) as reference_threshold does on raw
+    L2 distance, and reports the genuine-pair accept rate under both.
+    Returns None when fewer than two students have embeddings.
+    """
+    raw = FaceGallery(metric='euclidean')
+    raw.load(students)
+    if len(raw.students) < 2:
+        return None
+    target = FaceGallery(metric=metric)
+    target.vectors = target._prepare(raw.vectors)
+
+    rng = np.random.default_rng(seed)
+    left = rng.integers(0, len(raw), size=max_pairs)
+    right = rng.integers(0, len(raw), size=max_pairs)
+    keep = left != right
+    left, right = left[keep], right[keep]
+    impostor = raw.row_owner[left] != raw.row_owner[right]
+
+    def pair_distances(gallery):
+        return gallery._from_internal(np.linalg.norm(gallery.vectors[left] - gallery.vectors[right], axis=1))
+
+    raw_dists = pair_distances(raw)
+    target_dists = pair_distances(target)
+
+    impostor_accept_rate = float(np.mean(raw_dists[impostor] < reference_threshold))
+    if impostor_accept_rate > 0:
+        threshold = float(np.quantile(target_dists[impostor], impostor_accept_rate))
+    else:
+        threshold = float(target_dists[impostor].min())
+
+    genuine = ~impostor
+    return {
+        "metric": metric,
+        "reference_threshold": reference_threshold,
+        "threshold": threshold,
+        "impostor_pairs": int(impostor.sum()),
+        "genuine_pairs": int(genuine.sum()),
+        "impostor_accept_rate": impostor_accept_rate,
+        "genuine_accept_rate_reference": float(np.mean(raw_dists[genuine] < reference_threshold)) if genuine.any() else None,
+        "genuine_accept_rate": float(np.mean(target_dists[genuine] < threshold)) if genuine.any() else None
+    }
+
+
+def _synthetic_students(num_students, per_student, noise, rng):
+    centers = rng.normal(0.0, 1.0, size=(num_students, EMBEDDING_DIM)).astype(np.float32)
+    for i, center in enumerate(centers):
+        samples = center + rng.normal(0.0, noise, size=(per_student, EMBEDDING_DIM)).astype(np.float32)
+        yield {"rollNo": f"S{i:06d}", "name": f"Student {i}", "embeddings": samples}
+
+
+def benchmark(num_students=20000, per_student=5, num_queries=200, threshold=15.0,
+              noise=0.35, rerank_k=QUANTIZED_RERANK_K, mmap_path=None, seed=0):
+    """
+    Compare exact, int8, centroid-pruned and cosine search on a synthetic gallery.
+    Reports resident memory, per-query and batched latency, top-1 agreement
+    with exact search and agreement of the thresholded attendance decision
+    (the cosine mode uses the threshold calibrated from the L2 one).
+    """
+    rng = np.random.default_rng(seed)
+    students = list(_synthetic_students(num_students, per_student, noise, rng))
+    picks = rng.integers(0, num_students, size=num_queries)
+    queries = [students[i]["embeddings"].mean(axis=0) + rng.normal(0.0, noise, EMBEDDING_DIM).astype(np.float32)
+               for i in picks]
+    cosine_threshold = calibrate_threshold(students, threshold)["threshold"]
+    modes = {
+        "exact": ({}, threshold),
+        "int8": ({"quantize": True, "rerank_k": rerank_k, "mmap_path": mmap_path}, threshold),
+        "centroid_pruned": ({"prune": True}, threshold),
+        "cosine": ({"metric": "cosine"}, cosine_threshold)
+    }
+
+    report = {"students": num_students, "embeddings": num_students * per_student}
+    reference = None
+    for mode, (options, mode_threshold) in modes.items():
+        gallery = FaceGallery.from_students(students, **options)
+        top1 = [gallery.best_match(query)[0]["rollNo"] for query in queries]
+
+        start = time.perf_counter()
+        gallery.search_batch(queries, max_distance=mode_threshold)
+        batch_ms = (time.perf_counter() - start) * 1000 / num_queries
+
+        latencies = []
+        decisions = []
+        checked = []
+        for query in queries:
+            start = time.perf_counter()
+            matched, _ = gallery.best_match(query, max_distance=mode_threshold)
+            latencies.append((time.perf_counter() - start) * 1000)
+            decisions.append(matched["rollNo"] if matched else None)
+            checked.append(gallery.last_search_stats.get("students_checked", 0))
+        if reference is None:
+            reference = (top1, decisions)
+
+        latencies = np.asarray(latencies)
+        report[mode] = {
+            "threshold": float(mode_threshold),
+            "resident_mb": gallery.memory_usage()["resident_bytes"] / 2**20,
+            "batch_ms_per_query": batch_ms,
+            "ms_mean": float(latencies.mean()),
+            "ms_p95": float(np.percentile(latencies, 95)),
+            "students_checked_mean": float(np.mean(checked)),
+            "top1_agreement": float(np.mean([a == b for a, b in zip(reference[0], top1)])),
+            "decision_agreement": float(np.mean([a == b for a, b in zip(reference[1], decisions)]))
+        }
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark face gallery search modes")
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--per-student', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--rerank-k', type=int, default=QUANTIZED_RERANK_K)
+    parser.add_argument('--mmap-path', default=None, help="Keep full-precision vectors in this .npy file")
+    args = parser.parse_args()
+
+    if args.mmap_path and os.path.exists(args.mmap_path):
+        os.remove(args.mmap_path)
+    results = benchmark(args.students, args.per_student, args.queries,
+                        rerank_k=args.rerank_k, mmap_path=args.mmap_path)
+    print(f"\n📊 Face gallery benchmark: {results.pop('students')} students, {results.pop('embeddings')} embeddings")
+    for mode, stats in results.items():
+        print(f"\n  {mode}")
+        for key, value in stats.items():
+            print(f"    {key:24s} {value:.4f}")
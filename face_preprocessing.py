@@ -0,0 +1,35 @@
+"""
+Image preprocessing shared by the app and recognition_benchmark.py.
+
+Kept out of app.py so the benchmark's worker processes can apply exactly the
+app's preprocessing without importing the app (database, galleries, DeepFace).
+"""
+import cv2
+
+MAX_SIDE = 800  # Larger images are shrunk before detection
+
+
+def preprocess_image(img):
+    """Preprocess image to improve face detection"""
+    # Resize if image is too large
+    height, width = img.shape[:2]
+    if height > MAX_SIDE or width > MAX_SIDE:
+        scale = MAX_SIDE / max(height, width)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        print(f"Resized image to: {new_width}x{new_height}")
+
+    # Improve contrast and brightness
+    lab = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
+    l_channel, a, b = cv2.split(lab)
+
+    # Apply CLAHE to L channel
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    cl = clahe.apply(l_channel)
+
+    # Merge channels and convert back to RGB
+    enhanced = cv2.merge((cl, a, b))
+    enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2RGB)
+
+    return enhanced
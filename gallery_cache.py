@@ -0,0 +1,165 @@
+"""
+Memory-budgeted LRU cache of roster galleries.
+
+A roster gallery holds only the students of one lecture roster
+(department/batch/group). A busy timetable needs many of them but only a few
+at a time, so galleries are kept while their combined resident size fits in
+the budget and the least recently used ones are evicted beyond it. Galleries
+pinned by an active lecture are never evicted.
+
+Each gallery built from the database is also written to a compact .npz
+snapshot (float32 embeddings plus roll numbers and names). An evicted roster
+is rebuilt from its snapshot while it is younger than the TTL, which skips the
+database query and BSON decoding of every embedding.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from face_gallery import FaceGallery
+
+GALLERY_CACHE_BUDGET_BYTES = 256 * 2**20
+
+
+def roster_key(roster):
+    """Hashable, order-independent key for a roster filter"""
+    return tuple(sorted((field, str(value)) for field, value in roster.items() if value))
+
+
+class GalleryCache:
+    """LRU map from roster to FaceGallery, bounded by resident bytes"""
+
+    def __init__(self, loader, budget_bytes=GALLERY_CACHE_BUDGET_BYTES, snapshot_dir=None,
+                 ttl_seconds=300, gallery_options=None):
+        self.loader = loader  # loader(roster) -> iterable of student documents
+        self.budget_bytes = budget_bytes
+        self.snapshot_dir = snapshot_dir
+        self.ttl_seconds = ttl_seconds
+        self.gallery_options = gallery_options or {}
+        self.entries = OrderedDict()  # roster key -> (gallery, resident bytes), least recent first
+        self.pins = {}  # owner (e.g. lecture id) -> roster key
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rebuilds = 0
+        self.snapshot_rebuilds = 0
+        self.rebuild_seconds = 0.0
+        self._lock = threading.Lock()
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    def get(self, roster):
+        """Gallery for roster, rebuilt from snapshot or database on a miss"""
+        key = roster_key(roster)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0].built_at <= self.ttl_seconds:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        start = time.perf_counter()
+        gallery, from_snapshot = self._build(key, roster)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.rebuilds += 1
+            self.snapshot_rebuilds += int(from_snapshot)
+            self.rebuild_seconds += elapsed
+            self.entries[key] = (gallery, gallery.memory_usage()["resident_bytes"])
+            self.entries.move_to_end(key)
+            self._evict(keep=key)
+        return gallery
+
+    def _snapshot_path(self, key):
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, hashlib.sha1(repr(key).encode()).hexdigest() + '.npz')
+
+    def _build(self, key, roster):
+        path = self._snapshot_path(key)
+        if path and os.path.exists(path) and time.time() - os.path.getmtime(path) <= self.ttl_seconds:
+            with np.load(path) as snapshot:
+                bounds = np.cumsum(snapshot["counts"])[:-1]
+                students = [{"rollNo": str(roll_no), "name": str(name), "embeddings": embeddings}
+                            for roll_no, name, embeddings in zip(snapshot["roll_nos"], snapshot["names"],
+                                                                 np.split(snapshot["embeddings"], bounds))]
+            return FaceGallery.from_students(students, **self.gallery_options), True
+
+        students = [s for s in self.loader(roster) if s.get('embeddings')]
+        gallery = FaceGallery.from_students(students, **self.gallery_options)
+        if path:
+            embeddings = [np.asarray(s['embeddings'], dtype=np.float32) for s in students]
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path,
+                     roll_nos=np.array([str(s.get('rollNo')) for s in students]),
+                     names=np.array([str(s.get('name', 'Unknown')) for s in students]),
+                     counts=np.array([len(e) for e in embeddings], dtype=np.int64),
+                     embeddings=np.concatenate(embeddings) if embeddings else np.zeros((0, 128), np.float32))
+            os.replace(tmp_path, path)
+        return gallery, False
+
+    def _evict(self, keep=None):
+        """Drop least recently used unpinned galleries until the budget holds"""
+        pinned = set(self.pins.values())
+        total = sum(size for _, size in self.entries.values())
+        for key in list(self.entries):
+            if total <= self.budget_bytes:
+                break
+            if key in pinned or key == keep:
+                continue
+            total -= self.entries.pop(key)[1]
+            self.evictions += 1
+
+    def pin(self, owner, roster):
+        """Keep the roster gallery of owner (an active lecture) resident"""
+        with self._lock:
+            self.pins[owner] = roster_key(roster)
+
+    def unpin(self, owner):
+        with self._lock:
+            self.pins.pop(owner, None)
+            self._evict()
+
+    def update_student(self, student, embeddings):
+        """Apply a template change to every cached gallery that holds the student"""
+        with self._lock:
+            for key, (gallery, _) in list(self.entries.items()):
+                if student.get('rollNo') in gallery.owner_by_roll:
+                    gallery.set_student_embeddings(student, embeddings)
+                    self.entries[key] = (gallery, gallery.memory_usage()["resident_bytes"])
+                    # The snapshot no longer matches; the next rebuild reads the database
+                    path = self._snapshot_path(key)
+                    if path and os.path.exists(path):
+                        os.remove(path)
+
+    def clear(self):
+        """Forget every gallery and snapshot after enrollments change; pins are kept"""
+        with self._lock:
+            self.entries.clear()
+            if self.snapshot_dir:
+                for name in os.listdir(self.snapshot_dir):
+                    if name.endswith('.npz') and '.tmp' not in name:
+                        os.remove(os.path.join(self.snapshot_dir, name))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "galleries": len(self.entries),
+                "resident_bytes": sum(size for _, size in self.entries.values()),
+                "budget_bytes": self.budget_bytes,
+                "pinned": len(set(self.pins.values())),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "rebuilds": self.rebuilds,
+                "snapshot_rebuilds": self.snapshot_rebuilds,
+                "rebuild_ms_mean": round(self.rebuild_seconds * 1000 / self.rebuilds, 2) if self.rebuilds else None
+            }
@@ -0,0 +1,274 @@
+"""
+Scatter-gather face search across recognition nodes.
+
+Students are partitioned by department (set on every student record today)
+and each recognition node keeps one FaceGallery per department it serves,
+answering searches over XML-RPC. ShardedGallery sends a query batch to every
+node holding a relevant shard in parallel and merges the per-shard top-k lists.
+Every student lives in exactly one shard, so the merged list is what a single
+gallery over all students would return.
+
+The topology is one string shared by the app and the nodes, e.g.
+
+    FACE_GALLERY_SHARDS="CSE=http://10.0.0.5:8101,ECE=http://10.0.0.6:8101,*=http://10.0.0.6:8101"
+
+'*' catches students whose department has no shard of its own (or none set).
+
+    python gallery_shards.py serve --url http://10.0.0.5:8101 --bind 10.0.0.5
+
+Nodes listen on localhost unless --bind names an interface, and answer only
+the ShardNode methods in SHARD_NODE_METHODS. XML-RPC has no authentication:
+bind to a private interface that only the app servers can reach.
+"""
+import argparse
+import threading
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from xmlrpc.server import SimpleXMLRPCServer
+
+import numpy as np
+
+from face_gallery import FaceGallery
+
+SHARD_FIELD = 'department'
+DEFAULT_SHARD = '*'
+SHARD_RPC_TIMEOUT = 10.0  # Seconds per node call
+SHARD_GALLERY_TTL_SECONDS = 300
+SHARD_NODE_BIND = '127.0.0.1'  # Default listen address of a node
+SHARD_NODE_METHODS = ("search_batch", "set_student_embeddings", "students", "invalidate", "stats")
+
+
+def parse_topology(spec):
+    """'KEY=url,KEY=url' -> {shard key: node url}"""
+    topology = {}
+    for part in (spec or '').split(','):
+        if not part.strip():
+            continue
+        key, _, url = part.partition('=')
+        if not url:
+            raise ValueError(f"Shard entry '{part}' must look like KEY=http://host:port")
+        topology[key.strip()] = url.strip()
+    return topology
+
+
+def shard_key(student, topology, field=SHARD_FIELD):
+    """Shard a student document belongs to under this topology"""
+    value = student.get(field)
+    return value if value in topology and value != DEFAULT_SHARD else DEFAULT_SHARD
+
+
+def shard_query(key, topology, field=SHARD_FIELD):
+    """Mongo filter selecting the students of one shard"""
+    if key != DEFAULT_SHARD:
+        return {field: key}
+    return {field: {"$nin": [k for k in topology if k != DEFAULT_SHARD]}}
+
+
+class ShardNode:
+    """The shards one node serves, each a FaceGallery rebuilt from `loader` when stale"""
+
+    def __init__(self, shard_keys, loader, gallery_options=None, ttl_seconds=SHARD_GALLERY_TTL_SECONDS):
+        self.shard_keys = list(shard_keys)
+        self.loader = loader  # loader(shard key) -> iterable of student documents
+        self.gallery_options = gallery_options or {}
+        self.ttl_seconds = ttl_seconds
+        self.galleries = {}
+        self._lock = threading.Lock()
+
+    def _gallery(self, key):
+        if key not in self.shard_keys:
+            raise ValueError(f"Shard '{key}' is not served by this node")
+        gallery = self.galleries.get(key)
+        if gallery is None or time.time() - gallery.built_at > self.ttl_seconds:
+            gallery = FaceGallery.from_students(self.loader(key), **self.gallery_options)
+            self.galleries[key] = gallery
+        return gallery
+
+    def search_batch(self, queries, k=1, max_distance=None, shard_keys=None):
+        """Top-k [rollNo, name, distance] lists per query over the requested shards"""
+        with self._lock:
+            queries = np.asarray(queries, dtype=np.float32)
+            per_shard = [self._gallery(key).search_batch(queries, k=k, max_distance=max_distance)
+                         for key in (shard_keys or self.shard_keys)]
+        return [[[s["rollNo"], s["name"], float(d)] for s, d in hits]
+                for hits in merge_top_k(per_shard, len(queries), k)]
+
+    def set_student_embeddings(self, key, student, embeddings):
+        with self._lock:
+            self._gallery(key).set_student_embeddings(student, embeddings)
+        return True
+
+    def students(self, shard_keys=None):
+        """[rollNo, name] of every enrolled student in the requested shards"""
+        with self._lock:
+            return [[s["rollNo"], s["name"]] for key in (shard_keys or self.shard_keys)
+                    for s in self._gallery(key).students]
+
+    def invalidate(self):
+        with self._lock:
+            self.galleries = {}
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {key: _rpc_safe(self._gallery(key).memory_usage()) for key in self.shard_keys}
+
+
+def _rpc_safe(stats):
+    """XML-RPC ints are 32-bit; send larger counters (byte sizes) as floats"""
+    return {name: float(value) if isinstance(value, int) and abs(value) > 2**31 - 1 else value
+            for name, value in stats.items()}
+
+
+def merge_top_k(per_shard, num_queries, k):
+    """Combine per-shard result lists (closest first) into the global top-k per query"""
+    merged = []
+    for q in range(num_queries):
+        hits = [hit for results in per_shard for hit in results[q]]
+        hits.sort(key=lambda hit: hit[-1])
+        merged.append(hits[:k])
+    return merged
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+class ShardedGallery:
+    """Client with the FaceGallery search interface over a set of shard nodes"""
+
+    def __init__(self, topology, field=SHARD_FIELD, timeout=SHARD_RPC_TIMEOUT):
+        if not topology:
+            raise ValueError("Sharded gallery needs at least one shard")
+        self.topology = dict(topology)
+        self.field = field
+        self.timeout = timeout
+        self.last_search_stats = {}
+        self.built_at = time.time()
+
+    def _call(self, url, method, *args):
+        # ServerProxy is not thread-safe, so every call gets its own
+        proxy = xmlrpc.client.ServerProxy(url, allow_none=True, transport=_TimeoutTransport(self.timeout))
+        try:
+            return getattr(proxy, method)(*args)
+        except Exception as e:
+            raise RuntimeError(f"Shard node {url} failed on {method}: {e}")
+
+    def _nodes(self, shard_keys=None):
+        """node url -> shard keys to search there"""
+        nodes = {}
+        for key in (shard_keys or self.topology):
+            key = key if key in self.topology else DEFAULT_SHARD
+            if key not in self.topology:
+                continue
+            nodes.setdefault(self.topology[key], []).append(key)
+        return nodes
+
+    def search_batch(self, queries, k=1, max_distance=None, shard_keys=None):
+        """FaceGallery.search_batch() scattered to every relevant node; shard_keys limits the departments"""
+        if len(queries) == 0:
+            return []
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float64))
+        nodes = self._nodes(shard_keys)
+        if not nodes:
+            return [[] for _ in queries]
+        payload = queries.tolist()
+        with ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+            futures = [pool.submit(self._call, url, 'search_batch', payload, k, max_distance, keys)
+                       for url, keys in nodes.items()]
+            per_node = [future.result() for future in futures]
+        self.last_search_stats = {"nodes": len(nodes)}
+        return [[({"rollNo": roll_no, "name": name}, dist) for roll_no, name, dist in hits]
+                for hits in merge_top_k(per_node, len(queries), k)]
+
+    def search(self, query, k=1, max_distance=None):
+        return self.search_batch([query], k=k, max_distance=max_distance)[0]
+
+    @property
+    def students(self):
+        """FaceGallery.students gathered from every node (one round trip per node on each access)"""
+        nodes = self._nodes()
+        with ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+            futures = [pool.submit(self._call, url, 'students', keys) for url, keys in nodes.items()]
+            per_node = [future.result() for future in futures]
+        return [{"rollNo": roll_no, "name": name} for students in per_node for roll_no, name in students]
+
+    def best_match(self, query, max_distance=None):
+        results = self.search(query, k=1, max_distance=max_distance)
+        if not results:
+            return None, float('inf')
+        return results[0]
+
+    def set_student_embeddings(self, student, embeddings):
+        """Forward an in-place template update to the node owning the student's shard"""
+        key = shard_key(student, self.topology, self.field)
+        student = {"rollNo": student.get('rollNo'), "name": student.get('name')}
+        self._call(self.topology[key], 'set_student_embeddings', key, student,
+                   np.asarray(embeddings, dtype=np.float64).tolist())
+
+    def invalidate(self):
+        """Make every node rebuild its shards from the database on the next search"""
+        for url in set(self.topology.values()):
+            self._call(url, 'invalidate')
+
+    def memory_usage(self):
+        """Per-shard FaceGallery.memory_usage() plus totals"""
+        shards = {}
+        for url in set(self.topology.values()):
+            shards.update(self._call(url, 'stats'))
+        return {
+            "sharded": True,
+            "shards": shards,
+            "students": sum(stats["students"] for stats in shards.values()),
+            "embeddings": sum(stats["embeddings"] for stats in shards.values()),
+            "resident_bytes": sum(stats["resident_bytes"] for stats in shards.values())
+        }
+
+
+def make_server(node, host, port):
+    """XML-RPC server exposing only SHARD_NODE_METHODS of `node`"""
+    server = SimpleXMLRPCServer((host, port), allow_none=True, logRequests=False)
+    for name in SHARD_NODE_METHODS:
+        server.register_function(getattr(node, name), name)
+    return server
+
+
+def serve(url, topology, loader, gallery_options=None, bind=SHARD_NODE_BIND):
+    """Run a shard node for the keys the topology assigns to `url` on `bind` (blocks)"""
+    keys = [key for key, node_url in topology.items() if node_url == url]
+    if not keys:
+        raise ValueError(f"No shards are assigned to {url}")
+    node = ShardNode(keys, loader, gallery_options)
+    server = make_server(node, bind, urlparse(url).port)
+    print(f"🚀 Shard node for {url} listening on {bind} serving {', '.join(keys)}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Face gallery shard node")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="Serve the shards assigned to this node")
+    serve_parser.add_argument('--url', required=True, help="This node's URL as written in FACE_GALLERY_SHARDS")
+    serve_parser.add_argument('--bind', default=SHARD_NODE_BIND,
+                              help="Interface to listen on (default localhost); the port comes from --url")
+    args = parser.parse_args()
+
+    import app as attendance_app
+
+    topology = parse_topology(attendance_app.FACE_GALLERY_SHARDS)
+    projection = {"_id": 0, "rollNo": 1, "name": 1, "embeddings": 1}
+    serve(args.url, topology,
+          lambda key: attendance_app.students_col.find(shard_query(key, topology), projection),
+          {"quantize": attendance_app.FACE_GALLERY_QUANTIZE,
+           "prune": attendance_app.FACE_GALLERY_PRUNE,
+           "metric": attendance_app.FACE_MATCH_METRIC},
+          bind=args.bind)
@@ -0,0 +1,141 @@
+"""
+In-memory interval index of approved medical leaves.
+
+Per student, the approved leave ranges are merged into disjoint intervals
+kept sorted by start date, so "is this student on approved leave on this
+date?" is one binary search and no database query. Dates are the app's
+'YYYY-MM-DD' strings, which sort chronologically as strings.
+
+The index is loaded lazily and reloaded every `ttl_seconds` so workers pick
+up approvals made by other workers; approvals and rejections made in this
+worker are applied at once with add() / remove(). Changes made while a
+reload's query is running are re-applied on top of the reloaded index, since
+the query may have read the leave before it changed.
+"""
+import threading
+import time
+from bisect import bisect_right
+
+LEAVE_INDEX_TTL_SECONDS = 300
+
+
+def merge_intervals(ranges):
+    """Sorted, disjoint (start, end) intervals covering the same dates as ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class ApprovedLeaveIndex:
+    """rollNo -> merged approved leave intervals, with O(log n) date lookups"""
+
+    def __init__(self, loader, ttl_seconds=LEAVE_INDEX_TTL_SECONDS):
+        self.loader = loader  # loader() -> iterable of approved leave documents
+        self.ttl_seconds = ttl_seconds
+        self.leaves = {}  # rollNo -> {leave id: (start, end)}
+        self.starts = {}  # rollNo -> sorted interval starts
+        self.ends = {}  # rollNo -> matching interval ends
+        self.loaded_at = None
+        self._changes = None  # add/remove calls made during a reload, replayed after it
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    def _reindex(self, roll_no):
+        intervals = merge_intervals(self.leaves.get(roll_no, {}).values())
+        if intervals:
+            self.starts[roll_no] = [start for start, _ in intervals]
+            self.ends[roll_no] = [end for _, end in intervals]
+        else:
+            self.leaves.pop(roll_no, None)
+            self.starts.pop(roll_no, None)
+            self.ends.pop(roll_no, None)
+
+    def _apply(self, leaves, leave_id, roll_no, dates):
+        """Set (dates) or drop (None) one leave in leaves; returns whether anything changed"""
+        if dates is not None:
+            leaves.setdefault(roll_no, {})[leave_id] = dates
+            return True
+        return leaves.get(roll_no, {}).pop(leave_id, None) is not None
+
+    def reload(self):
+        """Rebuild from the database"""
+        with self._reload_lock:
+            self._reload()
+
+    def _reload(self):
+        with self._lock:
+            self._changes = []
+        try:
+            leaves = {}
+            for leave in self.loader():
+                leaves.setdefault(leave["student_rollNo"], {})[str(leave["_id"])] = (leave["start_date"], leave["end_date"])
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+        with self._lock:
+            for change in self._changes:
+                self._apply(leaves, *change)
+            self._changes = None
+            self.leaves = leaves
+            self.starts = {}
+            self.ends = {}
+            for roll_no in list(leaves):
+                self._reindex(roll_no)
+            self.loaded_at = time.time()
+
+    def _is_fresh(self):
+        return self.loaded_at is not None and time.time() - self.loaded_at <= self.ttl_seconds
+
+    def _ensure_fresh(self):
+        if self._is_fresh():
+            return
+        with self._reload_lock:
+            if self._is_fresh():
+                return  # Another thread reloaded while this one waited
+            try:
+                self._reload()
+            except Exception as e:
+                # Keep answering from the previous index rather than failing attendance writes
+                print(f"⚠️  Could not reload approved leaves: {e}")
+                if self.loaded_at is not None:
+                    self.loaded_at = time.time()
+
+    def _change(self, leave_id, roll_no, dates):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((str(leave_id), roll_no, dates))
+            if self._apply(self.leaves, str(leave_id), roll_no, dates):
+                self._reindex(roll_no)
+
+    def add(self, leave_id, roll_no, start_date, end_date):
+        """Record a newly approved leave"""
+        self._change(leave_id, roll_no, (start_date, end_date))
+
+    def remove(self, leave_id, roll_no):
+        """Forget a leave that is no longer approved (no-op if unknown)"""
+        self._change(leave_id, roll_no, None)
+
+    def covers(self, roll_no, date):
+        """True if an approved leave of roll_no includes date"""
+        self._ensure_fresh()
+        with self._lock:
+            starts = self.starts.get(roll_no)
+            if not starts:
+                return False
+            i = bisect_right(starts, date) - 1
+            return i >= 0 and self.ends[roll_no][i] >= date
+
+    def stats(self):
+        with self._lock:
+            return {
+                "students": len(self.starts),
+                "leaves": sum(len(leaves) for leaves in self.leaves.values()),
+                "intervals": sum(len(starts) for starts in self.starts.values()),
+                "loaded_at": self.loaded_at,
+                "ttl_seconds": self.ttl_seconds
+            }
@@ -0,0 +1,439 @@
+"""
+Offline attendance jobs that work on media instead of live kiosk frames.
+
+Classroom photos: a 12 MP photo of the whole class is far larger than the 800px
+that preprocess_image() keeps, and shrinking it loses the faces in the back
+rows. Instead the photo is cut into overlapping tiles at full resolution, each
+tile is run through the face detector (tiles in parallel), detections that
+appear in two neighbouring tiles are merged, and all face crops are embedded
+in batches before one batched gallery search.
+
+Lecture clips: frames are sampled adaptively (a frame is only looked at when
+it differs visibly from the last one kept, with a minimum rate as a floor),
+faces are followed across sampled frames with a simple IoU tracker, and each
+track is embedded at most VIDEO_EMBEDS_PER_TRACK times however long the
+person stays in view.
+
+Run from the command line against a lecture stored in MongoDB:
+    python offline_attendance.py photo class_front.jpg class_back.jpg --lecture-number 3 --date 2025-11-18 --subject "Signal Processing"
+    python offline_attendance.py video lecture_start.mp4 --lecture-number 3 --date 2025-11-18
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from deepface import DeepFace
+
+PHOTO_DETECTOR_BACKEND = 'retinaface'  # Best recall on small, distant faces
+PHOTO_TILE_SIZE = 1024  # Tile edge in pixels at full resolution
+PHOTO_TILE_OVERLAP = 0.25  # Larger than a back-row face relative to the tile
+PHOTO_MIN_CONFIDENCE = 0.9
+PHOTO_DETECT_WORKERS = 4
+EMBED_BATCH_SIZE = 32
+FACENET_INPUT_SIZE = 160
+DUPLICATE_OVERLAP = 0.5  # Intersection over the smaller box above which two detections are one face
+
+VIDEO_DETECTOR_BACKEND = 'opencv'  # Many frames per clip, so favour speed over recall
+VIDEO_MIN_CONFIDENCE = 0.0  # OpenCV cascade scores are not probabilities
+VIDEO_MIN_INTERVAL_SECONDS = 0.25  # Never look at frames closer together than this
+VIDEO_MAX_INTERVAL_SECONDS = 2.0  # Always look at a frame at least this often
+VIDEO_SCENE_DIFF = 6.0  # Mean absolute grey-level change that counts as a new frame
+VIDEO_EMBEDS_PER_TRACK = 3
+VIDEO_TRACK_IOU = 0.3
+VIDEO_TRACK_MAX_GAP = 4  # Sampled frames a track may go unseen before it is closed
+
+
+def _tile_starts(length, tile_size, step):
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size + 1, step))
+    if starts[-1] + tile_size < length:
+        starts.append(length - tile_size)
+    return starts
+
+
+def tile_grid(width, height, tile_size=PHOTO_TILE_SIZE, overlap=PHOTO_TILE_OVERLAP):
+    """Overlapping (x, y, w, h) tiles covering the whole image"""
+    step = max(1, int(tile_size * (1 - overlap)))
+    tiles = []
+    for y in _tile_starts(height, tile_size, step):
+        for x in _tile_starts(width, tile_size, step):
+            tiles.append((x, y, min(tile_size, width - x), min(tile_size, height - y)))
+    return tiles
+
+
+def _detect_tile(img_rgb, tile, detector_backend, min_confidence):
+    """Detect faces in one tile and return boxes in full-image coordinates"""
+    x, y, w, h = tile
+    try:
+        faces = DeepFace.extract_faces(
+            img_rgb[y:y + h, x:x + w],
+            detector_backend=detector_backend,
+            enforce_detection=False,
+            align=False
+        )
+    except Exception as e:
+        print(f"Tile {tile} detection failed: {e}")
+        return []
+
+    detections = []
+    for face in faces:
+        area = face['facial_area']
+        confidence = face.get('confidence') or 0
+        # With enforce_detection=False an empty tile comes back as one full-tile "face"
+        if confidence < min_confidence or (area['w'] >= w * 0.95 and area['h'] >= h * 0.95):
+            continue
+        detections.append({
+            "box": (x + area['x'], y + area['y'], area['w'], area['h']),
+            "confidence": float(confidence)
+        })
+    return detections
+
+
+def _overlap_ratio(a, b):
+    """Intersection over the smaller box; a face cut by a tile edge lies inside its full detection"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    return (iw * ih) / float(min(aw * ah, bw * bh))
+
+
+def dedupe_detections(detections, overlap=DUPLICATE_OVERLAP):
+    """Greedy suppression that keeps the largest, most confident box of each face"""
+    kept = []
+    for det in sorted(detections, key=lambda d: (d['box'][2] * d['box'][3], d['confidence']), reverse=True):
+        if all(_overlap_ratio(det['box'], other['box']) < overlap for other in kept):
+            kept.append(det)
+    return kept
+
+
+def _face_chip(img_rgb, box):
+    """Crop a face and pad-resize it to the Facenet input size, keeping its aspect ratio"""
+    x, y, w, h = box
+    crop = img_rgb[max(y, 0):y + h, max(x, 0):x + w]
+    scale = FACENET_INPUT_SIZE / max(crop.shape[:2])
+    resized = cv2.resize(crop, (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    chip = np.zeros((FACENET_INPUT_SIZE, FACENET_INPUT_SIZE, 3), dtype=img_rgb.dtype)
+    top = (FACENET_INPUT_SIZE - resized.shape[0]) // 2
+    left = (FACENET_INPUT_SIZE - resized.shape[1]) // 2
+    chip[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return chip
+
+
+def embed_face_chips(chips, batch_size=EMBED_BATCH_SIZE):
+    """Facenet embeddings for already-cropped faces, batch_size chips per model call"""
+    embeddings = []
+    for start in range(0, len(chips), batch_size):
+        batch = chips[start:start + batch_size]
+        try:
+            results = DeepFace.represent(
+                np.stack(batch),
+                model_name='Facenet',
+                detector_backend='skip',
+                enforce_detection=False
+            )
+            # Batched input returns one result list per image
+            embeddings.extend(r[0]['embedding'] if isinstance(r, list) else r['embedding'] for r in results)
+            if len(results) != len(batch):
+                raise ValueError("Batched represent returned an unexpected number of results")
+        except Exception as e:
+            print(f"Batched embedding unavailable ({e}), embedding chips one at a time")
+            del embeddings[start:]
+            for chip in batch:
+                embeddings.append(DeepFace.represent(
+                    chip,
+                    model_name='Facenet',
+                    detector_backend='skip',
+                    enforce_detection=False
+                )[0]['embedding'])
+    return embeddings
+
+
+def detect_classroom_faces(img_rgb, detector_backend=PHOTO_DETECTOR_BACKEND, tile_size=PHOTO_TILE_SIZE,
+                           overlap=PHOTO_TILE_OVERLAP, workers=PHOTO_DETECT_WORKERS,
+                           min_confidence=PHOTO_MIN_CONFIDENCE):
+    """Tiled, parallel face detection over a full-resolution photo"""
+    height, width = img_rgb.shape[:2]
+    tiles = tile_grid(width, height, tile_size, overlap)
+
+    # The first tile runs alone so the detector model is built once before the pool starts
+    per_tile = [_detect_tile(img_rgb, tiles[0], detector_backend, min_confidence)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        per_tile.extend(pool.map(lambda tile: _detect_tile(img_rgb, tile, detector_backend, min_confidence),
+                                 tiles[1:]))
+
+    raw = [det for tile_detections in per_tile for det in tile_detections]
+    return dedupe_detections(raw), len(tiles), len(raw)
+
+
+def run_photo_attendance(images_rgb, gallery, threshold, detector_backend=PHOTO_DETECTOR_BACKEND,
+                         tile_size=PHOTO_TILE_SIZE, overlap=PHOTO_TILE_OVERLAP, workers=PHOTO_DETECT_WORKERS,
+                         batch_size=EMBED_BATCH_SIZE):
+    """
+    Find every recognisable face in one or more classroom photos.
+    Returns the matched students (closest face per student) plus a report;
+    writing attendance is left to the caller.
+    """
+    started = time.perf_counter()
+    chips = []
+    report = {"photos": len(images_rgb), "tiles": 0, "raw_detections": 0, "faces_detected": 0}
+
+    detect_started = time.perf_counter()
+    for img_rgb in images_rgb:
+        faces, tiles, raw = detect_classroom_faces(img_rgb, detector_backend, tile_size, overlap, workers)
+        report["tiles"] += tiles
+        report["raw_detections"] += raw
+        report["faces_detected"] += len(faces)
+        chips.extend(_face_chip(img_rgb, face['box']) for face in faces)
+    detect_seconds = time.perf_counter() - detect_started
+
+    embed_started = time.perf_counter()
+    embeddings = embed_face_chips(chips, batch_size) if chips else []
+    embed_seconds = time.perf_counter() - embed_started
+
+    # Several faces (or the same face in two photos) can land on one student: keep the closest
+    matches = {}
+    unmatched_faces = 0
+    for results in gallery.search_batch(embeddings, k=1, max_distance=threshold) if embeddings else []:
+        if not results:
+            unmatched_faces += 1
+            continue
+        student, dist = results[0]
+        if student['rollNo'] not in matches or dist < matches[student['rollNo']]['distance']:
+            matches[student['rollNo']] = {"rollNo": student['rollNo'], "name": student['name'], "distance": dist}
+
+    report.update({
+        "faces_matched": len(embeddings) - unmatched_faces,
+        "faces_unmatched": unmatched_faces,
+        "students_matched": len(matches),
+        "detect_seconds": round(detect_seconds, 3),
+        "embed_seconds": round(embed_seconds, 3),
+        "total_seconds": round(time.perf_counter() - started, 3)
+    })
+    return sorted(matches.values(), key=lambda m: m['rollNo']), report
+
+
+def sample_frames(path, stats, min_interval=VIDEO_MIN_INTERVAL_SECONDS, max_interval=VIDEO_MAX_INTERVAL_SECONDS,
+                  scene_diff=VIDEO_SCENE_DIFF):
+    """
+    Yield (frame_index, timestamp, rgb_frame) for frames worth processing.
+    Frames are grabbed without decoding until min_interval has passed since
+    the last check, and a decoded frame is kept only if it differs from the
+    last kept one by scene_diff or max_interval has passed. Frame counters are written to stats.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    stats.update({"fps": fps, "frames_read": 0, "frames_decoded": 0, "frames_sampled": 0})
+
+    last_kept_time = None
+    last_checked_time = None
+    last_thumb = None
+    frame_index = -1
+    try:
+        while capture.grab():
+            frame_index += 1
+            stats["frames_read"] += 1
+            timestamp = frame_index / fps
+            if last_checked_time is not None and timestamp - last_checked_time < min_interval:
+                continue
+
+            ok, frame = capture.retrieve()
+            if not ok:
+                continue
+            last_checked_time = timestamp
+            stats["frames_decoded"] += 1
+            thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA)
+            changed = last_thumb is None or float(np.mean(cv2.absdiff(thumb, last_thumb))) >= scene_diff
+            if not changed and timestamp - last_kept_time < max_interval:
+                continue
+
+            last_kept_time = timestamp
+            last_thumb = thumb
+            stats["frames_sampled"] += 1
+            yield frame_index, timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+
+def _box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class FaceTracker:
+    """Greedy IoU tracker over sampled frames; decides which detections get embedded"""
+
+    def __init__(self, iou_threshold=VIDEO_TRACK_IOU, max_gap=VIDEO_TRACK_MAX_GAP,
+                 embeds_per_track=VIDEO_EMBEDS_PER_TRACK):
+        self.iou_threshold = iou_threshold
+        self.max_gap = max_gap
+        self.embeds_per_track = embeds_per_track
+        self.tracks = []  # {"id", "box", "last_seen", "embeds"}
+
+    def update(self, step, detections):
+        """Assign detections to tracks; returns (track_id, detection) pairs that still need an embedding"""
+        live = [t for t in self.tracks if step - t["last_seen"] <= self.max_gap]
+        pairs = sorted(
+            ((_box_iou(t["box"], d["box"]), ti, di) for ti, t in enumerate(live) for di, d in enumerate(detections)),
+            reverse=True
+        )
+        assigned_tracks = set()
+        assigned_detections = {}
+        for iou, ti, di in pairs:
+            if iou < self.iou_threshold:
+                break
+            if ti in assigned_tracks or di in assigned_detections:
+                continue
+            assigned_tracks.add(ti)
+            assigned_detections[di] = live[ti]
+
+        to_embed = []
+        for di, det in enumerate(detections):
+            track = assigned_detections.get(di)
+            if track is None:
+                track = {"id": len(self.tracks), "box": det["box"], "last_seen": step, "embeds": 0}
+                self.tracks.append(track)
+            track["box"] = det["box"]
+            track["last_seen"] = step
+            if track["embeds"] < self.embeds_per_track:
+                track["embeds"] += 1
+                to_embed.append((track["id"], det))
+        return to_embed
+
+
+def run_video_attendance(path, gallery, threshold, detector_backend=VIDEO_DETECTOR_BACKEND,
+                         workers=PHOTO_DETECT_WORKERS, batch_size=EMBED_BATCH_SIZE):
+    """
+    Recognise the students seen in a short lecture clip.
+    Returns the matched students (best track per student) plus a throughput report;
+    writing attendance is left to the caller.
+    """
+    started = time.perf_counter()
+    tracker = FaceTracker()
+    stats = {}
+    chips = []
+    chip_tracks = []
+
+    for step, (frame_index, timestamp, frame_rgb) in enumerate(sample_frames(path, stats)):
+        faces, _, _ = detect_classroom_faces(frame_rgb, detector_backend, workers=workers,
+                                             min_confidence=VIDEO_MIN_CONFIDENCE)
+        for track_id, face in tracker.update(step, faces):
+            chips.append(_face_chip(frame_rgb, face['box']))
+            chip_tracks.append(track_id)
+    detect_seconds = time.perf_counter() - started
+
+    embed_started = time.perf_counter()
+    embeddings = embed_face_chips(chips, batch_size) if chips else []
+    embed_seconds = time.perf_counter() - embed_started
+
+    # A track is identified by its closest embedding; a student by its closest track
+    track_best = {}
+    for track_id, results in zip(chip_tracks, gallery.search_batch(embeddings, k=1, max_distance=threshold) if embeddings else []):
+        if results and (track_id not in track_best or results[0][1] < track_best[track_id][1]):
+            track_best[track_id] = results[0]
+    matches = {}
+    for student, dist in track_best.values():
+        if student['rollNo'] not in matches or dist < matches[student['rollNo']]['distance']:
+            matches[student['rollNo']] = {"rollNo": student['rollNo'], "name": student['name'], "distance": dist}
+
+    total_seconds = time.perf_counter() - started
+    report = {
+        "video_seconds": round(stats["frames_read"] / stats["fps"], 2),
+        "frames_read": stats["frames_read"],
+        "frames_decoded": stats["frames_decoded"],
+        "frames_sampled": stats["frames_sampled"],
+        "tracks": len(tracker.tracks),
+        "tracks_matched": len(track_best),
+        "embeddings": len(embeddings),
+        "students_matched": len(matches),
+        "detect_seconds": round(detect_seconds, 3),
+        "embed_seconds": round(embed_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "frames_per_second": round(stats["frames_read"] / total_seconds, 2) if total_seconds else None,
+        "sampled_frames_per_second": round(stats["frames_sampled"] / total_seconds, 2) if total_seconds else None,
+        "embeddings_per_minute": round(len(embeddings) / (embed_seconds / 60), 1) if embed_seconds else None
+    }
+    return sorted(matches.values(), key=lambda m: m['rollNo']), report
+
+
+def _load_lecture(lectures_col, args):
+    """Lecture selected on the command line, or the one currently active"""
+    if args.lecture_number is not None:
+        query = {"lectureNumber": args.lecture_number, "date": args.date}
+        if args.subject:
+            query["subject"] = args.subject
+    else:
+        query = {"isActive": True}
+    lecture = lectures_col.find_one(query)
+    if not lecture:
+        raise SystemExit(f"No lecture found for {query}")
+    lecture["_id"] = str(lecture["_id"])
+    return lecture
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline attendance from classroom media")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    photo_parser = subparsers.add_parser('photo', help="Mark attendance from high-resolution class photos")
+    photo_parser.add_argument('photos', nargs='+')
+    photo_parser.add_argument('--lecture-number', type=int, default=None)
+    photo_parser.add_argument('--date', default=None)
+    photo_parser.add_argument('--subject', default=None)
+    photo_parser.add_argument('--detector', default=PHOTO_DETECTOR_BACKEND)
+    photo_parser.add_argument('--workers', type=int, default=PHOTO_DETECT_WORKERS)
+
+    video_parser = subparsers.add_parser('video', help="Mark attendance from a short lecture recording")
+    video_parser.add_argument('video')
+    video_parser.add_argument('--lecture-number', type=int, default=None)
+    video_parser.add_argument('--date', default=None)
+    video_parser.add_argument('--subject', default=None)
+    video_parser.add_argument('--detector', default=VIDEO_DETECTOR_BACKEND)
+    video_parser.add_argument('--workers', type=int, default=PHOTO_DETECT_WORKERS)
+    args = parser.parse_args()
+
+    # Imported here so the helpers above stay usable without a database connection
+    import app as attendance_app
+
+    lecture = _load_lecture(attendance_app.lectures_col, args)
+    gallery = attendance_app.get_roster_gallery(attendance_app.lecture_roster(lecture))
+
+    if args.command == 'photo':
+        images = []
+        for path in args.photos:
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is None:
+                raise SystemExit(f"Could not read image {path}")
+            images.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        matches, report = run_photo_attendance(images, gallery, attendance_app.ATTENDANCE_MATCH_THRESHOLD,
+                                               detector_backend=args.detector, workers=args.workers)
+    else:
+        matches, report = run_video_attendance(args.video, gallery, attendance_app.ATTENDANCE_MATCH_THRESHOLD,
+                                               detector_backend=args.detector, workers=args.workers)
+    outcomes = attendance_app.bulk_mark_face_attendance(matches, lecture)
+    matched = {m['rollNo'] for m in matches}
+    not_found = [s for s in gallery.students if s['rollNo'] not in matched]
+
+    print(f"\n📸 {args.command.capitalize()} attendance for Lecture {lecture['lectureNumber']} ({lecture.get('subject')}) on {lecture['date']}")
+    for key, value in report.items():
+        print(f"  {key:20s} {value}")
+    print(f"\n✅ Recognised ({len(outcomes)}):")
+    for outcome in outcomes:
+        print(f"  {outcome['rollNo']:12s} {outcome['name']:30s} {outcome['action']}")
+    print(f"\n❌ Not found on roster ({len(not_found)}):")
+    for student in not_found:
+        print(f"  {student['rollNo']:12s} {student['name']}")
@@ -0,0 +1,232 @@
+"""
+Detector / model / preprocessing benchmark on a local labeled image set.
+
+The folder holds one sub-folder per person (the folder name is the label):
+
+    faces/
+        2310993858/ 1.jpg 2.jpg 3.jpg
+        2310993860/ a.png b.png
+
+The first --enroll images of every person form the gallery, the rest are
+probes. Every combination runs in its own process so that peak memory is that
+combination's alone, and reports per-image latency (preprocess + detect +
+embed), peak RSS, detection rate, and identification accuracy at the
+threshold the app uses for that model (top-1, accepted-and-correct, accepted
+wrong person).
+
+    python recognition_benchmark.py faces/ --detectors opencv mtcnn retinaface \\
+        --models Facenet Facenet512 --preprocess none clahe --accuracy-floor 0.95
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import cv2
+import numpy as np
+
+from face_gallery import FaceGallery
+from face_preprocessing import preprocess_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+DEFAULT_DETECTORS = ['opencv', 'mtcnn']
+DEFAULT_MODELS = ['Facenet']
+DEFAULT_PREPROCESS = ['none', 'clahe']
+
+
+def load_labeled_images(folder):
+    """[(label, path)] for every image in a one-folder-per-person tree, sorted for repeatable splits"""
+    items = []
+    for label in sorted(os.listdir(folder)):
+        person_dir = os.path.join(folder, label)
+        if not os.path.isdir(person_dir):
+            continue
+        for name in sorted(os.listdir(person_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((label, os.path.join(person_dir, name)))
+    return items
+
+
+PREPROCESSORS = {
+    'none': lambda img_rgb: img_rgb,
+    'clahe': preprocess_image,  # Exactly what the app applies
+}
+
+
+def _peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def run_combination(items, detector, model, preprocess):
+    """
+    Embed every image with one configuration (runs in a fresh process).
+    Returns per-image embeddings (None when no face was found) and latencies.
+    """
+    from deepface import DeepFace
+
+    prepare = PREPROCESSORS[preprocess]
+
+    def embed(path):
+        img = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+        faces = DeepFace.represent(prepare(img), model_name=model, detector_backend=detector,
+                                   enforce_detection=detector != 'skip')
+        # Largest detected face is the subject of a labeled portrait
+        face = max(faces, key=lambda f: f['facial_area']['w'] * f['facial_area']['h'])
+        return face['embedding']
+
+    # Model load and graph warm-up are not part of per-image latency
+    try:
+        embed(items[0][1])
+    except Exception:
+        pass
+
+    embeddings = []
+    latencies = []
+    for _, path in items:
+        start = time.perf_counter()
+        try:
+            embedding = embed(path)
+        except Exception:
+            embedding = None
+        latencies.append((time.perf_counter() - start) * 1000)
+        embeddings.append(embedding)
+    return {"embeddings": embeddings, "latencies_ms": latencies, "peak_rss_bytes": _peak_rss_bytes()}
+
+
+def identification_scores(items, embeddings, enroll, threshold, metric):
+    """Top-1 accuracy, accepted-and-correct rate and wrong-accept rate over the probes"""
+    seen = {}
+    enrolled = {}
+    probes = []
+    for (label, _), embedding in zip(items, embeddings):
+        seen[label] = seen.get(label, 0) + 1
+        if seen[label] > enroll:
+            probes.append((label, embedding))
+        elif embedding is not None:
+            enrolled.setdefault(label, []).append(embedding)
+
+    gallery = FaceGallery.from_students(
+        [{"rollNo": label, "name": label, "embeddings": embs} for label, embs in enrolled.items() if embs],
+        metric=metric
+    )
+    top1 = accepted = wrong = 0
+    for label, embedding in probes:
+        if embedding is None or not len(gallery):
+            continue
+        student, dist = gallery.best_match(embedding)
+        correct = student is not None and student["rollNo"] == label
+        top1 += correct
+        if threshold is not None and dist < threshold:
+            accepted += correct
+            wrong += not correct
+    count = len(probes)
+    return {
+        "probes": count,
+        "top1_accuracy": top1 / count if count else None,
+        "accuracy_at_threshold": accepted / count if count and threshold is not None else None,
+        "false_accept_rate": wrong / count if count and threshold is not None else None
+    }
+
+
+def default_threshold(model, metric, app_model='Facenet', app_threshold=None):
+    """The app's threshold for its own model, DeepFace's reference threshold for others"""
+    if model == app_model and app_threshold is not None:
+        return app_threshold
+    try:
+        from deepface.modules.verification import find_threshold
+        return find_threshold(model, 'euclidean' if metric == 'euclidean' else 'cosine')
+    except Exception:
+        return None
+
+
+def benchmark(folder, detectors, models, preprocess, enroll=2, metric='euclidean', thresholds=None):
+    """One result row per detector x model x preprocessing combination"""
+    items = load_labeled_images(folder)
+    if not items:
+        raise ValueError(f"No labeled images found under {folder}")
+    thresholds = thresholds or {}
+    rows = []
+    for model in models:
+        for detector in detectors:
+            for prep in preprocess:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                    result = pool.submit(run_combination, items, detector, model, prep).result()
+                latencies = np.asarray(result["latencies_ms"])
+                detected = sum(e is not None for e in result["embeddings"])
+                threshold = thresholds.get(model)
+                row = {
+                    "detector": detector,
+                    "model": model,
+                    "preprocess": prep,
+                    "images": len(items),
+                    "ms_mean": float(latencies.mean()),
+                    "ms_p95": float(np.percentile(latencies, 95)),
+                    "peak_mb": result["peak_rss_bytes"] / 2**20 if result["peak_rss_bytes"] else None,
+                    "detection_rate": detected / len(items),
+                    "threshold": threshold
+                }
+                row.update(identification_scores(items, result["embeddings"], enroll, threshold, metric))
+                rows.append(row)
+                print(f"   done {detector}/{model}/{prep}: {row['ms_mean']:.1f} ms/img")
+    return rows
+
+
+def _pct(value):
+    return f"{value * 100:6.1f}%" if value is not None else "     -"
+
+
+def print_table(rows, accuracy_floor):
+    """Comparison table, fastest first, marking the fastest row that meets the floor"""
+    rows = sorted(rows, key=lambda r: r["ms_mean"])
+    chosen = next((r for r in rows if (r["accuracy_at_threshold"] or 0) >= accuracy_floor), None)
+    header = (f"{'detector':12s} {'model':12s} {'prep':6s} {'ms/img':>8s} {'p95':>8s} {'peak MB':>8s} "
+              f"{'detect':>7s} {'top1':>7s} {'acc@thr':>7s} {'false':>7s}")
+    print(header)
+    print('-' * len(header))
+    for r in rows:
+        peak = f"{r['peak_mb']:8.0f}" if r["peak_mb"] else "       -"
+        mark = "  <- fastest meeting floor" if r is chosen else ""
+        print(f"{r['detector']:12s} {r['model']:12s} {r['preprocess']:6s} {r['ms_mean']:8.1f} {r['ms_p95']:8.1f} "
+              f"{peak} {_pct(r['detection_rate'])} {_pct(r['top1_accuracy'])} "
+              f"{_pct(r['accuracy_at_threshold'])} {_pct(r['false_accept_rate'])}{mark}")
+    if chosen is None:
+        print(f"\n⚠️  No configuration reaches {accuracy_floor:.0%} accuracy at threshold")
+    return chosen
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark detector/model/preprocessing combinations")
+    parser.add_argument('folder', help="One sub-folder of images per person")
+    parser.add_argument('--detectors', nargs='+', default=DEFAULT_DETECTORS)
+    parser.add_argument('--models', nargs='+', default=DEFAULT_MODELS)
+    parser.add_argument('--preprocess', nargs='+', default=DEFAULT_PREPROCESS, choices=sorted(PREPROCESSORS))
+    parser.add_argument('--enroll', type=int, default=2, help="Images per person used as the gallery")
+    parser.add_argument('--accuracy-floor', type=float, default=0.95)
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="Override the match threshold for every model")
+    parser.add_argument('--json', default=None, help="Also write the rows to this file")
+    args = parser.parse_args()
+
+    # Thresholds and metric the running app is configured with (no server is started)
+    import app as attendance_app
+
+    metric = attendance_app.FACE_MATCH_METRIC
+    thresholds = {model: args.threshold if args.threshold is not None else
+                  default_threshold(model, metric, app_threshold=attendance_app.ATTENDANCE_MATCH_THRESHOLD)
+                  for model in args.models}
+    print(f"📊 Benchmarking {len(args.detectors) * len(args.models) * len(args.preprocess)} combinations "
+          f"on {args.folder} (metric={metric})")
+    results = benchmark(args.folder, args.detectors, args.models, args.preprocess,
+                        enroll=args.enroll, metric=metric, thresholds=thresholds)
+    print()
+    print_table(results, args.accuracy_floor)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
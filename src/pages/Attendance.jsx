@@ -3,11 +3,14 @@ import Webcam from 'react-webcam';
 import { Link } from 'react-router-dom';
 import { API_BASE_URL } from '../config.js';
 
+// Used until the server sends its own next_capture_ms hint
+const DEFAULT_CAPTURE_DELAY_MS = 3000;
+
 const Attendance = () => {
   const webcamRef = useRef(null);
   const [status, setStatus] = useState('Looking for faces...');
   const [loading, setLoading] = useState(false);
-  const [lastProcessed, setLastProcessed] = useState(0);
+  const [nextCaptureDelay, setNextCaptureDelay] = useState(DEFAULT_CAPTURE_DELAY_MS);
   const [currentLecture, setCurrentLecture] = useState(null);
   const [recentAttendance, setRecentAttendance] = useState([]);
   const [scanActive, setScanActive] = useState(true);
@@ -55,31 +58,27 @@ const Attendance = () => {
     }
   };
 
-  // Auto-capture and process face every 3 seconds
+  // Auto-capture the next face after the delay the server recommended
+  // (backs off when idle or busy, speeds up while students are being marked)
   useEffect(() => {
-    let interval;
+    let timer;
     
-    if (scanActive) {
-      interval = setInterval(() => {
-        if (!loading && webcamRef.current && currentLecture) {
-          const now = Date.now();
-          // Prevent too frequent processing (minimum 3 seconds between attempts)
-          if (now - lastProcessed > 3000) {
-            autoCapture();
-          }
+    if (scanActive && !loading && currentLecture) {
+      timer = setTimeout(() => {
+        if (webcamRef.current) {
+          autoCapture();
         }
-      }, 3000);
+      }, nextCaptureDelay);
     }
     
-    return () => clearInterval(interval);
-  }, [loading, lastProcessed, currentLecture, scanActive]);
+    return () => clearTimeout(timer);
+  }, [loading, currentLecture, scanActive, nextCaptureDelay]);
 
   const autoCapture = async () => {
     if (!webcamRef.current || loading || !currentLecture) return;
     
     setLoading(true);
     setStatus('Processing face...');
-    setLastProcessed(Date.now());
     
     try {
       const imageSrc = webcamRef.current.getScreenshot();
@@ -96,6 +95,7 @@ const Attendance = () => {
       });
       
       const data = await res.json();
+      setNextCaptureDelay(data.next_capture_ms || DEFAULT_CAPTURE_DELAY_MS);
       if (res.ok) {
         // Success - attendance marked
         setStatus(`✅ ${data.message}`);
@@ -134,6 +134,7 @@ const Attendance = () => {
       }
     } catch (err) {
       setStatus('Error connecting to server. Retrying...');
+      setNextCaptureDelay(DEFAULT_CAPTURE_DELAY_MS);
     }
     setLoading(false);
   };
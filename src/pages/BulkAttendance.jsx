@@ -64,11 +64,11 @@ const BulkAttendance = () => {
         
         if (e.dataTransfer.files && e.dataTransfer.files[0]) {
             const file = e.dataTransfer.files[0];
-            if (file.type.includes('sheet') || file.name.endsWith('.xlsx') || file.name.endsWith('.xls')) {
+            if (file.type.includes('sheet') || file.name.endsWith('.xlsx') || file.name.endsWith('.xls') || file.name.endsWith('.csv')) {
                 setSelectedFile(file);
                 setUploadResult(null);
             } else {
-                alert('Please select an Excel file (.xlsx or .xls)');
+                alert('Please select an Excel or CSV file (.xlsx, .xls or .csv)');
             }
         }
     };
@@ -198,7 +198,7 @@ const BulkAttendance = () => {
                     <input
                         type="file"
                         id="fileInput"
-                        accept=".xlsx,.xls"
+                        accept=".xlsx,.xls,.csv"
                         onChange={handleFileSelect}
                         style={{ display: 'none' }}
                     />
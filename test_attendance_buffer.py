@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Check the attendance write-behind buffer: journaled marks survive a crash and
+are replayed on the next start, a failed flush keeps its marks (and journals)
+for the retry, and journals of running workers are left alone.
+"""
+import json
+import os
+import tempfile
+
+from attendance_buffer import AttendanceWriteBuffer, pid_alive
+
+
+def dead_pid():
+    """A pid with no running process"""
+    pid = 4_000_000
+    while pid_alive(pid):
+        pid -= 1
+    return pid
+
+
+def write_journal(journal_dir, name, entries, torn=False):
+    with open(os.path.join(journal_dir, name), 'w', encoding='utf-8') as f:
+        for key, mark in entries:
+            f.write(json.dumps({"key": list(key), "mark": mark}) + "\n")
+        if torn:
+            f.write('{"key": ["R9"')  # Crash in the middle of a write
+
+
+def journals(journal_dir):
+    return sorted(os.listdir(journal_dir))
+
+
+def test_journal_replay():
+    print("🧪 Testing journal replay after a crash\n")
+    flushed = []
+    with tempfile.TemporaryDirectory() as journal_dir:
+        dead = dead_pid()
+        live = os.getppid()
+        write_journal(journal_dir, f"attendance-{dead}.jsonl",
+                      [(("R1",), {"rollNo": "R1", "time": "09:00"}),
+                       (("R1",), {"rollNo": "R1", "time": "09:01"}),
+                       (("R2",), {"rollNo": "R2", "time": "09:02"})], torn=True)
+        write_journal(journal_dir, f"attendance-{dead}.123.flushing.jsonl",
+                      [(("R3",), {"rollNo": "R3", "time": "09:03"})])
+        # A running worker's journal and rotated segment: it still holds those marks in memory
+        write_journal(journal_dir, f"attendance-{live}.jsonl", [(("R4",), {"rollNo": "R4"})])
+        write_journal(journal_dir, f"attendance-{live}.456.flushing.jsonl", [(("R5",), {"rollNo": "R5"})])
+
+        buffer = AttendanceWriteBuffer(flushed.extend, journal_dir, max_delay_seconds=60)
+        try:
+            print(f"   Recovered {buffer.recovered} marks, pending {buffer.stats()['pending']}")
+            assert buffer.recovered == 4 and buffer.get(("R1",))["time"] == "09:01"
+            assert buffer.flush() == 3
+            print(f"   Flushed: {[m['rollNo'] for m in flushed]}")
+            assert sorted(m["rollNo"] for m in flushed) == ["R1", "R2", "R3"]
+            remaining = journals(journal_dir)
+            print(f"   Left in place: {remaining}")
+            assert remaining == [f"attendance-{live}.456.flushing.jsonl", f"attendance-{live}.jsonl"]
+        finally:
+            buffer.close()
+    print("\n✅ Crashed worker's marks replayed, running worker's journals untouched")
+
+
+def test_failed_flush_requeues():
+    print("🧪 Testing failed flush requeue\n")
+    batches = []
+    fail = [True]
+
+    def flush_fn(marks):
+        if fail[0]:
+            raise ConnectionError("database down")
+        batches.append(marks)
+
+    with tempfile.TemporaryDirectory() as journal_dir:
+        buffer = AttendanceWriteBuffer(flush_fn, journal_dir, max_delay_seconds=60)
+        try:
+            buffer.add(("R1",), {"rollNo": "R1", "time": "09:00"})
+            buffer.add(("R2",), {"rollNo": "R2", "time": "09:00"})
+            try:
+                buffer.flush()
+                assert False, "flush should have raised"
+            except ConnectionError:
+                pass
+            stats = buffer.stats()
+            print(f"   After failure: pending={stats['pending']}, failures={stats['failures']}, journals={len(journals(journal_dir))}")
+            assert stats["pending"] == 2 and stats["failures"] == 1 and len(journals(journal_dir)) == 1
+
+            # A newer mark queued before the retry wins over the requeued one
+            buffer.add(("R1",), {"rollNo": "R1", "time": "09:05"})
+            # Rotated journals claimed away meanwhile must not turn a successful write into an error
+            for name in journals(journal_dir):
+                if name.endswith('.flushing.jsonl'):
+                    os.remove(os.path.join(journal_dir, name))
+            fail[0] = False
+            assert buffer.flush() == 2
+            print(f"   Retry wrote: {batches[0]}")
+            assert {m["rollNo"]: m["time"] for m in batches[0]} == {"R1": "09:05", "R2": "09:00"}
+            assert buffer.stats()["pending"] == 0 and not journals(journal_dir)
+        finally:
+            buffer.close()
+    print("\n✅ Failed flush kept its marks and the retry wrote the newest ones")
+
+
+if __name__ == "__main__":
+    test_journal_replay()
+    test_failed_flush_requeues()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Check that the declared indexes are created idempotently, that every hot query
+is answered from an index (explain() shows IXSCAN, never COLLSCAN), and that
+the unique attendance slot index rejects a second record.
+
+Runs against a throwaway database on TEST_MONGO_URI (default: local mongod).
+"""
+import os
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+
+from db_indexes import INDEXES, dedupe_attendance, ensure_indexes, explain_hot_queries
+
+TEST_MONGO_URI = os.environ.get('TEST_MONGO_URI', 'mongodb://localhost:27017')
+TEST_DB = 'attendance_system_index_test'
+
+
+def connect():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except ServerSelectionTimeoutError:
+        pytest.skip(f"No MongoDB at {TEST_MONGO_URI}")
+    client.drop_database(TEST_DB)
+    return client
+
+
+def test_indexes_cover_hot_queries():
+    client = connect()
+    db = client[TEST_DB]
+    try:
+        print("🧪 Testing index bootstrap\n")
+        # A duplicate slot left over from before the unique index existed
+        slot = {"rollNo": "R1", "lectureNumber": 1, "date": "2025-01-01", "subject": "S"}
+        db.attendance.insert_many([
+            dict(slot, status="Present", method="face_recognition"),
+            dict(slot, status="Absent", method="manual"),
+            dict(slot, rollNo="R2", status="Present", method="face_recognition"),
+            # No subject and an explicit null share one slot in the unique index
+            {"rollNo": "R3", "lectureNumber": 1, "date": "2025-01-01", "status": "Absent", "method": "manual"},
+            dict(slot, rollNo="R3", subject=None, status="Present", method="face_recognition"),
+        ])
+        report = ensure_indexes(db)
+        print(f"   With duplicates: failed={sorted(report['failed'])}")
+        assert list(report["failed"]) == ["attendance_slot_unique"]
+
+        removed = dedupe_attendance(db)
+        kept = db.attendance.find_one({"rollNo": "R1"})
+        print(f"   Dedupe removed {removed}, kept method={kept['method']}")
+        assert removed == 2 and kept["method"] == "manual"
+        assert [r["method"] for r in db.attendance.find({"rollNo": "R3"})] == ["manual"]
+
+        report = ensure_indexes(db)
+        assert report["created"] == ["attendance_slot_unique"] and not report["failed"]
+        again = ensure_indexes(db)
+        declared = sum(len(indexes) for indexes in INDEXES.values())
+        print(f"   Second run: created={again['created']}, existing={len(again['existing'])}/{declared}")
+        assert not again["created"] and len(again["existing"]) == declared
+
+        try:
+            db.attendance.insert_one(dict(slot, status="Present", method="face_recognition"))
+            assert False, "duplicate attendance slot was accepted"
+        except DuplicateKeyError:
+            print("   Duplicate slot rejected")
+
+        for name, stages in explain_hot_queries(db).items():
+            print(f"   {name:24s} {' <- '.join(stages)}")
+            assert "COLLSCAN" not in stages and "IXSCAN" in stages, name
+        print("\n✅ Every hot query uses an index")
+    finally:
+        client.drop_database(TEST_DB)
+
+
+if __name__ == "__main__":
+    test_indexes_cover_hot_queries()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Check FaceGallery search against brute force: exact GEMM, centroid-pruned and
+int8 + rerank search must return the same students at the same distances as
+scoring every (student, embedding) pair one by one. In-place template updates
+(tombstones, doubling buffers, memmap regrowth, int8 range growth) must leave
+the gallery answering like a fresh rebuild, and must be safe to run while
+other threads search.
+"""
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from face_gallery import FaceGallery, _synthetic_students
+
+NUM_STUDENTS = 300
+PER_STUDENT = 4
+NOISE = 0.35
+
+
+def make_data(seed=0, num_queries=40):
+    rng = np.random.default_rng(seed)
+    students = list(_synthetic_students(NUM_STUDENTS, PER_STUDENT, NOISE, rng))
+    queries = [students[i]["embeddings"].mean(axis=0) + rng.normal(0.0, NOISE, 128).astype(np.float32)
+               for i in rng.integers(0, NUM_STUDENTS, size=num_queries)]
+    return students, np.asarray(queries, dtype=np.float32)
+
+
+def brute_force(students, query, k):
+    """[(rollNo, distance)] of the k closest students, one norm per embedding"""
+    scored = sorted(
+        (min(float(np.linalg.norm(np.asarray(e, dtype=np.float64) - query)) for e in s["embeddings"]), s["rollNo"])
+        for s in students if len(s["embeddings"])
+    )
+    return [(roll_no, dist) for dist, roll_no in scored[:k]]
+
+
+def same_results(got, expected):
+    return [s["rollNo"] for s, _ in got] == [r for r, _ in expected] and \
+        np.allclose([d for _, d in got], [d for _, d in expected], rtol=1e-4, atol=1e-4)
+
+
+def test_modes_agree_with_brute_force():
+    print("🧪 Testing search modes against brute force\n")
+    students, queries = make_data()
+    expected = {k: [brute_force(students, q, k) for q in queries] for k in (1, 3)}
+    modes = {
+        "gemm": ({}, 3),
+        "pruned": ({"prune": True}, 3),
+        # The int8 pass only nominates candidates; the rerank is exact but top-3 may differ at the margin
+        "quantized": ({"quantize": True}, 1),
+    }
+    for mode, (options, k) in modes.items():
+        gallery = FaceGallery.from_students(students, **options)
+        single = [gallery.search(q, k=k) for q in queries]
+        single_path = gallery.last_search_stats["path"]
+        batch = gallery.search_batch(queries, k=k)
+        batch_path = gallery.last_search_stats["path"]
+        mismatches = sum(not same_results(got, exp) for got, exp in zip(single, expected[k])) + \
+            sum(not same_results(got, exp) for got, exp in zip(batch, expected[k]))
+        print(f"   {mode:10s} paths single={single_path} batch={batch_path}  top-{k} mismatches: {mismatches}/{2 * len(queries)}")
+        assert mismatches == 0, mode
+        assert gallery.search_paths() == {"single": single_path, "batch": batch_path}
+
+    # A threshold leaves out everyone at or beyond it, in every mode
+    for options in ({}, {"prune": True}, {"quantize": True}):
+        gallery = FaceGallery.from_students(students, **options)
+        for got, exp in zip(gallery.search_batch(queries, k=3, max_distance=5.0), expected[3]):
+            assert [s["rollNo"] for s, _ in got] == [r for r, d in exp if d < 5.0]
+    print("\n✅ Every search mode matches brute force")
+
+
+def test_default_batch_uses_gemm():
+    print("🧪 Testing the app's default options on a batch\n")
+    students, queries = make_data(seed=1, num_queries=8)
+    # app.py defaults: FACE_GALLERY_PRUNE=true, FACE_GALLERY_QUANTIZE=false, euclidean
+    gallery = FaceGallery.from_students(students, quantize=False, prune=True, metric='euclidean')
+    results = gallery.search_batch(queries, k=1)
+    stats = gallery.last_search_stats
+    print(f"   {len(queries)} queries (enrollment check / photo batch): {stats}")
+    assert stats["path"] == "gemm" and stats["queries"] == len(queries) and stats["rows_checked"] == len(gallery)
+    assert all(same_results(got, brute_force(students, q, 1)) for got, q in zip(results, queries))
+    gallery.search(queries[0])
+    assert gallery.last_search_stats["path"] == "pruned"
+    print("\n✅ Batches take one GEMM per chunk, single frames the pruned walk")
+
+
+def apply_updates(gallery, students, rng):
+    """A series of template changes covering every update case; returns {rollNo: student} as it should now be"""
+    current = {s["rollNo"]: dict(s) for s in students[:250]}
+    changes = []
+    for i in range(0, 60, 3):
+        # Fewer templates (tombstones), more templates (appends past the buffer), same count (overwrite)
+        count = [1, 2 * PER_STUDENT, PER_STUDENT][i % 3]
+        base = students[i]["embeddings"].mean(axis=0)
+        changes.append((students[i], base + rng.normal(0.0, NOISE, (count, 128)).astype(np.float32)))
+    for student in students[250:]:
+        changes.append((student, student["embeddings"]))  # New students
+    for student in students[100:110]:
+        changes.append((student, np.zeros((0, 128), dtype=np.float32)))  # Removed from search
+    changes.append((dict(students[5], name="Renamed"), students[5]["embeddings"]))
+    for student, embeddings in changes:
+        gallery.set_student_embeddings(student, embeddings)
+        current[student["rollNo"]] = dict(student, embeddings=embeddings)
+    return current
+
+
+def test_updates_match_rebuild():
+    print("🧪 Testing in-place template updates against a rebuild\n")
+    students, queries = make_data(seed=2)
+    with tempfile.TemporaryDirectory() as directory:
+        modes = {
+            "gemm": {},
+            "pruned": {"prune": True},
+            "quantized": {"quantize": True},
+            "memmap": {"mmap_path": os.path.join(directory, "gallery.npy")},
+        }
+        for mode, options in modes.items():
+            gallery = FaceGallery.from_students(students[:250], **options)
+            capacity = len(gallery._vector_buffer)
+            current = apply_updates(gallery, students, np.random.default_rng(3))
+            rebuilt = FaceGallery.from_students(list(current.values()), **dict(options, mmap_path=None))
+            k = 1 if mode == "quantized" else 3
+            mismatches = sum(not same_results(got, [(s["rollNo"], d) for s, d in exp])
+                             for got, exp in zip(gallery.search_batch(queries, k=k), rebuilt.search_batch(queries, k=k)))
+            mismatches += sum(not same_results(gallery.search(q, k=k), [(s["rollNo"], d) for s, d in rebuilt.search(q, k=k)])
+                              for q in queries)
+            stats = gallery.memory_usage()
+            print(f"   {mode:10s} rows {capacity} -> {len(gallery._vector_buffer)}, tombstoned {stats['tombstoned_rows']}, "
+                  f"top-{k} mismatches vs rebuild: {mismatches}/{2 * len(queries)}")
+            assert mismatches == 0, mode
+            assert stats["students"] == len(current) and stats["embeddings"] == len(rebuilt)
+            assert gallery.search(students[5]["embeddings"][0])[0][0]["name"] == "Renamed"
+            assert all(s["rollNo"] not in {r["rollNo"] for r in students[100:110]}
+                       for hits in gallery.search_batch(queries, k=5) for s, _ in hits)
+            if mode == "memmap":
+                assert isinstance(gallery.vectors, np.memmap) and len(gallery._vector_buffer) > capacity
+    print("\n✅ Updated galleries answer like a rebuild")
+
+
+def test_quantized_range_growth():
+    print("🧪 Testing int8 range growth\n")
+    students, _ = make_data(seed=4, num_queries=1)
+    gallery = FaceGallery.from_students(students, quantize=True)
+    scales = gallery.scales.copy()
+    # Three times the largest value seen so far: would clip if the scale were kept
+    outlier = np.abs(np.asarray([e for s in students for e in s["embeddings"]])).max(axis=0) * 3.0
+    gallery.set_student_embeddings(students[7], [outlier.astype(np.float32)])
+    grown = float((gallery.scales / scales).max())
+    dequantized = gallery.codes[gallery.student_rows[gallery.owner_by_roll[students[7]["rollNo"]]]].astype(np.float32) * gallery.scales
+    print(f"   Scale grew x{grown:.2f}; outlier round-trip error {float(np.abs(dequantized - outlier).max()):.4f}")
+    assert grown > 2.5 and np.abs(dequantized - outlier).max() <= gallery.scales.max()
+    student, dist = gallery.best_match(outlier)
+    assert student["rollNo"] == students[7]["rollNo"] and dist < 1e-3
+    print("\n✅ Templates outside the int8 range requantize instead of clipping")
+
+
+def test_search_during_updates():
+    print("🧪 Testing searches running alongside template updates\n")
+    students, queries = make_data(seed=5, num_queries=4)
+    for options in ({}, {"prune": True}, {"quantize": True}):
+        gallery = FaceGallery.from_students(students, **options)
+        errors = []
+        stop = threading.Event()
+
+        def search():
+            target = students[0]["rollNo"]
+            query = students[0]["embeddings"].mean(axis=0)
+            while not stop.is_set():
+                try:
+                    assert gallery.search_batch([query] * 4, k=3)[0][0][0]["rollNo"] == target
+                    gallery.search(queries[0])
+                except Exception as e:
+                    errors.append(repr(e))
+                    return
+
+        threads = [threading.Thread(target=search) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for i in range(300):
+            student = students[10 + i % 100]
+            embeddings = student["embeddings"][:1 + i % 3] if i % 5 else np.concatenate([student["embeddings"]] * 3)
+            gallery.set_student_embeddings(student, embeddings)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        print(f"   {gallery.search_paths()}: {len(errors)} search errors, {len(gallery)} rows")
+        assert not errors, errors[:3]
+    print("\n✅ Concurrent searches never saw a half-applied update")
+
+
+def test_prune_and_quantize_are_exclusive():
+    print("🧪 Testing prune + quantize rejection\n")
+    try:
+        FaceGallery(quantize=True, prune=True)
+        assert False, "prune combined with quantize was accepted"
+    except ValueError as e:
+        print(f"   Rejected: {e}")
+    print("\n✅ prune and quantize cannot be combined")
+
+
+if __name__ == "__main__":
+    test_modes_agree_with_brute_force()
+    test_default_batch_uses_gemm()
+    test_updates_match_rebuild()
+    test_quantized_range_growth()
+    test_search_during_updates()
+    test_prune_and_quantize_are_exclusive()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Check that scatter-gather search over localhost shard nodes returns the same
+top-k as one gallery holding every student, and that a node answers only its
+allow-listed methods
+"""
+import threading
+import xmlrpc.client
+
+import numpy as np
+
+from face_gallery import FaceGallery, _synthetic_students
+from gallery_shards import SHARD_NODE_BIND, ShardNode, ShardedGallery, make_server, shard_key
+
+DEPARTMENTS = ["CSE", "ECE", "Mechanical", None]
+
+
+def start_node(keys, students, topology):
+    """Serve the given shard keys on a free localhost port, return its URL"""
+    node = ShardNode(keys, lambda key: [s for s in students if shard_key(s, topology) == key])
+    server = make_server(node, SHARD_NODE_BIND, 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_scatter_gather_matches_single_gallery():
+    print("🧪 Testing sharded gallery scatter-gather\n")
+    rng = np.random.default_rng(0)
+    students = list(_synthetic_students(400, 3, 0.35, rng))
+    for i, student in enumerate(students):
+        student["department"] = DEPARTMENTS[i % len(DEPARTMENTS)]
+
+    # Two nodes: CSE alone, everything else ('*' catches ECE, Mechanical and no department)
+    topology = {"CSE": None, "*": None}
+    topology["CSE"] = start_node(["CSE"], students, topology)
+    topology["*"] = start_node(["*"], students, topology)
+    sharded = ShardedGallery(topology)
+    single = FaceGallery.from_students(students)
+
+    queries = [students[i]["embeddings"].mean(axis=0) + rng.normal(0.0, 0.35, 128).astype(np.float32)
+               for i in rng.integers(0, len(students), size=50)]
+    mismatches = 0
+    for got, expected in zip(sharded.search_batch(queries, k=5), single.search_batch(queries, k=5)):
+        if [s["rollNo"] for s, _ in got] != [s["rollNo"] for s, _ in expected] or \
+                not np.allclose([d for _, d in got], [d for _, d in expected], rtol=1e-5):
+            mismatches += 1
+    print(f"   Top-5 mismatches vs single gallery: {mismatches}/{len(queries)}")
+    assert mismatches == 0
+
+    # Roster listing (photo attendance "not found") covers every shard
+    roll_nos = sorted(s["rollNo"] for s in sharded.students)
+    print(f"   Students listed across shards: {len(roll_nos)}")
+    assert roll_nos == sorted(s["rollNo"] for s in single.students)
+
+    # Template update is routed to the owning shard only
+    target = students[1]  # ECE -> '*' node
+    sharded.set_student_embeddings(target, [queries[0]])
+    student, dist = sharded.best_match(queries[0])
+    print(f"   After template update: best match {student['rollNo']} at {dist:.4f}")
+    assert student["rollNo"] == target["rollNo"] and dist < 1e-3
+
+    stats = sharded.memory_usage()
+    print(f"   Shards: {sorted(stats['shards'])}, students: {stats['students']}")
+    assert stats["students"] == len(students)
+    print("\n✅ Sharded gallery matches single gallery")
+
+
+def test_node_exposes_only_allowed_methods():
+    print("🧪 Testing shard node method allow-list\n")
+    topology = {"*": None}
+    topology["*"] = start_node(["*"], [], topology)
+    proxy = xmlrpc.client.ServerProxy(topology["*"], allow_none=True)
+    print(f"   stats: {proxy.stats()}")
+    for name in ("loader", "_gallery", "system.listMethods"):
+        try:
+            getattr(proxy, name)()
+            assert False, f"{name} was callable"
+        except xmlrpc.client.Fault as e:
+            print(f"   {name}: {e.faultString}")
+    print("\n✅ Only the shard API is reachable")
+
+
+if __name__ == "__main__":
+    test_scatter_gather_matches_single_gallery()
+    test_node_exposes_only_allowed_methods()
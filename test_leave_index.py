@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Check the approved leave interval index: overlapping and adjacent leaves
+merge, covers() is inclusive at both ends, and an approval made while a
+reload's query is running survives the reload.
+"""
+from leave_index import ApprovedLeaveIndex, merge_intervals
+
+
+def leave(leave_id, roll_no, start, end):
+    return {"_id": leave_id, "student_rollNo": roll_no, "start_date": start, "end_date": end}
+
+
+def test_merge_intervals():
+    print("🧪 Testing interval merge\n")
+    merged = merge_intervals([
+        ("2025-01-07", "2025-01-10"),
+        ("2025-01-05", "2025-01-07"),  # Shares 01-07 with the one above
+        ("2025-02-01", "2025-02-01"),
+        ("2025-01-06", "2025-01-06"),  # Inside 01-05..01-07
+        ("2025-01-11", "2025-01-12"),  # Starts the day after: a gap of no dates, kept apart
+    ])
+    print(f"   Merged: {merged}")
+    assert merged == [("2025-01-05", "2025-01-10"), ("2025-01-11", "2025-01-12"), ("2025-02-01", "2025-02-01")]
+    assert merge_intervals([]) == []
+    print("\n✅ Intervals merged")
+
+
+def test_covers_boundaries():
+    print("🧪 Testing covers() boundaries\n")
+    index = ApprovedLeaveIndex(lambda: [
+        leave(1, "R1", "2025-01-05", "2025-01-07"),
+        leave(2, "R1", "2025-01-07", "2025-01-10"),
+        leave(3, "R1", "2025-02-01", "2025-02-01"),
+    ])
+    expected = {
+        "2025-01-04": False, "2025-01-05": True, "2025-01-07": True, "2025-01-10": True,
+        "2025-01-11": False, "2025-01-31": False, "2025-02-01": True, "2025-02-02": False,
+    }
+    for date, covered in expected.items():
+        assert index.covers("R1", date) == covered, date
+    assert not index.covers("R2", "2025-01-05")
+    print(f"   Stats: {index.stats()}")
+
+    # Rejecting one of two overlapping leaves leaves the other's dates covered
+    index.remove(2, "R1")
+    assert index.covers("R1", "2025-01-07") and not index.covers("R1", "2025-01-08")
+    index.remove(3, "R1")
+    index.remove(1, "R1")
+    index.remove(99, "R1")  # Unknown leave: no-op
+    assert not index.covers("R1", "2025-01-05") and index.stats()["students"] == 0
+    print("\n✅ covers() is inclusive at both ends")
+
+
+def test_add_during_reload_survives():
+    print("🧪 Testing an approval made during a reload\n")
+    index = None
+    calls = [0]
+
+    def loader():
+        calls[0] += 1
+        if calls[0] == 2:
+            # The query has already read the leaves when this worker approves a new one
+            index.add("new", "R2", "2025-03-01", "2025-03-03")
+            index.remove(1, "R1")
+        return [leave(1, "R1", "2025-01-05", "2025-01-07")]
+
+    index = ApprovedLeaveIndex(loader)
+    assert index.covers("R1", "2025-01-05")
+    index.reload()
+    print(f"   After reload: R2 covered={index.covers('R2', '2025-03-02')}, R1 covered={index.covers('R1', '2025-01-05')}")
+    assert index.covers("R2", "2025-03-02") and not index.covers("R1", "2025-01-05")
+
+    # Outside a reload, changes are not kept around for replay
+    index.add("later", "R3", "2025-04-01", "2025-04-01")
+    assert index._changes is None
+    print("\n✅ Local approvals survive a concurrent reload")
+
+
+if __name__ == "__main__":
+    test_merge_intervals()
+    test_covers_boundaries()
+    test_add_during_reload_survives()